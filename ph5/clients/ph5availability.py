@@ -11,11 +11,14 @@ import sys
 import logging
 import argparse
 import datetime as dt
+import itertools
 import time
 from uuid import uuid4
 from argparse import RawTextHelpFormatter
 
-from ph5.core import ph5api, ph5utils, timedoy, experiment
+import numpy as np
+
+from ph5.core import ph5api, ph5utils, timedoy, experiment, availability
 
 PROG_VERSION = '2020.282'
 LOGGER = logging.getLogger(__name__)
@@ -53,6 +56,10 @@ class PH5Availability(object):
         self.sta_len = 1
         self.tim_len = 27
         self.avail = 2
+        # Answer availability and extents from Availability_t if there
+        # is one
+        self.use_availability_t = True
+        self.availability_t = None
         return
 
     def analyze_args(self, args):
@@ -85,6 +92,7 @@ class PH5Availability(object):
                             dt.datetime.fromtimestamp(0)).total_seconds()
 
         self.array = args.array_t_
+        self.use_availability_t = not args.scan_das_t
         if args.avail not in [0, 1, 2, 3, 4]:
             raise PH5AvailabilityError(
                 "There is no avail option '%s'. Please run "
@@ -179,6 +187,61 @@ class PH5Availability(object):
 
         return arrayorder, arraybyid
 
+    def read_availability_t(self):
+        """
+        Read Availability_t, made by index_availability_t.
+        :rtype: list(dict)
+        :returns: The rows of Availability_t or None if there is none,
+            it isn't used or Array_t changed after it was built
+        """
+        if not self.use_availability_t:
+            return None
+        if self.availability_t is None:
+            if not availability.is_current(self.ph5):
+                if self.ph5.ph5_g_sorts.ph5_t_availability is not None:
+                    LOGGER.warning(
+                        "Availability_t is out of date with Array_t, "
+                        "reading Das_t instead. Run index_availability_t "
+                        "to build it again.")
+                self.use_availability_t = False
+                return None
+            self.availability_t, keys = \
+                self.ph5.ph5_g_sorts.read_availability()
+
+        return self.availability_t or None
+
+    def match_availability_t(self, rows, station, location, channel):
+        """
+        Availability_t rows of the given array, station, location and
+        channel, in the same order as rows.
+        :type rows: list(dict)
+        :param rows: The rows of Availability_t
+        :rtype: list(dict)
+        :returns: The rows that match
+        """
+        ret = []
+        for r in rows:
+            if self.array is not None:
+                a_n = int(r['array_name_s'].split('_')[2])
+                if self.array != a_n:
+                    continue
+            ph5_seed_station = r['seed_station_name_s']
+            if len(ph5_seed_station) > self.sta_len:
+                # get the max len of station for space in report
+                self.sta_len = len(ph5_seed_station)
+            if not ph5utils.does_pattern_exists(
+               [station], ph5_seed_station):
+                continue
+            if not ph5utils.does_pattern_exists(
+               [channel], r['seed_channel_code_s']):
+                continue
+            if not ph5utils.does_pattern_exists(
+               [location], r['seed_location_code_s']):
+                continue
+            ret.append(r)
+
+        return ret
+
     def get_time_das_t(self, das, start, end,
                        component=None, sample_rate=None):
         """
@@ -362,6 +425,12 @@ class PH5Availability(object):
             if not (starttime and endtime):
                 raise ValueError("if start or end, both are required")
 
+        rows = self.read_availability_t()
+        if rows is not None:
+            return self.get_availability_extent_t(
+                rows, station, location, channel, starttime, endtime,
+                include_sample_rate)
+
         array_names = sorted(self.ph5.Array_t_names)
 
         for array_name in array_names:
@@ -507,6 +576,13 @@ class PH5Availability(object):
         sr_mismatch = False
         empty_times = True
         self.SR_included = include_sample_rate
+
+        rows = self.read_availability_t()
+        if rows is not None:
+            return self.get_availability_t(
+                rows, station, location, channel, starttime, endtime,
+                include_sample_rate)
+
         array_names = sorted(self.ph5.Array_t_names)
 
         for array_name in array_names:
@@ -619,6 +695,66 @@ class PH5Availability(object):
 
         return availability
 
+    def get_availability_extent_t(self, rows, station, location, channel,
+                                  starttime, endtime, include_sample_rate):
+        """
+        get_availability_extent answered from Availability_t
+        :type rows: list(dict)
+        :param rows: The rows of Availability_t
+        """
+        availability_extents = []
+        rows = self.match_availability_t(rows, station, location, channel)
+        for key, spans in itertools.groupby(
+                rows, lambda r: [r[k] for k in availability.SORT_KEYS[:-1]]):
+            early = None
+            end = None
+            for r in spans:
+                if starttime is not None and \
+                        (r['start_epoch_d'] > endtime or
+                         r['end_epoch_d'] <= starttime):
+                    continue
+                if early is None:
+                    early = r['start_epoch_d']
+                end = r['end_epoch_d']
+            if early is None:
+                continue
+            if starttime is not None and early < starttime:
+                early = starttime
+            if endtime is not None and endtime < end:
+                end = endtime
+            tup = (r['seed_station_name_s'], r['seed_location_code_s'],
+                   r['seed_channel_code_s'], early, end)
+            if include_sample_rate:
+                tup += (float(r['sample_rate_i']),)
+            availability_extents.append(tup)
+
+        return availability_extents
+
+    def get_availability_t(self, rows, station, location, channel,
+                           starttime, endtime, include_sample_rate):
+        """
+        get_availability answered from Availability_t
+        :type rows: list(dict)
+        :param rows: The rows of Availability_t
+        """
+        availability = []
+        for r in self.match_availability_t(rows, station, location, channel):
+            if starttime is not None and endtime is not None and \
+                    (r['start_epoch_d'] > endtime or
+                     r['end_epoch_d'] < starttime):
+                continue
+            start = r['start_epoch_d'] if starttime is None \
+                or r['start_epoch_d'] > starttime else starttime
+            end = r['end_epoch_d'] if endtime is None \
+                or r['end_epoch_d'] < endtime else endtime
+            tup = (r['seed_station_name_s'], r['seed_location_code_s'],
+                   r['seed_channel_code_s'], start, end)
+            if include_sample_rate:
+                tup += (float(r['sample_rate_i']),)
+            availability.append(tup)
+
+        return availability
+
     def get_start(self, das_t):
         return float(das_t['time/epoch_l']) + \
             float(das_t['time/micro_seconds_i'])/1000000
@@ -670,27 +806,27 @@ class PH5Availability(object):
         expected_sampleNo = (end - start) * sample_rate
 
         sampleNo = 0
-        i = -1
-        for i in range(len(das_t) - 1):
-            sampleNo += das_t[i]['sample_count_i']
-            start_time = self.get_start(das_t[i])
-            end_time = self.get_end(das_t[i], start_time, sample_rate)
-            next_start_time = self.get_start(das_t[i+1])
-            if end_time != next_start_time:
-                gapOverlap += 1
-
-        i += 1
-        try:
-            # the last trace may not be the whole trace
-            start_time = self.get_start(das_t[i])
-            if start_time < latest:
-                end_time = self.get_end(das_t[i], start_time, sample_rate)
-                if latest < end_time:
-                    end_time = latest
-                sampleNo += sample_rate * (end_time - start_time)
-
-        except IndexError:
-            pass
+        if not das_t:
+            return expected_sampleNo, sampleNo, gapOverlap
+
+        starts = ph5api.das_t_col(das_t, 'time/epoch_l').astype(float) + \
+            ph5api.das_t_col(das_t, 'time/micro_seconds_i') / 1000000.
+        counts = ph5api.das_t_col(das_t, 'sample_count_i')
+        if sample_rate != 0:
+            ends = starts + counts.astype(float) / sample_rate
+        else:
+            ends = starts
+        # traces that don't end where the next one starts
+        gapOverlap += int(np.count_nonzero(ends[:-1] != starts[1:]))
+        sampleNo += int(counts[:-1].sum())
+
+        # the last trace may not be the whole trace
+        start_time = starts[-1].item()
+        if start_time < latest:
+            end_time = ends[-1].item()
+            if latest < end_time:
+                end_time = latest
+            sampleNo += sample_rate * (end_time - start_time)
 
         return expected_sampleNo, sampleNo, gapOverlap
 
@@ -1209,6 +1345,12 @@ def get_args(args):
         help=("The output file to be saved at. Only applies when avail is "
               "set to 2 or 3."), default=None)
 
+    parser.add_argument(
+        "--scan_das_t", action="store_true", dest="scan_das_t",
+        help=("Read the Das_t tables for avail 2 or 3 even if there is an "
+              "availability table, see index_availability_t."),
+        default=False)
+
     return parser.parse_args(_preprocess_sysargv(args))
 
 
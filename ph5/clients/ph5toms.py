@@ -13,6 +13,9 @@ import copy
 import itertools
 import io
 import datetime
+import multiprocessing
+import struct
+import numpy
 from obspy.core.inventory.inventory import read_inventory as read_inventory
 from obspy import Trace
 from obspy import Stream
@@ -127,6 +130,83 @@ class StationCutTime(object):
         self.shot_elevation = shot_elevation
 
 
+class MSeedStreamWriter(object):
+    """
+    Writes obspy Streams to a file like object as miniSEED records as they
+    arrive. Samples that would only fill part of a record are held until
+    the next contiguous trace with the same id arrives or flush is called,
+    so a long cut can be written a piece at a time without short records.
+    :param: sink -- file like object opened for binary writing
+    :param: reclen -- miniSEED record length in bytes, 512 to 4096
+    """
+
+    def __init__(self, sink, reclen=4096):
+        self.sink = sink
+        self.reclen = reclen
+        self.sequence_number = 1
+        # Unwritten samples keyed on trace id
+        self.pending = {}
+
+    def write(self, stream):
+        for trace in stream:
+            pending = self.pending.pop(trace.id, None)
+            if pending is not None:
+                if self.contiguous(pending, trace):
+                    pending.data = numpy.concatenate(
+                        (pending.data, trace.data))
+                    trace = pending
+                else:
+                    self.write_records(pending, partial=True)
+            rest = self.write_records(trace, partial=False)
+            if rest is not None:
+                self.pending[trace.id] = rest
+
+    def flush(self):
+        """
+        Write all held samples, ending each trace with a partial record.
+        """
+        for tid in sorted(self.pending.keys()):
+            self.write_records(self.pending[tid], partial=True)
+        self.pending = {}
+        self.sink.flush()
+
+    @staticmethod
+    def contiguous(trace, next_trace):
+        if trace.stats.sampling_rate != next_trace.stats.sampling_rate or \
+                trace.data.dtype != next_trace.data.dtype:
+            return False
+        expected = trace.stats.endtime + trace.stats.delta
+        return abs(next_trace.stats.starttime - expected) < \
+            trace.stats.delta / 2.
+
+    def write_records(self, trace, partial=False):
+        """
+        Write trace as miniSEED records. Unless partial is set the samples
+        of the last record are not written but returned as a trace.
+        """
+        buf = io.BytesIO()
+        trace.write(buf, format='MSEED', reclen=self.reclen, byteorder='>',
+                    sequence_number=self.sequence_number)
+        records = buf.getvalue()
+        rest = None
+        if not partial:
+            last = len(records) - self.reclen
+            # Number of samples, fixed section of data header
+            nsamples = struct.unpack('>H', records[last + 30:last + 32])[0]
+            header = trace.stats.copy()
+            header.npts = nsamples
+            header.starttime = trace.stats.starttime + \
+                (trace.stats.npts - nsamples) * trace.stats.delta
+            rest = Trace(data=trace.data[-nsamples:].copy(), header=header)
+            records = records[:last]
+        self.sink.write(records)
+        self.sequence_number += len(records) // self.reclen
+        if self.sequence_number > 999999:
+            self.sequence_number -= 999999
+
+        return rest
+
+
 class PH5toMSAPIError(Exception):
     """Exception raised when there is a problem with the request.
     :param: message -- explanation of the error
@@ -506,19 +586,28 @@ class PH5toMSeed(object):
             return self.resp_manager.get_response(sensor_keys,
                                                   datalogger_keys)
 
-    def create_trace(self, station_to_cut, mp=False):
+    def create_trace(self, station_to_cut, mp=False, das_t=None):
+        """
+        Cut a StationCut and return an obspy Stream or None.
+        :param: das_t -- Das_t rows of a cut containing station_to_cut as
+        returned by query_das_t, used instead of querying Das_t again
+        """
         station_to_cut_segments = PH5toMSeed.get_nonrestricted_segments(
             [station_to_cut], self.restricted)
         obspy_stream = Stream()
         sr_mismatch = False
         empty_times = True
         for stc in station_to_cut_segments:
-            das = self.ph5.query_das_t(stc.das, stc.component,
-                                       stc.starttime,
-                                       stc.endtime,
-                                       stc.sample_rate,
-                                       stc.sample_rate_multiplier,
-                                       check_samplerate=False)
+            if das_t is None:
+                das = self.ph5.query_das_t(stc.das, stc.component,
+                                           stc.starttime,
+                                           stc.endtime,
+                                           stc.sample_rate,
+                                           stc.sample_rate_multiplier,
+                                           check_samplerate=False)
+            else:
+                das = das_t_in_window(das_t, stc.starttime, stc.endtime,
+                                      by_start=not stc.sample_rate)
             if not das:
                 return
             das = [x for x in das]
@@ -1037,9 +1126,19 @@ class PH5toMSeed(object):
 
         return itertools.chain.from_iterable(cuts_generator)
 
-    def process_all(self):
+    def process_all(self, processes=1):
+        """
+        Yield an obspy Stream for each cut in create_cut_list.
+        :param: processes -- if more than 1, traces are cut by this many
+        worker processes each with its own PH5 handle. Streams are yielded
+        in the same order as when cut in this process.
+        """
         cuts = self.create_cut_list()
         if cuts:
+            if processes > 1:
+                for stream in self.process_pool(cuts, processes):
+                    yield stream
+                return
             for cut in cuts:
                 self.ph5.clear()
                 stream = self.create_trace(cut)
@@ -1048,6 +1147,163 @@ class PH5toMSeed(object):
         else:
             raise PH5toMSAPIError("Request resulted in no data.")
 
+    def write_mseed(self, sink, reclen=4096, piece_len=60, processes=1,
+                    log=None):
+        """
+        Cut each station cut piece_len seconds at a time and write the
+        traces to sink as miniSEED records as they are cut.
+        :param: sink -- file like object opened for binary writing
+        :param: reclen -- miniSEED record length in bytes
+        :param: piece_len -- seconds of data to cut at a time
+        :param: processes -- if more than 1, pieces are cut by this many
+        worker processes and written in the same order
+        :param: log -- file like object the start and end time of each
+        cut is written to, as --epoch prints them
+        """
+        writer = MSeedStreamWriter(sink, reclen=reclen)
+        cuts = self.create_cut_list()
+        pieces = ((i, cut, piece) for i, cut in enumerate(cuts)
+                  for piece in self.split_cut(cut, piece_len))
+        if processes > 1:
+            streams = self.process_pool(pieces, processes,
+                                        create=_create_piece)
+        else:
+            streams = self.create_pieces(pieces)
+        for i, cut_streams in itertools.groupby(streams, key=lambda s: s[0]):
+            first = last = None
+            for i, stream in cut_streams:
+                if stream is None:
+                    continue
+                writer.write(stream)
+                if first is None:
+                    first = stream
+                last = stream
+            writer.flush()
+            if log is not None and first is not None:
+                log.write("{:>32} {:>32}\n".format(
+                    first.traces[0].stats['starttime'],
+                    last.traces[0].stats['endtime']))
+
+    def cut_das_t(self, cut):
+        """
+        Das_t rows of a station cut, queried once for all its pieces.
+        """
+        self.ph5.clear()
+        return self.ph5.query_das_t(cut.das, cut.component,
+                                    cut.starttime,
+                                    cut.endtime,
+                                    cut.sample_rate,
+                                    cut.sample_rate_multiplier,
+                                    check_samplerate=False)
+
+    def create_pieces(self, pieces):
+        """
+        Yield the index of the cut and the stream of each piece.
+        :param: pieces -- iterable of (index of cut, StationCut, piece
+        of it as a StationCut), the pieces of a cut one after another
+        """
+        current = das_t = None
+        for i, cut, piece in pieces:
+            if i != current:
+                current = i
+                das_t = self.cut_das_t(cut)
+            yield i, self.create_trace(piece, das_t=das_t)
+
+    def split_cut(self, cut, piece_len):
+        """
+        Split a StationCut into StationCuts of piece_len seconds.
+        Decimated cuts are not split.
+        """
+        if self.decimation or not piece_len:
+            return [cut]
+        pieces = []
+        starttime = float(cut.starttime)
+        endtime = float(cut.endtime)
+        while starttime < endtime:
+            piece = copy.copy(cut)
+            piece.starttime = starttime
+            piece.endtime = min(starttime + piece_len, endtime)
+            pieces.append(piece)
+            starttime = piece.endtime
+        return pieces
+
+    def process_pool(self, cuts, processes, create=None):
+        """
+        Cut traces with a pool of worker processes.
+        :param: cuts -- iterable of StationCut
+        :param: processes -- number of worker processes
+        :param: create -- function a worker calls for each of cuts,
+        _create_trace if None
+        """
+        if create is None:
+            create = _create_trace
+        pool = multiprocessing.Pool(processes=processes,
+                                    initializer=_init_worker,
+                                    initargs=(self,))
+        try:
+            for stream in pool.imap(create, cuts):
+                if stream is not None:
+                    yield stream
+        finally:
+            pool.terminate()
+            pool.join()
+
+
+def das_t_in_window(das_t, starttime, endtime, by_start=False):
+    """
+    Return the rows of das_t that PH5.query_das_t returns for starttime
+    to endtime, without reading Das_t again.
+    :param: das_t -- list of Das_t rows of one channel
+    :param: by_start -- only rows that start in the window, as for sample
+    rate 0
+    """
+    if not das_t:
+        return []
+    starts, lengths, rates = ph5api.das_t_windows(das_t)
+    starttime = float(starttime)
+    endtime = float(endtime)
+    if by_start:
+        keep = (starts >= starttime) & (starts <= endtime)
+    else:
+        keep = (starts <= endtime) & (starts + lengths > starttime)
+    return [row for row, k in zip(das_t, keep.tolist()) if k]
+
+
+# PH5toMSeed of a worker process started by PH5toMSeed.process_pool
+_WORKER = None
+
+
+def _init_worker(ph5ms):
+    """
+    Give each worker a copy of ph5ms with its own read only PH5 handle.
+    """
+    global _WORKER
+    _WORKER = copy.copy(ph5ms)
+    _WORKER.ph5 = ph5api.PH5(path=ph5ms.ph5.currentpath,
+                             nickname=ph5ms.ph5.nickname)
+    _WORKER.resp_manager = PH5ResponseManager()
+
+
+def _create_trace(cut):
+    _WORKER.ph5.clear()
+    return _WORKER.create_trace(cut)
+
+
+# Index of the cut and Das_t rows the worker last queried for write_mseed
+_WORKER_DAS_T = (None, None)
+
+
+def _create_piece(piece):
+    """
+    PH5toMSeed.create_pieces for one piece in a worker, Das_t is queried
+    again only when the piece is of another cut.
+    """
+    global _WORKER_DAS_T
+    i, cut, piece = piece
+    if _WORKER_DAS_T[0] != i:
+        _WORKER_DAS_T = (i, _WORKER.cut_das_t(cut))
+    return i, _WORKER.create_trace(piece, das_t=_WORKER_DAS_T[1])
+
 
 def get_args():
 
@@ -1103,7 +1359,8 @@ def get_args():
 
     parser.add_argument(
         "--stream", action="store_true", default=False,
-        help="Stream output to stdout.")
+        help="Stream output to stdout. miniSEED records are written as "
+        "they are cut.")
 
     parser.add_argument(
         "-s", "--starttime", action="store",
@@ -1188,9 +1445,21 @@ def get_args():
 
     parser.add_argument(
         "--epoch", action="store_true", default=False,
-        help="Log the epoch of the miniseed files to the terminal"
+        help="Log the epoch of the miniseed files to the terminal, "
+             "to stderr with --stream"
     )
 
+    parser.add_argument(
+        "--reclen", action="store", type=int, default=4096,
+        choices=[512, 1024, 2048, 4096],
+        help="miniSEED record length in bytes. Default 4096",
+        metavar="reclen")
+
+    parser.add_argument(
+        "--processes", action="store", type=int, default=1,
+        help="Number of processes used to cut traces. Default 1",
+        metavar="processes")
+
     the_args = parser.parse_args()
 
     return the_args
@@ -1260,11 +1529,24 @@ def main():
                            format=args.format,
                            log_epoch=args.epoch)
 
-        if args.epoch:
-            epoch_header = "{:>32} {:>32}".format('Start time', 'End time')
-            print(epoch_header)
+        if args.stream and args.format == "MSEED":
+            # miniSEED records are written to stdout as they are cut,
+            # --epoch to stderr
+            log = None
+            if args.epoch:
+                log = sys.stderr
+                log.write("{:>32} {:>32}\n".format('Start time', 'End time'))
+            ph5ms.write_mseed(sys.stdout, reclen=args.reclen,
+                              processes=args.processes, log=log)
+            streams = []
+        else:
+            streams = ph5ms.process_all(processes=args.processes)
+            if args.epoch:
+                epoch_header = "{:>32} {:>32}".format('Start time',
+                                                      'End time')
+                print(epoch_header)
 
-        for stream in ph5ms.process_all():
+        for stream in streams:
             if args.epoch:
                 fmt = "{:>32} {:>32}"
                 msg = fmt.format(stream.traces[0].stats['starttime'],
@@ -1274,10 +1556,10 @@ def main():
             if args.format.upper() == "MSEED":
                 if not args.non_standard:
                     stream.write(ph5ms.filenamemseed_gen(stream),
-                                 format='MSEED', reclen=4096)
+                                 format='MSEED', reclen=args.reclen)
                 else:
                     stream.write(ph5ms.filenamemseed_nongen(stream),
-                                 format='MSEED', reclen=4096)
+                                 format='MSEED', reclen=args.reclen)
             elif args.format.upper() == "SAC":
                 for trace in stream:
                     sac = SACTrace.from_obspy_trace(trace)
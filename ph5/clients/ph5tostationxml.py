@@ -6,7 +6,11 @@ import sys
 import io
 import os
 import argparse
+import bisect
+import collections
 import fnmatch
+import math
+import multiprocessing
 
 import logging
 import pickle
@@ -19,11 +23,13 @@ from obspy.core.inventory.response import Response
 from obspy.io.xseed.core import _is_resp
 
 from ph5.core import ph5utils, ph5api
-from ph5.core.ph5utils import PH5ResponseManager
+from ph5.core.ph5utils import PH5ResponseManager, PH5ResponseCache
 from ph5.utilities import validation
 
 PROG_VERSION = '2021.47'
 LOGGER = logging.getLogger(__name__)
+# Number of experiments STATION_INDEXES keeps
+STATION_INDEX_SIZE = 32
 
 
 def get_args():
@@ -157,6 +163,16 @@ def get_args():
                         help='Output stationxml even if bug is '
                              'present in data.')
 
+    parser.add_argument("--processes", action="store", type=int, default=1,
+                        help=("Number of experiments evaluated at a time by "
+                              "worker processes. Default 1"),
+                        metavar="processes")
+
+    parser.add_argument("--response_cache", action="store",
+                        help=("Directory to keep parsed responses in so "
+                              "later runs do not parse them again."),
+                        type=str, metavar="response_cache")
+
     args = parser.parse_args()
     return args
 
@@ -299,6 +315,268 @@ class PH5toStationXMLRequestManager(object):
         self._obs_channels[cha_key] = obs_channel
 
 
+class PH5StationEntry(object):
+    """
+    An Array_t row as seen by PH5toStationXMLParser.read_stations with the
+    codes it is looked up by and its location validation results
+    """
+    __slots__ = ('n', 'array_name', 'array_code', 'sta_id', 'deployment',
+                 'station_entry', 'station_code', 'cha_code', 'loc_code',
+                 'errors', 'warnings', 'number_of_channels')
+
+
+class PH5StationIndex(object):
+    """
+    The Array_t rows of an experiment indexed by array, station id, SEED
+    station, channel and location codes, deploy and pickup time and a one
+    degree latitude/longitude grid, so a PH5toStationXMLRequest is
+    resolved with lookups instead of scanning every row. Lookups only
+    narrow the rows down, the parser still checks each row it is given.
+    The rows are shared with the PH5 object the index was read from and
+    are treated as read only.
+    :param: ph5 : ph5api.PH5 object to read Array_t from
+    """
+
+    def __init__(self, ph5):
+        ph5.read_array_t_names()
+        self.array_names = sorted(ph5.Array_t_names)
+        self.array_t = {}
+        # entries in the order read_stations visits them
+        self.entries = []
+        self.by_array = {}
+        self.by_sta_id = {}
+        self.by_station = {}
+        self.by_channel = {}
+        self.by_location = {}
+        self.grid = {}
+        # entries with location errors are not in the grid
+        self.has_errors = set()
+        self.min_start_time = 7289567999
+        self.max_end_time = 0
+        self.mtime = None
+        for array_name in self.array_names:
+            ph5.read_array_t(array_name)
+            self.array_t[array_name] = ph5.Array_t[array_name]
+            self.add_array(array_name)
+
+        by_start = sorted((e.station_entry['deploy_time/epoch_l'], e.n)
+                          for e in self.entries)
+        by_end = sorted((e.station_entry['pickup_time/epoch_l'], e.n)
+                        for e in self.entries)
+        self.starts = [t for t, n in by_start]
+        self.n_by_start = [n for t, n in by_start]
+        self.ends = [t for t, n in by_end]
+        self.n_by_end = [n for t, n in by_end]
+
+    def add_array(self, array_name):
+        array_code = array_name[8:]
+        arraybyid = self.array_t[array_name]['byid']
+        for sta_id in self.array_t[array_name]['order']:
+            station_list = arraybyid.get(sta_id)
+            for deployment, station_entry in \
+                    ((dk, se) for dk, dv in station_list.items()
+                     for se in dv):
+                e = PH5StationEntry()
+                e.n = len(self.entries)
+                e.array_name = array_name
+                e.array_code = array_code
+                e.sta_id = sta_id
+                e.deployment = deployment
+                e.station_entry = station_entry
+                if station_entry['seed_station_name_s']:
+                    e.station_code = station_entry['seed_station_name_s']
+                else:
+                    e.station_code = sta_id
+                e.cha_code = (station_entry['seed_band_code_s'] +
+                              station_entry['seed_instrument_code_s'] +
+                              station_entry['seed_orientation_code_s'])
+                e.loc_code = station_entry['seed_location_code_s'] or ""
+                e.errors, e.warnings = validation.check_lat_lon_elev(
+                    station_entry)
+                e.number_of_channels = len(station_list)
+                self.entries.append(e)
+
+                self.by_array.setdefault(array_code, set()).add(e.n)
+                self.by_sta_id.setdefault(sta_id, set()).add(e.n)
+                self.by_station.setdefault(str(e.station_code),
+                                           set()).add(e.n)
+                self.by_channel.setdefault(e.cha_code, set()).add(e.n)
+                self.by_location.setdefault(e.loc_code, set()).add(e.n)
+                if e.errors:
+                    self.has_errors.add(e.n)
+                else:
+                    cell = (int(math.floor(
+                                station_entry['location/Y/value_d'])),
+                            int(math.floor(
+                                station_entry['location/X/value_d'])))
+                    self.grid.setdefault(cell, set()).add(e.n)
+                self.min_start_time = min(self.min_start_time,
+                                          station_entry['deploy_time/epoch_l'])
+                self.max_end_time = max(self.max_end_time,
+                                        station_entry['pickup_time/epoch_l'])
+
+    @staticmethod
+    def match(index, patterns):
+        """
+        Returns the set of entries under the keys of index that match any of
+        patterns, None if a pattern matches everything
+        :param: index : dictionary of sets of entries keyed on code
+        :param: patterns : list of glob expression strings
+        """
+        ret = set()
+        for pattern in patterns:
+            pattern = str(pattern)
+            if pattern == '*':
+                return None
+            if any(c in pattern for c in '*?['):
+                for key in fnmatch.filter(index, pattern):
+                    ret.update(index[key])
+            else:
+                ret.update(index.get(pattern, ()))
+        return ret
+
+    def get_ph5_station_ids(self, station_patterns):
+        """
+        Returns the sorted ph5 station ids with a SEED station code, or
+        station id when there is none, matching station_patterns
+        """
+        matched = self.match(self.by_station, station_patterns)
+        if matched is None:
+            return sorted(self.by_sta_id)
+        return sorted(set(self.entries[n].sta_id for n in matched))
+
+    def in_time(self, start_time, end_time):
+        """
+        Returns the set of entries deployed between start_time and
+        end_time (UTCDateTime or None), None if neither is given
+        """
+        if start_time is None and end_time is None:
+            return None
+        ret = None
+        # a second of slack, the parser compares UTCDateTimes
+        if start_time is not None:
+            i = bisect.bisect_left(self.ends, start_time.timestamp - 1)
+            ret = set(self.n_by_end[i:])
+        if end_time is not None:
+            i = bisect.bisect_right(self.starts, end_time.timestamp + 1)
+            started = set(self.n_by_start[:i])
+            ret = started if ret is None else ret & started
+        return ret
+
+    def in_area(self, sta_xml_obj):
+        """
+        Returns the set of entries in grid cells that can meet the
+        rectangular and radial constraints of sta_xml_obj, None if
+        there are none
+        """
+        minlat = sta_xml_obj.minlatitude
+        maxlat = sta_xml_obj.maxlatitude
+        minlon = sta_xml_obj.minlongitude
+        maxlon = sta_xml_obj.maxlongitude
+        lat_range = [float(minlat) if minlat is not None else -90.,
+                     float(maxlat) if maxlat is not None else 90.]
+        lon_range = [float(minlon) if minlon is not None else -180.,
+                     float(maxlon) if maxlon is not None else 180.]
+        radial = (sta_xml_obj.minradius is not None or
+                  sta_xml_obj.maxradius is not None or
+                  sta_xml_obj.latitude is not None or
+                  sta_xml_obj.longitude is not None)
+        if radial:
+            # The distance in degrees is at least the latitude difference,
+            # defaults are those of ph5utils.is_radial_intersection
+            maxradius = sta_xml_obj.maxradius or sta_xml_obj.minradius or 0.
+            point_lat = sta_xml_obj.latitude or 0.
+            lat_range = [max(lat_range[0], point_lat - maxradius),
+                         min(lat_range[1], point_lat + maxradius)]
+        elif (minlat is None and maxlat is None and
+              minlon is None and maxlon is None):
+            return None
+
+        ret = set()
+        for (lat, lon), cell in self.grid.items():
+            if lat <= lat_range[1] and lat + 1 >= lat_range[0] and \
+                    lon <= lon_range[1] and lon + 1 >= lon_range[0]:
+                ret.update(cell)
+        return ret
+
+    def select(self, sta_xml_obj):
+        """
+        Returns the entries read_stations has to check for sta_xml_obj in
+        the order it visits them. Entries of the requested arrays and
+        stations with location errors are always returned so they are
+        reported.
+        :param: sta_xml_obj : PH5toStationXMLRequest object with
+            ph5_station_id_list set
+        """
+        selected = set()
+        for sta_id in sta_xml_obj.ph5_station_id_list:
+            selected.update(self.by_sta_id.get(sta_id, ()))
+        in_arrays = self.match(self.by_array, sta_xml_obj.array_list)
+        if in_arrays is not None:
+            selected &= in_arrays
+
+        errors = selected & self.has_errors
+        for found in (self.in_time(sta_xml_obj.start_time,
+                                   sta_xml_obj.end_time),
+                      self.in_area(sta_xml_obj),
+                      self.match(self.by_channel, sta_xml_obj.channel_list),
+                      self.match(self.by_location,
+                                 sta_xml_obj.location_list)):
+            if found is not None:
+                selected &= found
+        selected |= errors
+
+        return [self.entries[n] for n in sorted(selected)]
+
+
+class PH5StationIndexCache(object):
+    """
+    Least recently used PH5StationIndex of each master file, rebuilt when
+    the file changes, so requests against the same experiment share one
+    index.
+    :param: maxsize : Maximum number of experiments kept
+    """
+
+    def __init__(self, maxsize=STATION_INDEX_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.indexes = collections.OrderedDict()
+
+    def clear(self):
+        self.indexes.clear()
+
+    def get(self, ph5):
+        """
+        Returns the index of ph5 and sets ph5.Array_t from it
+        :param: ph5 : ph5api.PH5 object
+        """
+        filename = os.path.abspath(ph5.filename)
+        st = os.stat(filename)
+        mtime = (st.st_mtime, st.st_size)
+        index = self.indexes.pop(filename, None)
+        if index is not None and index.mtime == mtime:
+            self.hits += 1
+            ph5.read_array_t_names()
+            ph5.Array_t.update(index.array_t)
+        else:
+            self.misses += 1
+            index = PH5StationIndex(ph5)
+            index.mtime = mtime
+        # Most recently used is last
+        self.indexes[filename] = index
+        while len(self.indexes) > self.maxsize:
+            self.indexes.popitem(last=False)
+
+        return index
+
+
+STATION_INDEXES = PH5StationIndexCache()
+# Parsed responses shared between requests, set RESPONSE_CACHE.path to
+# share them between processes
+RESPONSE_CACHE = PH5ResponseCache()
+
+
 class PH5toStationXMLParser(object):
 
     def __init__(self, manager):
@@ -309,6 +587,7 @@ class PH5toStationXMLParser(object):
         self.total_number_stations = 0
         self.unique_errors = set()
         self.checked_data_files = {}
+        self.station_index = None
         self.manager.ph5.read_response_t()
 
     def check_intersection(self, sta_xml_obj, latitude, longitude):
@@ -343,63 +622,31 @@ class PH5toStationXMLParser(object):
         else:
             self.manager.ph5.read_array_t(name)
 
+    def get_station_index(self):
+        """
+        Returns the PH5StationIndex of the experiment from STATION_INDEXES
+        """
+        if self.station_index is None:
+            self.station_index = STATION_INDEXES.get(self.manager.ph5)
+        return self.station_index
+
     def add_ph5_stationids(self):
         """
         For each PH5toStationXML object in self.manager.request_list add the
         respective ph5 station ids for the requested stations in the object.
         """
-        self.manager.ph5.read_array_t_names()
-        self.read_arrays(None)
-        self.array_names = self.manager.ph5.Array_t_names
-        self.array_names.sort()
+        index = self.get_station_index()
+        self.array_names = index.array_names
         for sta_xml_obj in self.manager.request_list:
-            for array_name in self.array_names:
-                arraybyid = self.manager.ph5.Array_t[array_name]['byid']
-                arrayorder = self.manager.ph5.Array_t[array_name]['order']
-                for station in arrayorder:
-                    station_list = arraybyid.get(station)
-                    for deployment, station_entry in \
-                            ((dk, se) for dk, dv in station_list.items()
-                             for se in dv):
-                        for sta_pattern in sta_xml_obj.station_list:
-                            if not station_entry['seed_station_name_s'] and \
-                                    fnmatch.fnmatch(str(station),
-                                                    str(sta_pattern)):
-                                # no seed station code defined so compare
-                                # against ph5 station-id
-                                sta_xml_obj.ph5_station_id_list.extend(
-                                                                [station]
-                                                            )
-                            elif fnmatch.fnmatch(
-                                        station_entry['seed_station_name_s'],
-                                        sta_pattern):
-                                sta_xml_obj.ph5_station_id_list.extend(
-                                                                    [station]
-                                                                )
-
-            sta_xml_obj.ph5_station_id_list = \
-                sorted(set(sta_xml_obj.ph5_station_id_list))
+            sta_xml_obj.ph5_station_id_list = index.get_ph5_station_ids(
+                sta_xml_obj.station_list)
         self.total_number_stations = max([len(sta_xml_obj.ph5_station_id_list)
                                           for sta_xml_obj in
                                           self.manager.request_list])
 
     def get_network_date(self):
-        self.read_arrays(None)
-        array_names = self.manager.ph5.Array_t_names
-        min_start_time = 7289567999
-        max_end_time = 0
-        for array_name in array_names:
-            arraybyid = self.manager.ph5.Array_t[array_name]['byid']
-            for station in arraybyid.values():
-                for deployment in station.values():
-                    for station_entry in deployment:
-                        start_date = station_entry['deploy_time/epoch_l']
-                        if start_date < min_start_time:
-                            min_start_time = start_date
-                        end_date = station_entry['pickup_time/epoch_l']
-                        if end_date > max_end_time:
-                            max_end_time = end_date
-        return float(min_start_time), float(max_end_time+1)
+        index = self.get_station_index()
+        return float(index.min_start_time), float(index.max_end_time+1)
 
     def trim_to_level(self, network):
         if self.manager.level == "NETWORK":
@@ -419,6 +666,31 @@ class PH5toStationXMLParser(object):
         else:
             return
 
+    def read_response(self, name):
+        """
+        Returns the obspy Response in response array name, read as RESP or
+        unpickled, through RESPONSE_CACHE
+        :param: name : path of the response array in ph5_g_responses
+        """
+        key = RESPONSE_CACHE.get_key(self.manager.ph5.filename, name)
+        response = RESPONSE_CACHE.get(key)
+        if response is not None:
+            return response
+
+        response_file_a = \
+            self.manager.ph5.ph5_g_responses.get_response(name)
+        with io.BytesIO(response_file_a) as buf:
+            buf.seek(0, 0)
+            if _is_resp(buf):
+                buf.seek(0, 0)
+                response = read_inventory(buf, format="RESP")
+                response = response[0][0][0].response
+            else:
+                response = pickle.loads(response_file_a)
+        RESPONSE_CACHE.put(key, response)
+
+        return response
+
     def get_response_inv(self, obs_channel, a_id, sta_id, cha_id,
                          spr, spr_m, emp_resp):
 
@@ -457,37 +729,11 @@ class PH5toStationXMLParser(object):
 
             # parse datalogger response
             if response_file_das_a_name:
-                response_file_das_a = \
-                    self.manager.ph5.ph5_g_responses.get_response(
-                                                    response_file_das_a_name
-                                            )
-
-                with io.BytesIO(response_file_das_a) as buf:
-                    buf.seek(0, 0)
-                    if _is_resp(buf):
-                        buf.seek(0, 0)
-                        dl_resp = read_inventory(buf, format="RESP")
-                        dl_resp = dl_resp[0][0][0].response
-                    else:
-                        buf.seek(0, 0)
-                        dl_resp = pickle.loads(response_file_das_a)
+                dl_resp = self.read_response(response_file_das_a_name)
 
             # parse sensor response if present
             if response_file_sensor_a_name:
-                response_file_sensor_a = \
-                    self.manager.ph5.ph5_g_responses.get_response(
-                                                response_file_sensor_a_name
-                                            )
-
-                with io.BytesIO(response_file_sensor_a) as buf:
-                    buf.seek(0, 0)
-                    if _is_resp(buf):
-                        buf.seek(0, 0)
-                        sensor_resp = read_inventory(buf, format="RESP")
-                        sensor_resp = sensor_resp[0][0][0].response
-                    else:
-                        buf.seek(0, 0)
-                        sensor_resp = pickle.loads(response_file_sensor_a)
+                sensor_resp = self.read_response(response_file_sensor_a_name)
 
             inv_resp = None
             if response_file_das_a_name and response_file_sensor_a_name:
@@ -711,117 +957,98 @@ class PH5toStationXMLParser(object):
 
         all_stations = []
         for sta_xml_obj in self.manager.request_list:
-            array_patterns = sta_xml_obj.array_list
-            for array_name in self.array_names:
-                array_code = array_name[8:]
-                if not ph5utils.does_pattern_exists(array_patterns,
-                                                    array_code):
+            for entry in self.station_index.select(sta_xml_obj):
+                array_code = entry.array_code
+                deployment = entry.deployment
+                station_entry = entry.station_entry
+                obs_channels = []
+
+                longitude = station_entry['location/X/value_d']
+                latitude = station_entry['location/Y/value_d']
+                elevation = station_entry['location/Z/value_d']
+
+                station_code = entry.station_code
+                header = "array %s, station %s, channel %s: " % \
+                         (array_code, station_code,
+                          station_entry['channel_number_i'])
+                for e in entry.errors:
+                    msg = header + str(e)
+                    self.unique_errors.add((msg, 'error'))
+
+                if entry.errors != []:
+                    continue
+                if not self.check_intersection(sta_xml_obj, latitude,
+                                               longitude):
+                    continue
+                start_date = UTCDateTime(station_entry['deploy_time/epoch_l'])
+                end_date = UTCDateTime(station_entry['pickup_time/epoch_l'])
+
+                if (sta_xml_obj.start_time and
+                        sta_xml_obj.start_time > end_date):
+                    # chosen start time after pickup
+                    continue
+                elif (sta_xml_obj.end_time and
+                        sta_xml_obj.end_time < start_date):
+                    # chosen end time before pickup
                     continue
-                arraybyid = self.manager.ph5.Array_t[array_name]['byid']
-                arrayorder = self.manager.ph5.Array_t[array_name]['order']
-                for sta_id in arrayorder:
-                    station_list = arraybyid.get(sta_id)
-                    obs_channels = []
-                    if sta_id not in sta_xml_obj.ph5_station_id_list:
+
+                # run channel filters if necessary. we do this
+                # first to avoid creating a station that has no
+                # channels
+                if (self.manager.level.upper() == "RESPONSE" or
+                        self.manager.level.upper() == "CHANNEL" or
+                        sta_xml_obj.location_list != ['*'] or
+                        sta_xml_obj.channel_list != ['*'] or
+                        sta_xml_obj.component_list != ['*'] or
+                        sta_xml_obj.receiver_list != ['*']):
+                    obs_channels = self.read_channels(sta_xml_obj,
+                                                      station_entry,
+                                                      deployment,
+                                                      station_code,
+                                                      array_code)
+                    # go to the next station if no channels were
+                    # returned
+                    if len(obs_channels) == 0:
                         continue
-                    for deployment, station_epoch, station_entry in \
-                            ((dk, dv, se) for dk, dv in station_list.items()
-                             for se in dv):
-
-                        longitude = station_entry['location/X/value_d']
-                        latitude = station_entry['location/Y/value_d']
-                        elevation = station_entry['location/Z/value_d']
-
-                        if station_entry['seed_station_name_s']:
-                            station_code = station_entry['seed_station_name_s']
-                        else:
-                            station_code = sta_id
-                        errors, warnings = validation.check_lat_lon_elev(
-                            station_entry)
-                        header = "array %s, station %s, channel %s: " % \
-                                 (array_code, station_code,
-                                  station_entry['channel_number_i'])
-                        for e in errors:
-                            msg = header + str(e)
-                            self.unique_errors.add((msg, 'error'))
-
-                        if errors != []:
-                            continue
-                        if not self.check_intersection(sta_xml_obj, latitude,
-                                                       longitude):
-                            continue
-                        start_date = UTCDateTime(
-                                        station_entry['deploy_time/epoch_l'])
-                        end_date = UTCDateTime(
-                                        station_entry['pickup_time/epoch_l'])
 
-                        if (sta_xml_obj.start_time and
-                                sta_xml_obj.start_time > end_date):
-                            # chosen start time after pickup
-                            continue
-                        elif (sta_xml_obj.end_time and
-                                sta_xml_obj.end_time < start_date):
-                            # chosen end time before pickup
-                            continue
-
-                        # run channel filters if necessary. we do this
-                        # first to avoid creating a station that has no
-                        # channels
-                        if (self.manager.level.upper() == "RESPONSE" or
-                                self.manager.level.upper() == "CHANNEL" or
-                                sta_xml_obj.location_list != ['*'] or
-                                sta_xml_obj.channel_list != ['*'] or
-                                sta_xml_obj.component_list != ['*'] or
-                                sta_xml_obj.receiver_list != ['*']):
-                            obs_channels = self.read_channels(sta_xml_obj,
-                                                              station_entry,
-                                                              deployment,
-                                                              station_code,
-                                                              array_code)
-                            # go to the next station if no channels were
-                            # returned
-                            if len(obs_channels) == 0:
-                                continue
-
-                        sta_key = self.manager.get_station_key(
-                                    station_code,
-                                    start_date,
-                                    end_date,
-                                    longitude,
-                                    latitude,
-                                    elevation,
-                                    station_entry['location/description_s'])
-                        if self.manager.get_obs_station(sta_key):
-                            # station already created and added to metadata
-                            obs_station = self.manager.get_obs_station(sta_key)
-                        else:
-                            # create and add a new station
-                            obs_station = self.create_obs_station(
-                                    station_code,
-                                    start_date,
-                                    end_date,
-                                    longitude,
-                                    latitude,
-                                    elevation,
-                                    start_date,  # creation_date
-                                    end_date,  # termination date
-                                    station_entry['location/description_s'])
-
-                        # Add matching channels to station if necessary
-                        if obs_channels:
-                            obs_station.channels.extend(obs_channels)
-                            obs_station.selected_number_of_channels = \
-                                len(obs_station.channels)
-                        else:
-                            obs_station.selected_number_of_channels = 0
-
-                        obs_station.total_number_of_channels += \
-                            len(station_list)
-
-                        if self.manager.get_obs_station(sta_key) is None:
-                            all_stations.append(obs_station)
-                            self.manager.set_obs_station(sta_key,
-                                                         obs_station)
+                sta_key = self.manager.get_station_key(
+                            station_code,
+                            start_date,
+                            end_date,
+                            longitude,
+                            latitude,
+                            elevation,
+                            station_entry['location/description_s'])
+                if self.manager.get_obs_station(sta_key):
+                    # station already created and added to metadata
+                    obs_station = self.manager.get_obs_station(sta_key)
+                else:
+                    # create and add a new station
+                    obs_station = self.create_obs_station(
+                            station_code,
+                            start_date,
+                            end_date,
+                            longitude,
+                            latitude,
+                            elevation,
+                            start_date,  # creation_date
+                            end_date,  # termination date
+                            station_entry['location/description_s'])
+
+                # Add matching channels to station if necessary
+                if obs_channels:
+                    obs_station.channels.extend(obs_channels)
+                    obs_station.selected_number_of_channels = \
+                        len(obs_station.channels)
+                else:
+                    obs_station.selected_number_of_channels = 0
+
+                obs_station.total_number_of_channels += \
+                    entry.number_of_channels
+
+                if self.manager.get_obs_station(sta_key) is None:
+                    all_stations.append(obs_station)
+                    self.manager.set_obs_station(sta_key, obs_station)
         return all_stations
 
     def read_channels(self, sta_xml_obj, station_entry, deployment,
@@ -977,29 +1204,109 @@ def execute(path, args_dict_list, nickname, level, out_format):
     return ph5sxmlparser.get_network()
 
 
+def execute_path(path, args_dict_list, nickname, level, out_format):
+    """
+    Runs execute for the experiment in path and logs the outcome.
+    :returns: obspy Network of the experiment or None
+    """
+    try:
+        LOGGER.info("CHECKING %s" % os.path.join(path, nickname))
+        n = execute(path,
+                    args_dict_list,
+                    nickname,
+                    level,
+                    out_format)
+        if n is None:
+            LOGGER.info("NO STATIONXML DATA CREATED FOR %s" %
+                        os.path.join(path, nickname))
+        else:
+            LOGGER.info("STATIONXML DATA CREATED FOR %s" %
+                        os.path.join(path, nickname))
+        return n
+    except PH5toStationXMLError as e:
+        LOGGER.error(e.message)
+        LOGGER.info("NO STATIONXML DATA CREATED FOR %s" %
+                    os.path.join(path, nickname))
+
+
+def execute_pool(paths, args_dict_list, nickname, level, out_format,
+                 processes):
+    """
+    Yields execute_path of each path in order, with up to processes
+    experiments evaluated at a time by worker processes. The log records
+    of each experiment are kept by its worker and emitted here in path
+    order, so the log reads as it does when run serially.
+    :param: processes : number of worker processes
+    """
+    pool = multiprocessing.Pool(processes=min(processes, len(paths)),
+                                initializer=_init_worker,
+                                initargs=(args_dict_list, nickname, level,
+                                          out_format))
+    try:
+        for n, records in pool.imap(_execute_path, paths):
+            for record in records:
+                logging.getLogger(record.name).handle(record)
+            yield n
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+class _RecordHandler(logging.Handler):
+    """
+    Keeps the log records of a worker process started by execute_pool so
+    they can be sent to the calling process.
+    """
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        # Formatted here, the arguments may not pickle
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+        self.records.append(record)
+
+
+# Arguments and log handler of a worker process started by execute_pool
+_WORKER = None
+
+
+def _init_worker(args_dict_list, nickname, level, out_format):
+    global _WORKER
+    handler = _RecordHandler()
+    logging.getLogger('ph5').handlers = [handler]
+    _WORKER = (handler, args_dict_list, nickname, level, out_format)
+
+
+def _execute_path(path):
+    handler, args_dict_list, nickname, level, out_format = _WORKER
+    handler.records = []
+    n = execute_path(path, args_dict_list, nickname, level, out_format)
+    return n, handler.records
+
+
 def run_ph5_to_stationxml(paths, nickname, out_format,
-                          level, uri, args_dict_list):
-    networks = []
+                          level, uri, args_dict_list, processes=1):
+    """
+    Returns an obspy Inventory of the networks of the experiments in paths
+    in the order of paths.
+    :param: processes : if more than 1, experiments are evaluated by this
+        many worker processes at a time
+    """
     if paths:
-        for path in paths:
-            try:
-                LOGGER.info("CHECKING %s" % os.path.join(path, nickname))
-                n = execute(path,
-                            args_dict_list,
-                            nickname,
-                            level,
-                            out_format)
-                if n is None:
-                    LOGGER.info("NO STATIONXML DATA CREATED FOR %s" %
-                                os.path.join(path, nickname))
-                else:
-                    networks.append(n)
-                    LOGGER.info("STATIONXML DATA CREATED FOR %s" %
-                                os.path.join(path, nickname))
-            except PH5toStationXMLError as e:
-                LOGGER.error(e.message)
-                LOGGER.info("NO STATIONXML DATA CREATED FOR %s" %
-                            os.path.join(path, nickname))
+        if processes > 1 and len(paths) > 1:
+            results = execute_pool(paths, args_dict_list, nickname, level,
+                                   out_format, processes)
+        else:
+            results = (execute_path(path, args_dict_list, nickname, level,
+                                    out_format)
+                       for path in paths)
+        networks = [n for n in results if n is not None]
 
         if networks:
             inv = inventory.Inventory(
@@ -1051,6 +1358,9 @@ def main():
     if ext != 'ph5':
         nickname = nickname + '.ph5'
 
+    if args_dict.get('response_cache'):
+        RESPONSE_CACHE.path = args_dict.get('response_cache')
+
     try:
         basepaths = args_dict.get('ph5path')
         paths = []
@@ -1070,7 +1380,8 @@ def main():
                                     out_format,
                                     level,
                                     uri,
-                                    args_dict_list)
+                                    args_dict_list,
+                                    args_dict.get('processes'))
         if not inv:
             raise NoDataError("Request resulted in no data.")
 
@@ -845,7 +845,7 @@ class TestPH5Availability(LogTestCase, TempDirTestCase):
             'output_file': None, 'avail': 0, 'end_time': None,
             'sta_id_list': [], 'ph5path': self.ph5test_path,
             'samplerate': False, 'nickname': 'master.ph5', 'sta_list': [],
-            'channel': [], 'location': None}
+            'channel': [], 'location': None, 'scan_das_t': False}
         self.assertDictEqual(ret, expect)
         # test correct args received
         ret = vars(ph5availability.get_args(
@@ -853,7 +853,7 @@ class TestPH5Availability(LogTestCase, TempDirTestCase):
              '-s', '2017-08-09T16:00:00.380000',
              '-e', '2017-08-09T16:01:00.380000', '--station', '500,0407',
              '--station_id', '500,0407', '-l', '00', '-c', 'DP1', '-S',
-             '-A', '1', '-F', 't', '-o', 'extent.txt']))
+             '-A', '1', '-F', 't', '-o', 'extent.txt', '--scan_das_t']))
         expect = {
             'array_t_': 1, 'format': 't', 'ph5path': self.ph5test_path,
             'output_file': 'extent.txt', 'avail': 0,
@@ -861,7 +861,7 @@ class TestPH5Availability(LogTestCase, TempDirTestCase):
             'end_time': '2017-08-09T16:01:00.380000',
             'sta_id_list': '500,0407', 'sta_list': '500,0407',
             'samplerate': True, 'nickname': 'master.ph5',
-            'channel': 'DP1', 'location': '00'}
+            'channel': 'DP1', 'location': '00', 'scan_das_t': True}
         self.assertDictEqual(ret, expect)
 
     def test_analyze_args(self):
@@ -7,9 +7,11 @@ import copy
 import os
 import sys
 import logging
+import io
 
 from mock import patch
 from testfixtures import LogCapture
+from obspy import read
 
 from ph5.core.tests.test_base import LogTestCase, TempDirTestCase
 from ph5.core import ph5api, experiment
@@ -232,6 +234,94 @@ class TestPH5toMSeed_samplerate(LogTestCase, TempDirTestCase):
             if trace is not None:
                 self.assertEqual(trace[0].stats.sampling_rate, cut.sample_rate)
 
+    def test_process_all_processes(self):
+        # worker processes return the same streams in the same order
+        self.ph5_object = ph5api.PH5(
+            path=os.path.join(self.home, 'ph5/test_data/ph5'),
+            nickname='master.ph5')
+        streams = list(PH5toMSeed(self.ph5_object).process_all())
+        pstreams = list(PH5toMSeed(self.ph5_object).process_all(processes=2))
+        self.assertTrue(streams)
+        self.assertEqual(len(streams), len(pstreams))
+        for stream, pstream in zip(streams, pstreams):
+            self.assertEqual(stream, pstream)
+
+    def test_write_mseed(self):
+        # cutting 7 seconds at a time writes the same records as writing
+        # each whole stream
+        self.ph5_object = ph5api.PH5(
+            path=os.path.join(self.home, 'ph5/test_data/ph5'),
+            nickname='master.ph5')
+        buf = io.BytesIO()
+        for stream in PH5toMSeed(self.ph5_object,
+                                 station_id=['8001']).process_all():
+            stream.write(buf, format='MSEED', reclen=512)
+        streamed = io.BytesIO()
+        PH5toMSeed(self.ph5_object, station_id=['8001']).write_mseed(
+            streamed, reclen=512, piece_len=7)
+        self.assertEqual(len(buf.getvalue()), len(streamed.getvalue()))
+        # sequence numbers continue from one write to the next
+        self.assertEqual('000001', streamed.getvalue()[:6])
+        self.assertEqual('000010', streamed.getvalue()[9 * 512:9 * 512 + 6])
+        expected = read(io.BytesIO(buf.getvalue()))
+        result = read(io.BytesIO(streamed.getvalue()))
+        self.assertEqual(3, len(result))
+        for trace, expected_trace in zip(result, expected):
+            self.assertEqual(trace.id, expected_trace.id)
+            self.assertEqual(trace.stats.starttime,
+                             expected_trace.stats.starttime)
+            self.assertEqual(trace.data.tolist(), expected_trace.data.tolist())
+
+    def test_write_mseed_reads_once_per_cut(self):
+        # Das_t and Time_t are read once per cut, not once per piece
+        self.ph5_object = ph5api.PH5(
+            path=os.path.join(self.home, 'ph5/test_data/ph5'),
+            nickname='master.ph5')
+        buf = io.BytesIO()
+        for stream in PH5toMSeed(self.ph5_object, station_id=['8001'],
+                                 notimecorrect=True).process_all():
+            stream.write(buf, format='MSEED', reclen=512)
+        ph5ms = PH5toMSeed(self.ph5_object, station_id=['8001'],
+                           notimecorrect=True)
+        cuts = list(PH5toMSeed(self.ph5_object, station_id=['8001'],
+                               notimecorrect=True).create_cut_list())
+        self.assertEqual(3, len(cuts))
+        self.assertGreater(len(ph5ms.split_cut(cuts[0], 7)), 1)
+        with patch.object(self.ph5_object, 'read_time_t',
+                          wraps=self.ph5_object.read_time_t) as read_time_t:
+            with patch.object(self.ph5_object, 'query_das_t',
+                              wraps=self.ph5_object.query_das_t) as query:
+                streamed = io.BytesIO()
+                ph5ms.write_mseed(streamed, reclen=512, piece_len=7)
+        self.assertLessEqual(read_time_t.call_count, len(cuts))
+        # create_cut_list checks each cut with query_das_t as well
+        cut_queries = [c for c in query.call_args_list
+                       if c[1].get('check_samplerate') is False]
+        self.assertEqual(len(cuts), len(cut_queries))
+        self.assertEqual(len(buf.getvalue()), len(streamed.getvalue()))
+
+    def test_write_mseed_processes(self):
+        # worker processes write the same records, --epoch logs each cut
+        self.ph5_object = ph5api.PH5(
+            path=os.path.join(self.home, 'ph5/test_data/ph5'),
+            nickname='master.ph5')
+        streamed = io.BytesIO()
+        PH5toMSeed(self.ph5_object, station_id=['8001']).write_mseed(
+            streamed, reclen=512, piece_len=7)
+        pstreamed = io.BytesIO()
+        log = io.BytesIO()
+        PH5toMSeed(self.ph5_object, station_id=['8001']).write_mseed(
+            pstreamed, reclen=512, piece_len=7, processes=2, log=log)
+        self.assertTrue(streamed.getvalue())
+        self.assertEqual(streamed.getvalue(), pstreamed.getvalue())
+        streams = list(PH5toMSeed(self.ph5_object,
+                                  station_id=['8001']).process_all())
+        self.assertEqual(
+            ["{:>32} {:>32}".format(s.traces[0].stats['starttime'],
+                                    s.traces[0].stats['endtime'])
+             for s in streams],
+            log.getvalue().splitlines())
+
     def test_mismatch_sample_rate(self):
         ph5test_srpath = os.path.join(self.home,
                                       'ph5/test_data/ph5/samplerate')
@@ -264,7 +354,7 @@ class TestPH5toMSeed_SRM(TempDirTestCase, LogTestCase):
                 ph5toms.create_trace(cut)
         self.assertEqual(context.exception.errno, errno)
         self.assertEqual(context.exception.msg, errmsg)
-        self.ph5_object.ph5.close()
+        self.ph5_object.close()
 
     def test_create_cut_list_srm0(self):
         # sample_rate_multiplier_i=0
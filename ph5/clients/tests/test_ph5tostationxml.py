@@ -262,6 +262,8 @@ class TestPH5toStationXMLParser_response(LogTestCase, TempDirTestCase):
 
     def tearDown(self):
         self.mng.ph5.close()
+        # test_create_obs_network changes the Array_t rows of the index
+        ph5tostationxml.STATION_INDEXES.clear()
         super(TestPH5toStationXMLParser_response, self).tearDown()
 
     def test_get_response_inv(self):
@@ -345,6 +347,20 @@ class TestPH5toStationXMLParser_response(LogTestCase, TempDirTestCase):
                   "(check doesn't include [cha]).", 'error')
                  ]))
 
+    def test_read_response(self):
+        cache = ph5tostationxml.RESPONSE_CACHE
+        cache.clear()
+        hits = cache.hits
+        name = '/Experiment_g/Responses_g/gs11v'
+        response = self.parser.read_response(name)
+        self.assertIsInstance(response, inv.response.Response)
+        self.assertEqual(hits, cache.hits)
+        # parsed once, the next request gets a copy
+        cached = self.parser.read_response(name)
+        self.assertEqual(hits + 1, cache.hits)
+        self.assertIsNot(response, cached)
+        self.assertEqual(str(response), str(cached))
+
     def test_get_response_inv_emp_resp(self):
         # emp_resp = True => return empty response if no resp data to return
         # No response entry for n_i=7
@@ -558,6 +574,94 @@ class TestPH5toStationXMLParser_location(LogTestCase, TempDirTestCase):
             self.assertEqual(ret.stations[0].code, '1115')
 
 
+class TestPH5StationIndex(LogTestCase, TempDirTestCase):
+    def setUp(self):
+        super(TestPH5StationIndex, self).setUp()
+        kef_to_ph5(self.tmpdir,
+                   'master.ph5',
+                   os.path.join(self.home, "ph5/test_data/metadata"),
+                   ["array_latlon_err.kef", "experiment.kef",
+                    "response_t.kef"])
+        self.ph5sxml, self.mng, self.parser = getParser(
+            self.tmpdir, 'master.ph5', "NETWORK",
+            34, 40, -111, -105, 36, -107, 0, 3)
+
+    def tearDown(self):
+        self.mng.ph5.close()
+        super(TestPH5StationIndex, self).tearDown()
+
+    def test_select(self):
+        self.parser.add_ph5_stationids()
+        index = self.parser.station_index
+        self.assertEqual(['1113', '1114', '1115'],
+                         index.get_ph5_station_ids(['111[3-5]']))
+        # 1111 and 1112 have location errors, 1116 is in the box and
+        # latitude band of the radius but outside of the radius
+        self.assertEqual(['1111', '1112', '1115', '1116'],
+                         [e.sta_id for e in index.select(self.ph5sxml[0])])
+
+        request = ph5tostationxml.PH5toStationXMLRequest(
+            station_list=['1113', '1117'], channel_list=['GP?'],
+            start_time='2019-01-01T00:00:00')
+        request.ph5_station_id_list = index.get_ph5_station_ids(
+            request.station_list)
+        self.assertEqual(['1113', '1117'],
+                         [e.sta_id for e in index.select(request)])
+        request.channel_list = ['DP?']
+        self.assertEqual([], index.select(request))
+
+    def test_cache(self):
+        ph5tostationxml.STATION_INDEXES.clear()
+        misses = ph5tostationxml.STATION_INDEXES.misses
+        index = self.parser.get_station_index()
+        self.assertEqual(misses + 1, ph5tostationxml.STATION_INDEXES.misses)
+        self.mng.ph5.close()
+
+        # the next request on the experiment uses the same index
+        self.ph5sxml, self.mng, self.parser = getParser(
+            self.tmpdir, 'master.ph5', "STATION")
+        self.assertIs(index, self.parser.get_station_index())
+        self.assertIn('Array_t_001', self.mng.ph5.Array_t)
+        ret = self.parser.read_networks()
+        self.assertEqual(['1113', '1114', '1115', '1116', '1117'],
+                         [s.code for s in ret.stations])
+        self.mng.ph5.close()
+
+        # and a new one once master.ph5 changes
+        st = os.stat('master.ph5')
+        os.utime('master.ph5', (st.st_atime, st.st_mtime + 10))
+        self.ph5sxml, self.mng, self.parser = getParser(
+            self.tmpdir, 'master.ph5', "STATION")
+        self.assertIsNot(index, self.parser.get_station_index())
+
+
+class TestPH5toStationXML_processes(LogTestCase, TempDirTestCase):
+    def test_run_ph5_to_stationxml(self):
+        ph5tostationxml.STATION_INDEXES.clear()
+        ph5path = os.path.join(self.home, 'ph5/test_data/ph5')
+        paths = [ph5path, os.path.join(ph5path, 'response_table_n_i'),
+                 ph5path]
+        args_dict_list = [{'emp_resp': True, 'stationxml_on_error': True}]
+
+        def run(processes):
+            with LogCapture() as log:
+                log.setLevel(logging.INFO)
+                inv = ph5tostationxml.run_ph5_to_stationxml(
+                    paths, 'master.ph5', 'STATIONXML', 'CHANNEL', '',
+                    args_dict_list, processes)
+                return inv, [rec.getMessage() for rec in log.records]
+
+        serial, serial_log = run(1)
+        pool, pool_log = run(2)
+        # networks and log in the same order as a serial run
+        self.assertEqual(3, len(pool.networks))
+        self.assertEqual([n.stations for n in serial.networks],
+                         [n.stations for n in pool.networks])
+        self.assertEqual(serial_log, pool_log)
+        self.assertEqual('CHECKING ' + os.path.join(paths[1], 'master.ph5'),
+                         pool_log[3])
+
+
 class TestPH5toStationXML_Response_NI_MISMATCH(LogTestCase, TempDirTestCase):
     def test_Response_NI_MISMATCH(self):
         # Uncomment line 401 and comment line 402 to prove test
@@ -0,0 +1,268 @@
+'''
+Availability_t, the contiguous spans of data of each station channel in
+/Experiment_g/Sorts_g so data availability can be answered without
+reading every Das_t.
+
+There is a row for each span of each Array_t station, SEED channel, DAS
+channel and sample rate. The spans are merged from Das_t the way
+ph5api.PH5.get_availability merges them, gaps are between the spans of a
+channel, overlaps are counted in overlap_count_i.
+
+   ph5 = ph5api.PH5(path=path, nickname='master.ph5', editmode=True)
+   write(ph5, build(ph5))     # index_availability_t
+   update(ph5, dases)         # after the Das_t of dases changed
+   is_current(ph5)            # Array_t has not changed since
+
+The raw data loaders call refresh when they are done. A hash of the
+FINGERPRINT_COLUMNS of each Array_t table is stored with Availability_t,
+if they change it is out of date until it is built again.
+'''
+
+import hashlib
+import logging
+import os
+
+import numpy as np
+
+from ph5.core import ph5api
+
+PROG_VERSION = '2026.290'
+LOGGER = logging.getLogger(__name__)
+
+# Availability_t is sorted on these, a row is unique on them
+SORT_KEYS = ('array_name_s', 'seed_station_name_s', 'seed_location_code_s',
+             'seed_channel_code_s', 'sample_rate_i', 'das/serial_number_s',
+             'channel_number_i', 'start_epoch_d')
+# Availability_t attribute of the Array_t the table was built from
+FINGERPRINT_ATTR = 'array_t_fingerprint'
+# Array_t columns Availability_t rows are built from
+FINGERPRINT_COLUMNS = ('das/serial_number_s', 'channel_number_i',
+                       'deploy_time/epoch_l', 'deploy_time/micro_seconds_i',
+                       'pickup_time/epoch_l', 'pickup_time/micro_seconds_i',
+                       'id_s', 'seed_station_name_s', 'seed_location_code_s',
+                       'seed_band_code_s', 'seed_instrument_code_s',
+                       'seed_orientation_code_s', 'sample_rate_i',
+                       'sample_rate_multiplier_i')
+
+
+def table_hash(t):
+    '''   MD5 of the number of rows and the FINGERPRINT_COLUMNS of Array_t
+          table t
+    '''
+    md5 = hashlib.md5(str(t.nrows))
+    for name in FINGERPRINT_COLUMNS:
+        if name in t.colpathnames:
+            md5.update(name)
+            md5.update(t.read(field=name).tostring())
+
+    return md5.hexdigest()
+
+
+def fingerprint(ph5):
+    '''   Names and table_hash of the Array_t tables as a string   '''
+    sorts = ph5.ph5_g_sorts
+    nodes = sorts.ph5.walk_nodes('/Experiment_g/Sorts_g', classname='Table')
+    nodes = [n for n in nodes if sorts.Array_tRE.match(n._v_name)]
+
+    return ' '.join('{0}:{1}'.format(t._v_name, table_hash(t))
+                    for t in sorted(nodes, key=lambda t: t._v_name))
+
+
+def stored_fingerprint(ph5):
+    '''   Fingerprint of the Array_t Availability_t was built from, None if
+          there is no Availability_t or it has none
+    '''
+    t = ph5.ph5_g_sorts.ph5_t_availability
+    if t is None or FINGERPRINT_ATTR not in t.attrs:
+        return None
+
+    return t.attrs[FINGERPRINT_ATTR]
+
+
+def is_current(ph5):
+    '''   True if there is an Availability_t built from the Array_t tables
+          as they are now
+    '''
+    stored = stored_fingerprint(ph5)
+
+    return stored is not None and stored == fingerprint(ph5)
+
+
+def seed_codes(st):
+    '''   SEED station, location and channel of an Array_t row   '''
+    if 'seed_station_name_s' in st:
+        station = st['seed_station_name_s']
+    else:
+        station = st['id_s']
+    channel = st.get('seed_band_code_s', 'D') + \
+        st.get('seed_instrument_code_s', 'P') + \
+        st.get('seed_orientation_code_s', 'X')
+
+    return station, st.get('seed_location_code_s', ''), channel
+
+
+def spans(das_t):
+    '''   Merge Das_t rows of one channel and sample rate sorted on start
+          time into contiguous spans, das_t is columns.Records or a list
+          of row dictionaries.
+          Returns a list of dictionaries keyed on start_epoch_d,
+          end_epoch_d, sample_count_l and overlap_count_i
+    '''
+    if not len(das_t):
+        return []
+    starts, lengths, rates = ph5api.das_t_windows(das_t)
+    first, last, used = ph5api.merge_windows(starts, lengths, rates)
+    counts = ph5api.das_t_col(das_t, 'sample_count_i').astype(np.int64)
+    # Windows left out of a span are between its first window and the
+    # first window of the next span
+    sample_counts = np.add.reduceat(np.where(used, counts, 0), first)
+    overlap_counts = np.add.reduceat((~used).astype(np.int32), first)
+
+    return [{'start_epoch_d': start,
+             'end_epoch_d': end,
+             'sample_count_l': sample_count,
+             'overlap_count_i': overlap_count}
+            for start, end, sample_count, overlap_count in
+            zip(starts[first].tolist(),
+                (starts[last] + lengths[last]).tolist(),
+                sample_counts.tolist(),
+                overlap_counts.tolist())]
+
+
+def station_rows(ph5, array_name, st, das_t):
+    '''   Availability_t rows of Array_t row st, das_t is the Das_t of its
+          DAS as columns.Records sorted on epoch
+    '''
+    das = st['das/serial_number_s']
+    chan = st['channel_number_i']
+    in_deployment = ph5.query_das_t(
+        das,
+        chan=chan,
+        start_epoch=st['deploy_time/epoch_l'],
+        stop_epoch=st['pickup_time/epoch_l'],
+        sample_rate=st['sample_rate_i'],
+        sample_rate_multiplier=st['sample_rate_multiplier_i'],
+        check_samplerate=False)
+    if not in_deployment:
+        return []
+    rates = set([d['sample_rate_i'] for d in in_deployment])
+    if st['sample_rate_i'] in rates:
+        sample_rate = st['sample_rate_i']
+    elif len(rates) == 1:
+        sample_rate = rates.pop()
+        LOGGER.warning("Using sample rate from DAS Table for {0} "
+                       "channel {1}. Sample rates in DAS and Array tables "
+                       "are not consistent.".format(das, chan))
+    else:
+        LOGGER.error("DAS and Array Table sample rates do not match for "
+                     "{0} channel {1}, DAS table sample rates do not "
+                     "match. Data must be updated.".format(das, chan))
+        return []
+
+    srs = das_t.col('sample_rate_i')
+    if sample_rate > 0:
+        keep = srs // das_t.col('sample_rate_multiplier_i') == sample_rate
+    else:
+        keep = srs == sample_rate
+    das_t = das_t[keep & (das_t.col('channel_number_i') == chan)]
+    if not das_t:
+        return []
+
+    station, location, channel = seed_codes(st)
+    rows = []
+    for span in spans(das_t):
+        span.update({'array_name_s': array_name,
+                     'seed_station_name_s': station,
+                     'seed_location_code_s': location,
+                     'seed_channel_code_s': channel,
+                     'das/serial_number_s': das,
+                     'channel_number_i': chan,
+                     'sample_rate_i': sample_rate,
+                     'sample_rate_multiplier_i':
+                         das_t.col('sample_rate_multiplier_i')[0].item()})
+        rows.append(span)
+
+    return rows
+
+
+def build(ph5, dases=None):
+    '''   Availability_t rows of all Array_t stations, or only of those
+          with a DAS in dases
+    '''
+    ph5.read_array_t_names()
+    stations = {}
+    for array_name in sorted(ph5.Array_t_names):
+        array_t, keys = ph5.ph5_g_sorts.read_arrays(array_name)
+        for st in array_t:
+            das = st['das/serial_number_s']
+            if dases is None or das in dases:
+                stations.setdefault(das, []).append((array_name, st))
+
+    rows = []
+    seen = set()
+    # Each Das_t is read once
+    for das in sorted(stations):
+        das_t = ph5.read_das_t(das, as_array=True)
+        if not das_t:
+            LOGGER.warning("No Das table found for {0}".format(das))
+            continue
+        for array_name, st in stations[das]:
+            for r in station_rows(ph5, array_name, st, das_t):
+                key = tuple(r[k] for k in SORT_KEYS)
+                if key not in seen:
+                    seen.add(key)
+                    rows.append(r)
+        ph5.forget_das_t(das)
+
+    return rows
+
+
+def write(ph5, rows, array_t=None):
+    '''   Replace Availability_t with rows, array_t is the fingerprint
+          stored with it, of the Array_t tables now if None
+    '''
+    if array_t is None:
+        array_t = fingerprint(ph5)
+    rows = sorted(rows, key=lambda r: tuple(r[k] for k in SORT_KEYS))
+    ph5.ph5_g_sorts.nuke_availability_t()
+    t = ph5.ph5_g_sorts.newAvailability_t()
+    t.attrs[FINGERPRINT_ATTR] = array_t
+    if rows:
+        ph5.ph5_g_sorts.populateAvailability_t(rows)
+
+
+def update(ph5, dases):
+    '''   Rebuild the Availability_t rows of dases, if there is an
+          Availability_t. Returns True if it was updated.
+    '''
+    if ph5.ph5_g_sorts.ph5_t_availability is None:
+        return False
+    # Rows of other DASes are not rebuilt, so an out of date table
+    # keeps its fingerprint
+    array_t = None
+    if not is_current(ph5):
+        LOGGER.warning("Availability_t is out of date with Array_t. Run "
+                       "index_availability_t to build it again.")
+        array_t = stored_fingerprint(ph5) or ''
+    dases = set(dases)
+    rows, keys = ph5.ph5_g_sorts.read_availability()
+    rows = [r for r in rows if r['das/serial_number_s'] not in dases]
+    rows.extend(build(ph5, dases))
+    write(ph5, rows, array_t)
+
+    return True
+
+
+def refresh(filename, dases):
+    '''   Update the Availability_t of master.ph5 filename after a loader
+          wrote the Das_t of dases   '''
+    if not dases:
+        return
+    path, nickname = os.path.split(filename)
+    ph5 = ph5api.PH5(path=path or '.', nickname=nickname, editmode=True)
+    try:
+        if update(ph5, dases):
+            LOGGER.info("Updated Availability_t for {0} DAS(es)."
+                        .format(len(dases)))
+    finally:
+        ph5.close()
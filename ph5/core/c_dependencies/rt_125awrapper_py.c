@@ -60,9 +60,112 @@ rt_125a_data_decode (PyObject *self, PyObject *args)
   return PyTuple_FromArray ((long int *) data, num);
 
 } 
- 
+
+/*   Bytes in a TRD page   */
+#define PAGE_SIZE 528
+/*   Bytes in a page header   */
+#define PAGE_HEADER 6
+/*   int32 columns returned for each page by read_pages   */
+#define PAGE_COLUMNS 15
+
+/*
+ *   Decode all of the pages in a buffer at once.
+ *   Returns a (pages, PAGE_COLUMNS) int32 array of page headers and an
+ *   int32 array of the samples of all data pages in page order. See
+ *   pn125.PAGE_COLUMNS for the columns.
+ */
+PyObject *
+rt_125a_read_pages (PyObject *self, PyObject *args)
+{
+  const void *vbuf;
+  const uint8_t *buf;
+  Py_ssize_t len, num_pages, i;
+  npy_intp dims[2], total = 0;
+  PyObject *input;
+  PyArrayObject *headers, *samples;
+  int32_t *h, *data;
+
+  if (! PyArg_ParseTuple (args, "O", &input))
+    return NULL;
+
+  if (PyObject_AsReadBuffer (input, &vbuf, &len) != 0)
+    return NULL;
+
+  buf = (const uint8_t *) vbuf;
+  num_pages = len / PAGE_SIZE;
+
+  dims[0] = num_pages; dims[1] = PAGE_COLUMNS;
+  headers = (PyArrayObject *) PyArray_SimpleNew (2, dims, NPY_INT32);
+  if (headers == NULL)
+    return NULL;
+
+  h = (int32_t *) PyArray_DATA (headers);
+
+  /*   Page headers and the number of samples of each data page   */
+  for (i = 0; i < num_pages; i++, h += PAGE_COLUMNS) {
+    const uint8_t *p = buf + i * PAGE_SIZE;
+    const uint8_t *b = p + PAGE_HEADER;
+    int j, skip = 4;
+
+    h[0] = p[0];
+    h[1] = (p[1] << 8) + p[2];
+    h[2] = (p[3] << 8) + p[4];
+    h[3] = p[5];
+    for (j = 4; j < PAGE_COLUMNS; j++)
+      h[j] = -1;
+
+    if (h[0] != 3)
+      continue;
+
+    /*   Gain, event number, samples in page   */
+    h[4] = b[0];
+    h[5] = (b[1] << 8) + b[2];
+    h[6] = b[3];
+    /*   First page or extended header flag   */
+    if (h[3] & 0x05) {
+      h[7] = b[4] + 1984;
+      h[8] = b[5] * 100 + b[6] + 1;
+      h[9] = b[7];
+      h[10] = b[8];
+      h[11] = b[9];
+      h[12] = (b[10] << 8) + b[11];
+      skip += 9;
+    }
+
+    /*   Keep to the page   */
+    h[14] = h[6];
+    if (h[14] * 3 > PAGE_SIZE - PAGE_HEADER - skip)
+      h[14] = (PAGE_SIZE - PAGE_HEADER - skip) / 3;
+    h[13] = (int32_t) total;
+    total += h[14];
+  }
+
+  dims[0] = total;
+  samples = (PyArrayObject *) PyArray_SimpleNew (1, dims, NPY_INT32);
+  if (samples == NULL) {
+    Py_DECREF (headers);
+    return NULL;
+  }
+
+  data = (int32_t *) PyArray_DATA (samples);
+  h = (int32_t *) PyArray_DATA (headers);
+
+  Py_BEGIN_ALLOW_THREADS
+  for (i = 0; i < num_pages; i++, h += PAGE_COLUMNS) {
+    if (h[13] < 0)
+      continue;
+
+    cvt24to32 ((uint8_t *) buf + i * PAGE_SIZE + PAGE_HEADER +
+               (h[3] & 0x05 ? 13 : 4), data + h[13], h[14]);
+  }
+  Py_END_ALLOW_THREADS
+
+  return Py_BuildValue ("NN", headers, samples);
+}
+
 static PyMethodDef rt_125amethods[] = {
   { "data_decode", rt_125a_data_decode, METH_VARARGS, "Decode a packet of 24 bit ints to a list of 32 bit ints."},
+  { "read_pages", rt_125a_read_pages, METH_VARARGS, "Decode the page headers and data of all pages in a buffer."},
   { NULL, NULL, 0, NULL } 
 };
 
@@ -70,4 +173,5 @@ PyMODINIT_FUNC
 initrt_125a_py (void)
 {
   (void) Py_InitModule ("rt_125a_py", rt_125amethods);
+  import_array ();
 }
\ No newline at end of file
@@ -249,6 +249,161 @@ rt_130_bcd2int (PyObject *self, PyObject *args)
 
 }
 
+/*   Bytes in an rt-130 packet   */
+#define PACKET_SIZE 1024
+/*   int32 columns returned for each packet by read_packets   */
+#define PACKET_COLUMNS 20
+
+/*
+ *   Number of int32 values read_packets keeps for a data packet, -1 if
+ *   the data can't be decoded. Steim data is followed by x0 and xn as
+ *   returned by read_steim1 and read_steim2.
+ */
+static Py_ssize_t
+decoded_size (DataHeader *dh)
+{
+  switch (dh->data_format) {
+    case 0x16:
+      return dh->samples <= (PACKET_SIZE - 24) / 2 ? dh->samples : -1;
+    case 0x32:
+      return dh->samples <= (PACKET_SIZE - 24) / 4 ? dh->samples : -1;
+    case 0xc0:
+    case 0xc2:
+      return dh->samples + 2;
+    default:
+      return -1;
+  }
+}
+
+/*
+ *   Decode all of the packets in a buffer at once.
+ *   Returns a (packets, PACKET_COLUMNS) int32 array of packet headers
+ *   and an int32 array of the samples of all data packets. See
+ *   rt_130_h.decode_packets for the columns.
+ */
+PyObject *
+rt_130_read_packets (PyObject *self, PyObject *args)
+{
+  const void *vbuf;
+  const unsigned char *buf;
+  Py_ssize_t len, num_packets, i;
+  npy_intp dims[2], total = 0;
+  PyObject *input;
+  PyArrayObject *headers, *samples;
+  int32_t *h, *data;
+  unsigned char packet[PACKET_SIZE + 64];   /*   Steim reads past 1024   */
+
+  if (! PyArg_ParseTuple (args, "O", &input))
+    return NULL;
+
+  if (PyObject_AsReadBuffer (input, &vbuf, &len) != 0)
+    return NULL;
+
+  buf = (const unsigned char *) vbuf;
+  num_packets = len / PACKET_SIZE;
+
+  /*   Size of the decoded data   */
+  for (i = 0; i < num_packets; i++) {
+    const unsigned char *p = buf + i * PACKET_SIZE;
+    DataHeader dh;
+    Py_ssize_t size;
+
+    if (p[0] != 'D' || p[1] != 'T')
+      continue;
+
+    parse_data_header ((unsigned char *) p, &dh);
+    size = decoded_size (&dh);
+    if (size > 0)
+      total += size;
+  }
+
+  dims[0] = num_packets; dims[1] = PACKET_COLUMNS;
+  headers = (PyArrayObject *) PyArray_SimpleNew (2, dims, NPY_INT32);
+  if (headers == NULL)
+    return NULL;
+
+  dims[0] = total;
+  samples = (PyArrayObject *) PyArray_SimpleNew (1, dims, NPY_INT32);
+  if (samples == NULL) {
+    Py_DECREF (headers);
+    return NULL;
+  }
+
+  h = (int32_t *) PyArray_DATA (headers);
+  data = (int32_t *) PyArray_DATA (samples);
+  memset (packet + PACKET_SIZE, 0, 64);
+  total = 0;
+
+  Py_BEGIN_ALLOW_THREADS
+  for (i = 0; i < num_packets; i++, h += PACKET_COLUMNS) {
+    const unsigned char *p = buf + i * PACKET_SIZE;
+    PacketHeader ph;
+    DataHeader dh;
+    Py_ssize_t size;
+    int32_t x0 = 0, xn = 0;
+    int j;
+
+    parse_packet_header ((unsigned char *) p, &ph);
+    h[0] = ph.experiment_number;
+    h[1] = ph.year;
+    h[2] = ph.unit_id_number;
+    h[3] = ph.doy;
+    h[4] = ph.hh;
+    h[5] = ph.mm;
+    h[6] = ph.ss;
+    h[7] = ph.ttt;
+    h[8] = ph.byte_count;
+    h[9] = ph.packet_sequence;
+    for (j = 10; j < PACKET_COLUMNS; j++)
+      h[j] = -1;
+
+    if (p[0] != 'D' || p[1] != 'T')
+      continue;
+
+    parse_data_header ((unsigned char *) p, &dh);
+    h[10] = dh.event_number;
+    h[11] = dh.stream_number;
+    h[12] = dh.channel_number;
+    h[13] = dh.samples;
+    h[14] = dh.flags;
+    h[15] = dh.data_format;
+
+    size = decoded_size (&dh);
+    if (size < 0)
+      continue;
+
+    switch (dh.data_format) {
+      case 0x16:
+        parse_int16 ((uint8_t *) p, data + total, dh.samples);
+        break;
+      case 0x32:
+        parse_int32 ((uint8_t *) p, data + total, dh.samples);
+        break;
+      case 0xc0:
+        memcpy (packet, p, PACKET_SIZE);
+        if (parse_steim1 (packet, data + total, dh.samples, &x0, &xn) != 0)
+          fprintf (stderr, "Warning: Steim1 raw data decompression error. Data from RefTek packet garbled.\n");
+        data[total + dh.samples] = x0; data[total + dh.samples + 1] = xn;
+        break;
+      case 0xc2:
+        memcpy (packet, p, PACKET_SIZE);
+        if (parse_steim2 (packet, data + total, dh.samples, &x0, &xn) != 0)
+          fprintf (stderr, "Warning: Steim2 raw data decompression error. Data from RefTek packet garbled.\n");
+        data[total + dh.samples] = x0; data[total + dh.samples + 1] = xn;
+        break;
+    }
+    h[16] = (int32_t) total;
+    h[17] = dh.samples;
+    h[18] = x0;
+    h[19] = xn;
+    total += size;
+  }
+  Py_END_ALLOW_THREADS
+
+  return Py_BuildValue ("NN", headers, samples);
+
+}
+
 static PyMethodDef rt_130methods[] = {
   { "get_packet_header", rt_130_parse_packet_header, METH_VARARGS, "Parse an rt-130 packet header and return the contents." },
   { "get_data_header", rt_130_parse_data_header, METH_VARARGS, "Parse an rt-130 data packet header and return the contents." },
@@ -257,6 +412,7 @@ static PyMethodDef rt_130methods[] = {
   { "read_steim1", rt_130_parse_steim1, METH_VARARGS, "Parse steim1 compressed data from an rt-130 data packet."},
   { "read_steim2", rt_130_parse_steim2, METH_VARARGS, "Parse steim2 compressed data from an rt-130 data packet."},
   { "bcd2int", rt_130_bcd2int, METH_VARARGS, "Pass in a char buf in BCD and return an int"},
+  { "read_packets", rt_130_read_packets, METH_VARARGS, "Decode all rt-130 packets in a buffer, return header and sample arrays."},
   { NULL, NULL, 0, NULL } 
 };
 
@@ -264,4 +420,5 @@ PyMODINIT_FUNC
 initrt_130_py (void)
 {
   (void) Py_InitModule ("rt_130_py", rt_130methods);
+  import_array ();
 }
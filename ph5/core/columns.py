@@ -67,6 +67,7 @@
 # Steve Azevedo, August 21, 2006
 #
 
+import numpy
 import tables
 import types
 import os
@@ -693,6 +694,29 @@ class Response (tables.IsDescription):
     response_file_sensor_a = tables.StringCol(128)  # Sensor Response file name
 
 
+class Availability (tables.IsDescription):
+    '''   Contiguous span of data of a station channel, see
+          ph5.core.availability   '''
+    array_name_s = tables.StringCol(16, pos=1)  # Array_t_xxx of the station
+    seed_station_name_s = tables.StringCol(16, pos=2)
+    seed_location_code_s = tables.StringCol(2, pos=3)
+    seed_channel_code_s = tables.StringCol(3, pos=4)
+
+    class das (tables.IsDescription):
+        _v_pos = 5
+        serial_number_s = tables.StringCol(64, pos=1)
+
+    channel_number_i = tables.Int8Col(pos=6)
+    # Sample rate as in Das_t
+    sample_rate_i = tables.Int16Col(pos=7)
+    sample_rate_multiplier_i = tables.Int16Col(pos=8)
+    start_epoch_d = tables.Float64Col(pos=9)  # Time of first sample
+    end_epoch_d = tables.Float64Col(pos=10)  # Time after last sample
+    sample_count_l = tables.Int64Col(pos=11)  # Samples in span
+    # Das_t windows in span that overlap the windows before them
+    overlap_count_i = tables.Int32Col(pos=12)
+
+
 #
 # -=-=-=-=-=-=-=-=-=-= Mixins =-=-=-=-=-=-=-=-=-=-
 #
@@ -742,6 +766,76 @@ def rowstolist(rows, keys):
     return retl
 
 
+def recordstolist(records, keys):
+    '''
+          Like rowstolist but for a numpy structured array as returned by
+          table.read or table.read_coordinates. Nested columns are found
+          by splitting the key on '/'. Values are returned as python types.
+    '''
+    cols = {}
+    for k in keys:
+        col = records
+        for name in k.split('/'):
+            col = col[name]
+        cols[k] = col.tolist()
+
+    retl = []
+    for i in xrange(len(records)):
+        retd = {}
+        for k in keys:
+            retd[k] = cols[k][i]
+
+        retl.append(retd)
+
+    return retl
+
+
+class Records(object):
+    '''
+          A table read into a numpy structured array. Acts like the list of
+          row dictionaries returned by rowstolist, but each dictionary is
+          only made when it is asked for. Whole columns are available as
+          numpy arrays with col.
+    '''
+    __slots__ = ('records', 'keys')
+
+    def __init__(self, records, keys):
+        self.records = records
+        self.keys = keys
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        for i in xrange(len(self.records)):
+            yield self.row(i)
+
+    def __getitem__(self, i):
+        #   An index returns a row dictionary, a slice, mask or list of
+        #   indexes returns Records
+        if isinstance(i, (int, long, numpy.integer)):
+            return self.row(i)
+
+        return Records(self.records[i], self.keys)
+
+    def row(self, i):
+        '''   Return row i as a dictionary of python types   '''
+        rec = self.records[i]
+        retd = {}
+        for k in self.keys:
+            retd[k] = _column(rec, k).item()
+
+        return retd
+
+    def col(self, key):
+        '''   Return the column for key as a numpy array   '''
+        return _column(self.records, key)
+
+    def tolist(self):
+        '''   Return all rows as a list of dictionaries   '''
+        return recordstolist(self.records, self.keys)
+
+
 def _flatten(sequence, result=None, pre=None):
     '''
           Read in a nested list sequence as returned by table.colnames
@@ -885,40 +979,45 @@ def _cast(vtype, val):
     return val
 
 
-def search(ltable, key, value):
-    # XXX   More sophisticated searches using table.where???
-    if isinstance(value, types.StringType):
-        v = value.strip()
+def _key_value(val):
+    '''   Value of a key as compared by search, lindex and update   '''
+    if isinstance(val, types.StringType):
+        return val.strip()
 
-    for r in ltable.iterrows():
-        if isinstance(r[key], types.StringType):
-            rk = r[key].strip()
-        else:
-            rk = str(r[key])
+    return str(val)
 
-        if rk == v:
-            return r
 
-    return None
+def key_rows(ltable, key):
+    '''
+          Read the column key of ltable once and map each value to the
+          list of row numbers that have it.
+    '''
+    ret = {}
+    for i, val in enumerate(ltable.col(key).tolist()):
+        rk = _key_value(val)
+        if rk not in ret:
+            ret[rk] = []
+        ret[rk].append(i)
 
+    return ret
 
-def lindex(ltable, value, key):
-    if isinstance(value, types.StringType):
-        v = value.strip()
 
-    i = 0
-    for r in ltable.iterrows():
-        if isinstance(r[key], types.StringType):
-            rk = r[key].strip()
-        else:
-            rk = str(r[key])
+def search(ltable, key, value):
+    '''   Return the first row of ltable with key matching value   '''
+    i = lindex(ltable, value, key)
+    if i is None:
+        return None
 
-        if rk == v:
-            return i
-        else:
-            i = i + 1
+    return ltable[i]
 
-    return None
+
+def lindex(ltable, value, key):
+    '''   Return the row number of the first row with key matching value   '''
+    rows = key_rows(ltable, key).get(_key_value(value))
+    if not rows:
+        return None
+
+    return rows[0]
 
 
 def delete(ltable, value, key):
@@ -932,25 +1031,38 @@ def update(ltable, p, key):
     #
     # Find row and update
     #
-    if isinstance(p[key], types.StringType):
-        v = p[key].strip()
+    update_many(ltable, [p], key)
 
-    # Not sure why this does not work using the search proceedure above?
-    for r in ltable.iterrows():
-        if isinstance(r[key], types.StringType):
-            rk = r[key].strip()
-        else:
-            rk = str(r[key])
 
-        if rk == v:
+def update_many(ltable, rows, key):
+    '''
+          Update ltable from a list of key/value dictionaries. Every row
+          whose key column matches p[key] gets the values in p. The key
+          column is read once, the matching rows are changed in memory
+          and written back with one call.
+    '''
+    index = key_rows(ltable, key)
+    todo = []
+    for p in rows:
+        for i in index.get(_key_value(p[key]), []):
+            todo.append((i, p))
+
+    if todo:
+        coords = sorted(set([i for i, p in todo]))
+        where = dict([(c, j) for j, c in enumerate(coords)])
+        records = ltable.read_coordinates(coords)
+        # Not all columns need exist, bad values raise
+        names = set(ltable.colpathnames)
+        for i, p in todo:
             for k in p.keys():
+                if k not in names:
+                    continue
                 try:
-                    r.__setitem__(k, p[k])
+                    _column(records, k)[where[i]] = p[k]
                 except IndexError:
-                    # Not all columns need exist
                     pass
 
-            r.update()
+        ltable.modify_coordinates(coords, records)
 
     ltable.flush()
 
@@ -979,6 +1091,55 @@ def append(ltable, p):
     ltable.flush()
 
 
+def _column(records, key):
+    '''   Return the column of a structured array for a key such as
+          'time/epoch_l'
+    '''
+    col = records
+    for name in key.split('/'):
+        col = col[name]
+
+    return col
+
+
+def populate_many(ltable, rows):
+    '''   Append a list of key/value dictionaries to ltable.
+          The rows are converted to one numpy record array and appended
+          with a single call and a single flush. Values are cast as in
+          append, columns not set in a row keep their default.
+    '''
+    if not rows:
+        return
+
+    try:
+        vtypes = ltable.coltypes
+    except AttributeError:
+        vtypes = ltable.colstypes
+
+    records = numpy.empty(len(rows), dtype=ltable.dtype)
+    for k, dflt in ltable.coldflts.items():
+        _column(records, k)[:] = dflt
+
+    cols = {}
+    for i, p in enumerate(rows):
+        for k, val in p.items():
+            if k not in cols:
+                cols[k] = (_column(records, k), vtypes[k])
+            col, t = cols[k]
+            val = _cast(t, val)
+            if val is None:
+                continue
+
+            try:
+                col[i] = val
+            except Exception as e:
+                LOGGER.warning("Warning in populate_many: Exception \'%s\'"
+                               % e)
+
+    ltable.append(records)
+    ltable.flush()
+
+
 def is_mini(ltable):
     '''
        Check to see if this is an external file, and re-open 'a'
@@ -14,6 +14,7 @@ import sys
 import logging
 import string
 import re
+import collections
 from ph5.core import columns
 try:
     import importlib.reload as reload
@@ -23,6 +24,13 @@ except ImportError:
 PROG_VERSION = '2021.47'
 LOGGER = logging.getLogger(__name__)
 ZLIBCOMP = 6
+# Default size of ChunkCache, bytes
+CHUNK_CACHE_BYTES = 64 * 1024 * 1024
+# Reads spanning more chunks than this read their whole chunks without
+# ChunkCache
+CACHED_READ_CHUNKS = 4
+# Default number of mini ph5 files kept open by MiniPool
+MAX_OPEN_MINIS = 32
 
 os.environ['TZ'] = 'UTM'
 time.tzset()
@@ -34,7 +42,7 @@ def check_srm_valid(rows, keys, tablename, ignore_srm=False):
     """
     giving error when the table have sample_rate_multiplier_i=0
     or missing (pn3)
-    :param rows: rows of the table (list of dicts)
+    :param rows: rows of the table (list of dicts or columns.Records)
     :param keys: keys of the table (list of string)
     :param tablename: name of the table (string)
     :param ignore_srm: flag to ignore checking srm when it is True (boolean)
@@ -47,13 +55,17 @@ def check_srm_valid(rows, keys, tablename, ignore_srm=False):
                   "sample_rate_multiplier_i for PH5 data."
                   % tablename)
         raise HDF5InteractionError(7, errmsg)
-    for r in rows:
-        if r['sample_rate_multiplier_i'] == 0:
-            errmsg = ("%s has sample_rate_multiplier_i "
-                      "with value 0. Please run fix_srm to fix "
-                      "sample_rate_multiplier_i for PH5 data."
-                      % tablename)
-            raise HDF5InteractionError(7, errmsg)
+    if isinstance(rows, columns.Records):
+        # Check the column rather than make every row dictionary
+        srms = rows.col('sample_rate_multiplier_i').tolist()
+    else:
+        srms = [r['sample_rate_multiplier_i'] for r in rows]
+    if 0 in srms:
+        errmsg = ("%s has sample_rate_multiplier_i "
+                  "with value 0. Please run fix_srm to fix "
+                  "sample_rate_multiplier_i for PH5 data."
+                  % tablename)
+        raise HDF5InteractionError(7, errmsg)
 
 
 class HDF5InteractionError (Exception):
@@ -260,12 +272,15 @@ class SortsGroup:
                                # columns.Offset, source to receiver offsets
                                /Event_t(_[shotline])
                                # columns.Event, list of events
+                               /Availability_t
+                               # columns.Availability, spans of data
     '''
 
     def __init__(self, ph5):
         self.ph5 = ph5
         self.ph5_g_sorts = None
         self.ph5_t_sort = None
+        self.ph5_t_availability = None  # Only if master.ph5 has one
         self.ph5_t_array = {}  # Local cached nodes keyed on Array_t_xxx
         self.ph5_t_offset = {}  # Local cached nodes keyed on Offset_t_aaa_sss
         self.ph5_t_event = {}  # Local cached nodes keyed on Event_t_xxx
@@ -334,7 +349,8 @@ class SortsGroup:
 
         return ret, keys
 
-    def read_arrays(self, array_name, ignore_srm=False):
+    def read_arrays(self, array_name, ignore_srm=False, as_array=False):
+        '''   Read Array_t, as columns.Records if as_array is set   '''
         try:
             node = self.ph5_t_array[array_name]
         except KeyError:
@@ -344,7 +360,7 @@ class SortsGroup:
                 classname='Table')
             self.ph5_t_array[array_name] = node
 
-        ret, keys = read_table(node)
+        ret, keys = read_table(node, as_array=as_array)
         check_srm_valid(ret, keys, array_name, ignore_srm)
         return ret, keys
 
@@ -535,6 +551,7 @@ class SortsGroup:
         return names
 
     def populate(self, ref, p, key=[]):
+        '''   p is a dictionary, or a list of dictionaries to append   '''
         populate_table(ref, p, key)
 
         ref.flush()
@@ -551,6 +568,29 @@ class SortsGroup:
     def populateOffset_t(self, p, pkey=[], name='Offset_t'):
         self.populate(self.ph5_t_offset[name], p, pkey)
 
+    def newAvailability_t(self):
+        self.ph5_t_availability = initialize_table(self.ph5,
+                                                   '/Experiment_g/Sorts_g',
+                                                   'Availability_t',
+                                                   columns.Availability)
+
+        columns.add_reference('/Experiment_g/Sorts_g/Availability_t',
+                              self.ph5_t_availability)
+
+        return self.ph5_t_availability
+
+    def read_availability(self):
+        '''   Read Availability_t, no rows if there is none   '''
+        if self.ph5_t_availability is None:
+            return [], []
+
+        return read_table(self.ph5_t_availability)
+
+    def populateAvailability_t(self, p, pkey=[]):
+        if self.ph5_t_availability is None:
+            self.newAvailability_t()
+        self.populate(self.ph5_t_availability, p, pkey)
+
     def initgroup(self):
         # Create Sorts group
         self.ph5_g_sorts = initialize_group(
@@ -564,6 +604,10 @@ class SortsGroup:
 
         columns.add_reference('/Experiment_g/Sorts_g/Sort_t', self.ph5_t_sort)
 
+        # Availability_t is only made by newAvailability_t
+        if self.ph5.__contains__('/Experiment_g/Sorts_g/Availability_t'):
+            self.newAvailability_t()
+
         # Reference Offset table(s)   ***   See Offset_tRE   ***
         offsets = get_nodes_by_name(self.ph5,
                                     '/Experiment_g/Sorts_g',
@@ -626,6 +670,13 @@ class SortsGroup:
         except Exception:
             return False
 
+    def nuke_availability_t(self):
+        if self.ph5_t_availability is None:
+            return False
+        self.ph5_t_availability.remove()
+        self.ph5_t_availability = None
+        return True
+
     def nuke_offset_t(self, name='Offset_t'):
         # Remove the indexes before removing the table
         try:
@@ -660,6 +711,254 @@ class Data_Trace (object):
                  "data_trace", "receiver", "keys")
 
 
+class ChunkCache(object):
+    '''   Least recently used cache of chunks read from Data_a arrays
+          so overlapping reads only decompress a chunk once.
+          Keyed on (file name, array path, chunk index).
+          maxbytes -> Maximum bytes of chunk data kept
+          max_chunks -> Reads spanning more chunks than this, or more
+                        than maxbytes, read their whole chunks straight
+                        into the output, only the partly read chunks at
+                        either end go through the cache
+          nbytes -> Bytes of chunk data kept
+          hits -> Number of chunks found in the cache
+          misses -> Number of chunks read from the file
+          direct -> Number of reads of whole chunks made without the cache
+    '''
+
+    def __init__(self, maxbytes=CHUNK_CACHE_BYTES,
+                 max_chunks=CACHED_READ_CHUNKS):
+        self.maxbytes = maxbytes
+        self.max_chunks = max_chunks
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.direct = 0
+        self.chunks = collections.OrderedDict()
+
+    def clear(self):
+        self.chunks.clear()
+        self.nbytes = 0
+
+    def get_chunk(self, trace_ref, i):
+        '''   Return chunk i of trace_ref   '''
+        size = trace_ref.chunkshape[0]
+        start = i * size
+        stop = min(start + size, trace_ref.nrows)
+        key = (trace_ref._v_file.filename, trace_ref._v_pathname, i)
+        chunk = self.chunks.pop(key, None)
+        if chunk is not None:
+            if len(chunk) == stop - start:
+                # Most recently used is last
+                self.chunks[key] = chunk
+                self.hits += 1
+                return chunk
+            # Array has been appended to
+            self.nbytes -= chunk.nbytes
+
+        self.misses += 1
+        chunk = trace_ref.read(start, stop)
+        if chunk.nbytes <= self.maxbytes:
+            self.chunks[key] = chunk
+            self.nbytes += chunk.nbytes
+            while self.nbytes > self.maxbytes:
+                k, old = self.chunks.popitem(last=False)
+                self.nbytes -= old.nbytes
+
+        return chunk
+
+    def read(self, trace_ref, start=None, stop=None, out=None):
+        '''   Read trace_ref as trace_ref.read(start, stop, out=out) would,
+              one chunk at a time through the cache, or with large reads
+              the whole chunks with one read
+        '''
+        if start is not None and stop is None:
+            stop = start + 1
+        start, stop, step = slice(start, stop).indices(trace_ref.nrows)
+        n = max(stop - start, 0)
+        if out is None:
+            out = numpy.empty(n, dtype=trace_ref.atom.dtype)
+        elif len(out) != n:
+            raise ValueError("out must be {0} long".format(n))
+
+        size = trace_ref.chunkshape[0]
+        num_chunks = (stop + size - 1) // size - start // size
+        if num_chunks <= self.max_chunks and \
+                n * out.itemsize <= self.maxbytes:
+            self.read_chunks(trace_ref, start, stop, out)
+            return out
+
+        # First sample of the first whole chunk, and after the last. The
+        # last chunk of the array is whole if it is read to its end.
+        head = min(stop, (start + size - 1) // size * size)
+        tail = stop if stop == trace_ref.nrows else stop // size * size
+        tail = max(head, tail)
+        self.read_chunks(trace_ref, start, head, out[:head - start])
+        if tail > head:
+            trace_ref.read(head, tail, out=out[head - start:tail - start])
+            self.direct += 1
+        self.read_chunks(trace_ref, tail, stop, out[tail - start:])
+
+        return out
+
+    def read_chunks(self, trace_ref, start, stop, out):
+        '''   Read samples start to stop of trace_ref into out one chunk at
+              a time through the cache
+        '''
+        if stop <= start:
+            return
+        size = trace_ref.chunkshape[0]
+        i = 0
+        for c in xrange(start // size, (stop + size - 1) // size):
+            chunk = self.get_chunk(trace_ref, c)
+            offset = c * size
+            a = max(start, offset) - offset
+            b = min(stop, offset + len(chunk)) - offset
+            out[i:i + b - a] = chunk[a:b]
+            i += b - a
+
+
+class DataStorage(object):
+    '''   How Data_a arrays are chunked and compressed. The filters and
+          chunk shape are stored with each array by HDF5 so readers don't
+          need to know them.
+          chunk_samples -> Samples in a chunk
+          chunk_seconds -> Seconds of data in a chunk, used when the
+                           sample rate is known and chunk_samples isn't set
+          complib -> Compression library, one of tables.filters.all_complibs
+          complevel -> Compression level, 0 to 9
+          shuffle -> Use the HDF5 shuffle filter
+          With neither chunk size set PyTables picks the chunk shape.
+    '''
+
+    def __init__(self, chunk_samples=None, chunk_seconds=None,
+                 complib='zlib', complevel=ZLIBCOMP, shuffle=True):
+        if chunk_samples is not None and chunk_samples < 1:
+            raise ValueError("chunk_samples must be at least 1")
+        if chunk_seconds is not None and chunk_seconds <= 0:
+            raise ValueError("chunk_seconds must be greater than 0")
+        if complib not in tables.filters.all_complibs:
+            raise ValueError("Unknown compression library {0}. Use one of {1}"
+                             .format(complib,
+                                     ", ".join(tables.filters.all_complibs)))
+        if tables.which_lib_version(complib) is None:
+            raise ValueError("Compression library {0} is not available"
+                             .format(complib))
+        if not 0 <= complevel <= 9:
+            raise ValueError("complevel must be 0 to 9")
+        self.chunk_samples = chunk_samples
+        self.chunk_seconds = chunk_seconds
+        self.complib = complib
+        self.complevel = complevel
+        self.shuffle = shuffle
+
+    @classmethod
+    def from_chunk(cls, chunk=None, **kwargs):
+        '''   DataStorage with chunk given in samples, '4096', or in
+              seconds, '10s', as the loaders' --chunk option takes it
+        '''
+        if chunk is None:
+            return cls(**kwargs)
+        try:
+            if chunk[-1] in 'sS':
+                return cls(chunk_seconds=float(chunk[:-1]), **kwargs)
+            return cls(chunk_samples=int(chunk), **kwargs)
+        except (IndexError, ValueError) as e:
+            raise ValueError("Bad chunk {0}: {1}".format(chunk, e))
+
+    def filters(self):
+        return tables.Filters(complevel=self.complevel, complib=self.complib,
+                              shuffle=self.shuffle)
+
+    def chunkshape(self, sample_rate=None):
+        '''   Chunk shape of a Data_a array or None to let PyTables
+              choose it
+        '''
+        if self.chunk_samples is not None:
+            return (self.chunk_samples,)
+        if self.chunk_seconds is not None and sample_rate:
+            return (max(1, int(round(self.chunk_seconds * sample_rate))),)
+
+        return None
+
+
+class MiniPool(object):
+    '''   Least recently used pool of mini ph5 files opened read only
+          to resolve external links, so the same mini file is not opened
+          again for every DAS in it.
+          max_open -> Maximum number of files kept open, pinned files are
+                      kept open past it until they are unpinned
+          opens -> Number of files opened
+          hits -> Number of links resolved with a file already open
+          pins -> Number of pins of each file, keyed on file name
+    '''
+
+    def __init__(self, max_open=MAX_OPEN_MINIS):
+        if max_open < 1:
+            raise ValueError("max_open must be at least 1")
+        self.max_open = max_open
+        self.opens = 0
+        self.hits = 0
+        self.files = collections.OrderedDict()
+        self.pins = collections.Counter()
+
+    def get_file(self, filename):
+        '''   Return the open file, opening it and closing the least
+              recently used file that is not pinned if needed
+        '''
+        filename = os.path.normpath(filename)
+        fh = self.files.pop(filename, None)
+        if fh is not None and fh.isopen:
+            self.hits += 1
+        else:
+            fh = tables.open_file(filename, mode='r')
+            self.opens += 1
+        # Most recently used is last
+        self.files[filename] = fh
+        self.evict(keep=filename)
+
+        return fh
+
+    def evict(self, keep=None):
+        '''   Close least recently used files that are not pinned until
+              no more than max_open are open
+        '''
+        for k in list(self.files.keys()):
+            if len(self.files) <= self.max_open:
+                break
+            if k != keep and not self.pins[k]:
+                self.files.pop(k).close()
+
+    def pin(self, filename):
+        '''   Keep open file filename, the _v_file.filename of a node from
+              get_node, until it is unpinned as many times as it was pinned
+        '''
+        if filename in self.files:
+            self.pins[filename] += 1
+
+    def unpin(self, filename):
+        if self.pins[filename] > 0:
+            self.pins[filename] -= 1
+        if not self.pins[filename]:
+            del self.pins[filename]
+            self.evict()
+
+    def get_node(self, link):
+        '''   Return the node an ExternalLink points to, as link() would   '''
+        filename, target = link._get_filename_node()
+        if not os.path.isabs(filename):
+            filename = os.path.join(
+                os.path.dirname(link._v_file.filename), filename)
+
+        return self.get_file(filename).get_node(target)
+
+    def close(self):
+        while self.files:
+            k, fh = self.files.popitem()
+            fh.close()
+        self.pins.clear()
+
+
 class ReceiversGroup:
     '''   /Experiment_g/Receivers_g/Das_g_[sn]#Data for this DAS in this group
                                               /Das_t # columns.Data
@@ -693,6 +992,10 @@ class ReceiversGroup:
         self.dasRE = re.compile(r"Das_g_(.+)")  # Match Das_g groups
         self.byteorder = None  # Trace atom byte order
         self.elementtype = None  # atom type"int","float",or"undetermined"
+        self.chunk_cache = None  # ChunkCache used by read_trace
+        self.mini_pool = None  # MiniPool used by setcurrent
+        self.pinned_mini = None  # Mini file setcurrent pinned in mini_pool
+        self.data_storage = None  # DataStorage of new Data_a arrays
 
     def get_das_name(self):
         '''   Return the current das name   '''
@@ -703,16 +1006,19 @@ class ReceiversGroup:
 
         return name[-1]
 
-    def read_das(self, ignore_srm=False):
-        '''   Read DAS table   '''
+    def read_das(self, ignore_srm=False, as_array=False):
+        '''   Read DAS table, as columns.Records if as_array is set   '''
         def cmp_epoch(a, b):
             return int(a['time/epoch_l']) - int(b['time/epoch_l'])
 
-        ret, keys = read_table(self.current_t_das)
-        if ret is not None:
-            ret.sort(cmp=cmp_epoch)
-        else:
+        ret, keys = read_table(self.current_t_das, as_array=as_array)
+        if ret is None:
             return [], keys
+        elif isinstance(ret, columns.Records):
+            ret = ret[numpy.argsort(ret.col('time/epoch_l'),
+                                    kind='mergesort')]
+        else:
+            ret.sort(cmp=cmp_epoch)
 
         check_srm_valid(
             ret, keys,
@@ -810,12 +1116,18 @@ class ReceiversGroup:
 
         return t, trace_ref.byteorder
 
-    def read_trace(self, trace_ref, start=None, stop=None):
-        '''   Read data trace   '''
-        if start is None and stop is None:
-            data = trace_ref.read()
+    def read_trace(self, trace_ref, start=None, stop=None, out=None):
+        '''   Read data trace
+              out -> optional preallocated numpy array to read into,
+              must be exactly the size of the slice read
+              Chunked arrays are read through chunk_cache if it is set.
+        '''
+        if self.chunk_cache is not None and trace_ref.chunkshape:
+            data = self.chunk_cache.read(trace_ref, start, stop, out)
+        elif start is None and stop is None:
+            data = trace_ref.read(out=out)
         else:
-            data = trace_ref.read(start=start, stop=stop)
+            data = trace_ref.read(start=start, stop=stop, out=out)
         return data
 
     def find_trace_ref(self, name):
@@ -888,23 +1200,40 @@ class ReceiversGroup:
         return das_dict
 
     def setcurrent(self, g):
-        '''
+        '''   The mini file of the current das group stays open in
+              mini_pool until another group is made current
         '''
         # If this is an external link it needs to be redirected.
         if externalLinkRE.match(g.__str__()):
             try:
-                if self.ph5.mode == 'r':
+                if self.mini_pool is not None:
+                    g = self.mini_pool.get_node(g)
+                    self.mini_pool.pin(g._v_file.filename)
+                elif self.ph5.mode == 'r':
                     g = g()
                 else:
                     g = g(mode='a')
             except tables.exceptions.NoSuchNodeError:
+                self.unpin_current()
                 self.current_g_das = None
                 self.current_t_das = None
                 return
 
+            if self.mini_pool is not None:
+                self.unpin_current()
+                self.pinned_mini = g._v_file.filename
+        else:
+            self.unpin_current()
+
         self.current_g_das = g
         self.current_t_das = g.Das_t
 
+    def unpin_current(self):
+        '''   Release the mini file of the das group setcurrent pinned   '''
+        if self.pinned_mini is not None:
+            self.mini_pool.unpin(self.pinned_mini)
+            self.pinned_mini = None
+
     def getdas_g(self, sn):
         '''   Return group for a given serial number   '''
         sn = 'Das_g_' + sn
@@ -994,17 +1323,25 @@ class ReceiversGroup:
 
         return a
 
-    def newdataearray(self, name, data, batom=None, rows=None):
+    def newdataearray(self, name, data, batom=None, rows=None,
+                      sample_rate=None):
+        filters = chunkshape = None
+        if self.data_storage is not None:
+            filters = self.data_storage.filters()
+            chunkshape = self.data_storage.chunkshape(sample_rate)
         a = create_data_earray(self.ph5,
                                self.current_g_das,
                                name,
                                data,
                                batom,
-                               rows=rows)
+                               rows=rows,
+                               filters=filters,
+                               chunkshape=chunkshape)
 
         return a
 
-    def newarray(self, name, data, dtype=None, description=None):
+    def newarray(self, name, data, dtype=None, description=None,
+                 sample_rate=None):
         '''
               name is name of array as follows:
               Data_a_[event_number]   --- Numarray array
@@ -1015,6 +1352,8 @@ class ReceiversGroup:
               inputs: name        --- name of array
                       data        --- data to place in array
                       description --- description of array
+                      sample_rate --- samples per second of data, to
+                                      chunk it by data_storage
 
               returns: tables array descriptor
         '''
@@ -1037,9 +1376,12 @@ class ReceiversGroup:
                 pass
 
             if dtype == 'int32':
-                a = self.newdataearray(name, data, batom=tables.Int32Atom())
+                a = self.newdataearray(name, data, batom=tables.Int32Atom(),
+                                       sample_rate=sample_rate)
             elif dtype == 'float32':
-                a = self.newdataearray(name, data, batom=tables.Float32Atom())
+                a = self.newdataearray(name, data,
+                                       batom=tables.Float32Atom(),
+                                       sample_rate=sample_rate)
             else:
                 a = self.ph5.create_array(self.current_g_das, name, data)
 
@@ -1048,6 +1390,46 @@ class ReceiversGroup:
 
         return a
 
+    def newarrays(self, arrays, dtype=None):
+        '''
+              Create a batch of arrays in the current das group.
+
+              inputs: arrays --- list of (name, data, description) or
+                                 (name, data, description, sample_rate)
+                      dtype  --- as newarray
+
+              returns: list of tables array descriptors
+        '''
+        children = self.current_g_das._v_children
+        ret = []
+        for array in arrays:
+            name, data, description = array[:3]
+            sample_rate = array[3] if len(array) > 3 else None
+            # Only look for an existing node if the name is taken
+            if name in children or dtype not in ('int32', 'float32'):
+                ret.append(self.newarray(name, data, dtype=dtype,
+                                         description=description,
+                                         sample_rate=sample_rate))
+                continue
+
+            if type(data) != numpy.ndarray:
+                data = numpy.fromiter(data, dtype=dtype)
+
+            if dtype == 'int32':
+                a = self.newdataearray(name, data, batom=tables.Int32Atom(),
+                                       sample_rate=sample_rate)
+            else:
+                a = self.newdataearray(name, data,
+                                       batom=tables.Float32Atom(),
+                                       sample_rate=sample_rate)
+
+            if description is not None:
+                a.attrs.description = description
+
+            ret.append(a)
+
+        return ret
+
     def populateDas_t(self, p, key=None):
         required_keys = ['time/epoch_l',
                          'channel_number_i', 'array_name_data_a']
@@ -1308,6 +1690,8 @@ class ExperimentGroup:
         self.ph5_g_reports = None  # Reports group
         self.ph5_g_responses = None
         self.ph5_g_maps = None  # Maps group
+        # DataStorage of new Data_a arrays, set before initgroup
+        self.data_storage = None
 
     def version(self):
         return columns.PH5VERSION
@@ -1417,6 +1801,7 @@ class ExperimentGroup:
         self.ph5_g_sorts.initgroup()
 
         self.ph5_g_receivers = ReceiversGroup(self.ph5)
+        self.ph5_g_receivers.data_storage = self.data_storage
         self.ph5_g_receivers.initgroup()
 
         self.ph5_g_reports = ReportsGroup(self.ph5)
@@ -1477,6 +1862,17 @@ def initialize_table(filenode, where, table, description, expectedrows=None):
 
 
 def populate_table(tablenode, key_value, key=None, required_keys=[]):
+    '''   key_value is a dictionary, or a list of dictionaries which are
+          appended in one call if key is not set
+    '''
+    if isinstance(key_value, list):
+        if key:
+            for kv in key_value:
+                populate_table(tablenode, kv, key, required_keys)
+        else:
+            populate_table_many(tablenode, key_value, required_keys)
+        return
+
     err_keys, err_required = columns.validate(
         tablenode, key_value, required_keys)
 
@@ -1493,7 +1889,30 @@ def populate_table(tablenode, key_value, key=None, required_keys=[]):
         raise HDF5InteractionError(3, e.message)
 
 
-def read_table(tablenode):
+def populate_table_many(tablenode, rows, required_keys=[]):
+    '''   Validate a list of dictionaries and append them to tablenode
+          with columns.populate_many
+    '''
+    for key_value in rows:
+        err_keys, err_required = columns.validate(
+            tablenode, key_value, required_keys)
+
+        if err_keys:
+            raise HDF5InteractionError(1, err_keys)
+
+        if err_required:
+            raise HDF5InteractionError(2, err_required)
+
+    try:
+        columns.populate_many(tablenode, rows)
+    except Exception as e:
+        raise HDF5InteractionError(3, e.message)
+
+
+def read_table(tablenode, as_array=False):
+    '''   Read a table as a list of dictionaries, or if as_array is set
+          as columns.Records which makes the dictionaries as needed
+    '''
     ret = []
     keys = None
     if not tablenode:
@@ -1501,9 +1920,12 @@ def read_table(tablenode):
 
     LOGGER.debug("Read {0}".format(tablenode))
     try:
-        tableiterator = tablenode.iterrows()
         keys, names = columns.keys(tablenode)
-        ret = columns.rowstolist(tableiterator, keys)
+        if as_array:
+            ret = columns.Records(tablenode.read(), keys)
+        else:
+            tableiterator = tablenode.iterrows()
+            ret = columns.rowstolist(tableiterator, keys)
     except Exception as e:
         raise HDF5InteractionError(4, e.message)
 
@@ -1511,22 +1933,28 @@ def read_table(tablenode):
 
 
 def create_empty_earray(filenode, groupnode, name,
-                        batom=None, expectedrows=None):
+                        batom=None, expectedrows=None, filters=None,
+                        chunkshape=None):
     try:
-        bfilter = tables.Filters(complevel=ZLIBCOMP, complib='zlib')
+        if filters is None:
+            bfilter = tables.Filters(complevel=ZLIBCOMP, complib='zlib')
+        else:
+            bfilter = filters
         if expectedrows is None:
             a = filenode.create_earray(groupnode,
                                        name,
                                        atom=batom,
                                        shape=(0,),
-                                       filters=bfilter)
+                                       filters=bfilter,
+                                       chunkshape=chunkshape)
         else:
             a = filenode.create_earray(groupnode,
                                        name,
                                        atom=batom,
                                        shape=(0,),
                                        filters=bfilter,
-                                       expectedrows=expectedrows)
+                                       expectedrows=expectedrows,
+                                       chunkshape=chunkshape)
 
     except Exception as e:
         raise HDF5InteractionError(5, e.message)
@@ -1534,7 +1962,8 @@ def create_empty_earray(filenode, groupnode, name,
     return a
 
 
-def create_data_earray(filenode, groupnode, name, data, batom, rows=None):
+def create_data_earray(filenode, groupnode, name, data, batom, rows=None,
+                       filters=None, chunkshape=None):
     try:
         if rows is None:
             rows = len(data) / 4
@@ -1543,7 +1972,9 @@ def create_data_earray(filenode, groupnode, name, data, batom, rows=None):
                                 groupnode,
                                 name,
                                 batom=batom,
-                                expectedrows=rows)
+                                expectedrows=rows,
+                                filters=filters,
+                                chunkshape=chunkshape)
 
         a.append(data)
     except Exception as e:
@@ -0,0 +1,330 @@
+'''
+Ingestion journal shared by the *2ph5 loaders.
+
+The journal is a file of JSON records, one per line, kept next to
+master.ph5. A loader records when it begins a raw file, the Das_t tables
+it writes to and when the file is done, so a rerun skips files already
+ingested and rolls back files that were left partly written.
+'''
+
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+
+import tables
+
+PROG_VERSION = '2026.290'
+LOGGER = logging.getLogger(__name__)
+
+JOURNAL_NAME = 'ph5_journal.json'
+# Bytes read from the start and the end of a file for its checksum
+CHECKSUM_BYTES = 1048576
+
+arrayRE = re.compile(r"(\w+_a_)(\d+)$")
+
+
+class JournalError(Exception):
+    '''   Exception raised when the journal can't be read or written   '''
+
+    def __init__(self, message):
+        super(JournalError, self).__init__(message)
+        self.message = message
+
+
+def checksum(filename):
+    '''   md5 of the size and of the first and last CHECKSUM_BYTES of
+          filename, so large files are checked without reading them
+    '''
+    size = os.path.getsize(filename)
+    md5 = hashlib.md5(str(size))
+    with open(filename, 'rb') as fh:
+        md5.update(fh.read(CHECKSUM_BYTES))
+        if size > 2 * CHECKSUM_BYTES:
+            fh.seek(-CHECKSUM_BYTES, os.SEEK_END)
+        md5.update(fh.read(CHECKSUM_BYTES))
+
+    return md5.hexdigest()
+
+
+def last_arrays(group):
+    '''   Largest array number for each array prefix in group   '''
+    ret = {}
+    for name in group._v_children.keys():
+        mo = arrayRE.match(name)
+        if mo:
+            prefix, n = mo.groups()
+            ret[prefix] = max(ret.get(prefix, 0), int(n))
+
+    return ret
+
+
+class Ingested(object):
+    '''   Journal state of a raw file.
+          position -- order the file was begun in
+          das -- list of das records, see Journal.das
+          done -- True once all of the file is in PH5
+    '''
+    __slots__ = ('file', 'position', 'size', 'mtime', 'checksum', 'tables',
+                 'das', 'done')
+
+    def __init__(self, record, position):
+        self.file = record['file']
+        self.position = position
+        self.size = record['size']
+        # Journals written before mtime was recorded have none
+        self.mtime = record.get('mtime')
+        self.checksum = record['checksum']
+        self.tables = record.get('tables', {})
+        self.das = []
+        self.done = False
+
+
+class Journal(object):
+    '''   Ingestion journal of the experiment in path.
+
+          journal = Journal(path)
+          journal.rollback()
+          for f in files:
+              if journal.ingested(f):
+                  continue
+              journal.begin(f, [EX.ph5_g_receivers.ph5_t_index])
+              ...
+              journal.das(EXREC.ph5_g_receivers)   # before Das_t rows
+              ...
+              journal.done()
+    '''
+
+    def __init__(self, path='.'):
+        self.path = path
+        self.filename = os.path.join(path, JOURNAL_NAME)
+        # Raw file name -> Ingested
+        self.files = {}
+        # Das records in the order they were written
+        self.das_records = []
+        self.num_begun = 0
+        # Ingested of the file begun and the Das_t tables it writes to
+        self.current = None
+        self.current_tables = set()
+        self.fh = None
+        self.read()
+
+    def read(self):
+        '''   Read the journal file, the last record of a file wins   '''
+        if not os.path.exists(self.filename):
+            return
+
+        try:
+            with open(self.filename) as fh:
+                for line in fh:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A record cut short by a crash
+                        LOGGER.warning("Skipping journal record: {0}"
+                                       .format(line))
+                        continue
+                    self.apply(record)
+        except IOError as e:
+            raise JournalError("Failed to read {0}: {1}"
+                               .format(self.filename, e))
+
+    def apply(self, record):
+        op = record['op']
+        if op == 'begin':
+            self.files[record['file']] = Ingested(record, self.num_begun)
+            self.num_begun += 1
+            return
+
+        ingested = self.files.get(record['file'])
+        if ingested is None:
+            return
+        if op == 'das':
+            ingested.das.append(record)
+            self.das_records.append(record)
+        elif op == 'done':
+            ingested.done = True
+        elif op == 'rollback':
+            del self.files[record['file']]
+
+    def write(self, record):
+        '''   Append record and make sure it is on disk   '''
+        record['time'] = int(time.time())
+        try:
+            if self.fh is None:
+                self.fh = open(self.filename, 'a')
+            self.fh.write(json.dumps(record, sort_keys=True) + '\n')
+            self.fh.flush()
+            os.fsync(self.fh.fileno())
+        except IOError as e:
+            raise JournalError("Failed to write {0}: {1}"
+                               .format(self.filename, e))
+        self.apply(record)
+
+    def close(self):
+        if self.fh is not None:
+            self.fh.close()
+            self.fh = None
+
+    @staticmethod
+    def key(filename):
+        return os.path.abspath(filename)
+
+    def ingested(self, filename):
+        '''   True if all of filename is in PH5 and the file has not
+              changed since. The file is only read for its checksum if
+              its size is the same but its mtime is not.
+        '''
+        ingested = self.files.get(self.key(filename))
+        if ingested is None or not ingested.done:
+            return False
+
+        try:
+            if os.path.getsize(filename) != ingested.size:
+                return False
+            if os.path.getmtime(filename) == ingested.mtime:
+                return True
+            return checksum(filename) == ingested.checksum
+        except (OSError, IOError):
+            return False
+
+    def not_ingested(self, files):
+        '''   Return files without those already ingested   '''
+        ret = []
+        for f in files:
+            if self.ingested(f):
+                LOGGER.info("{0} is already in PH5. Skipping.".format(f))
+            else:
+                ret.append(f)
+
+        return ret
+
+    def begin(self, filename, ph5_tables=()):
+        '''   Start ingesting filename. Rows appended to tables, such as
+              Index_t of master.ph5, from now on are removed if filename
+              is rolled back.
+        '''
+        record = {'op': 'begin', 'file': self.key(filename),
+                  'size': os.path.getsize(filename),
+                  'mtime': os.path.getmtime(filename),
+                  'checksum': checksum(filename),
+                  'tables': {}}
+        for t in ph5_tables:
+            ph5 = os.path.relpath(t._v_file.filename, self.path)
+            record['tables'].setdefault(ph5, {})[t._v_pathname] = t.nrows
+        self.write(record)
+        self.current = self.files[record['file']]
+        self.current_tables = set()
+
+    def das(self, receivers):
+        '''   Record the current das of receivers, a ReceiversGroup of a
+              mini file, before rows are written to its Das_t.
+        '''
+        if self.current is None:
+            return
+
+        t = receivers.current_t_das
+        g = receivers.current_g_das
+        key = (os.path.relpath(t._v_file.filename, self.path),
+               g._v_pathname)
+        if key not in self.current_tables:
+            self.write({'op': 'das', 'file': self.current.file,
+                        'ph5': key[0], 'das': key[1],
+                        'first_row': t.nrows, 'arrays': last_arrays(g)})
+            self.current_tables.add(key)
+
+    def done(self):
+        '''   The file begun is all in PH5   '''
+        if self.current is None:
+            return
+
+        self.write({'op': 'done', 'file': self.current.file,
+                    'size': self.current.size,
+                    'mtime': self.current.mtime,
+                    'checksum': self.current.checksum})
+        self.current = None
+        self.current_tables = set()
+
+    def incomplete(self):
+        '''   Files begun but not done, last begun first   '''
+        ret = [i for i in self.files.values() if not i.done]
+        ret.sort(key=lambda i: i.position, reverse=True)
+
+        return ret
+
+    def rollback(self):
+        '''   Remove the Das_t rows, arrays and table rows written for
+              files that are not done. Returns the names of the files.
+              Run it before the PH5 files are opened.
+        '''
+        ret = []
+        for ingested in self.incomplete():
+            LOGGER.warning("Rolling back partly ingested {0}"
+                           .format(ingested.file))
+            for d in reversed(ingested.das):
+                self.rollback_das(d)
+            for ph5, paths in ingested.tables.items():
+                with tables.open_file(os.path.join(self.path, ph5),
+                                      'a') as f:
+                    for path, nrows in paths.items():
+                        t = f.get_node(path)
+                        stop = self.next_rows(ingested, ph5, path)
+                        if t.nrows > nrows:
+                            t.remove_rows(nrows, stop)
+            self.write({'op': 'rollback', 'file': ingested.file})
+            ret.append(ingested.file)
+
+        return ret
+
+    def next_rows(self, ingested, ph5, path):
+        '''   Rows of table path when the next file was begun   '''
+        later = sorted([i for i in self.files.values()
+                        if i.position > ingested.position and
+                        path in i.tables.get(ph5, {})],
+                       key=lambda i: i.position)
+        if later:
+            return later[0].tables[ph5][path]
+
+        return None
+
+    def rollback_das(self, d):
+        '''   Remove Das_t rows from first_row and the arrays numbered
+              after those in the das when d was recorded, up to the next
+              file written to the das.
+        '''
+        n = self.das_records.index(d)
+        later = [r for r in self.das_records[n + 1:]
+                 if (r['ph5'], r['das']) == (d['ph5'], d['das'])]
+        later = later[0] if later else None
+        filename = os.path.join(self.path, d['ph5'])
+        if not os.path.exists(filename):
+            return
+
+        with tables.open_file(filename, 'a') as f:
+            try:
+                g = f.get_node(d['das'])
+            except tables.NoSuchNodeError:
+                return
+
+            t = g.Das_t
+            stop = later['first_row'] if later else None
+            if t.nrows > d['first_row']:
+                t.remove_rows(d['first_row'], stop)
+                t.flush()
+
+            for name in g._v_children.keys():
+                mo = arrayRE.match(name)
+                if not mo:
+                    continue
+                prefix, an = mo.groups()
+                an = int(an)
+                if an <= d['arrays'].get(prefix, 0):
+                    continue
+                if later and an > later['arrays'].get(prefix, 0):
+                    continue
+                f.remove_node(g, name)
@@ -249,7 +249,20 @@ class Kef:
 
     def batch_update(self, trace=False):
         '''   Batch update ph5 file from kef file   '''
+        def flush_pending():
+            # Consecutive appends, or updates on the same key, to the same
+            # table are written in one call
+            if pending:
+                ref, key = pending_to
+                if key is None:
+                    columns.populate_many(ref, pending)
+                else:
+                    columns.update_many(ref, pending, key)
+            del pending[:]
+
         err = False
+        pending_to = (None, None)
+        pending = []
         self.rewind()
         for p, kv in self:
             if trace is True:
@@ -303,16 +316,24 @@ class Kef:
                 if trace is True:
                     LOGGER.info("Deleting...")
                 else:
+                    flush_pending()
                     columns.delete(ref, kv[key], key)
             else:
                 if trace is True:
                     LOGGER.info("Updating...")
+                elif key is not None and key not in kv:
+                    LOGGER.warning("No data for key. p.has_key (key) fails")
                 else:
-                    columns.populate(ref, kv, key)
+                    if pending_to[0] is not ref or pending_to[1] != key:
+                        flush_pending()
+                        pending_to = (ref, key)
+                    pending.append(kv)
 
             if trace is True:
                 LOGGER.info("Skipped")
 
+        flush_pending()
+
         return err
 
     def strip_receiver_g(self):
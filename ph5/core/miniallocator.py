@@ -0,0 +1,132 @@
+'''
+Choose the miniPH5_xxxxx.ph5 file the data of a DAS is written to.
+
+Shared by the *2ph5 loaders. Sizes of the mini files are kept in a ledger,
+each file is stat'ed once and the bytes given to it afterwards are added
+to the ledger, so choosing a mini does not stat every mini file. The bytes
+given are estimates, so the newest mini is stat'ed again before it is
+checked for room for a new DAS.
+'''
+
+import logging
+import os
+import re
+
+PROG_VERSION = '2026.290'
+LOGGER = logging.getLogger(__name__)
+
+# 2 GB (1024 X 1024 X 1024 X 2)
+MAX_MINI_BYTES = 1073741824 * 2
+
+miniPH5RE = re.compile(r".*miniPH5_(\d\d\d\d\d)\.ph5")
+
+
+def mini_name(n):
+    '''   Name of mini file n without .ph5, as openPH5 takes it   '''
+    return "miniPH5_{0:05d}".format(n)
+
+
+class MiniAllocator(object):
+    '''   Ledger of mini files in path.
+
+          minis = MiniAllocator(path, first_mini, num_mini, max_bytes)
+          minis.index(index_t_rows)
+          EXREC = openPH5(minis.allocate(das, size_of_data))
+
+          A DAS already in a mini stays in it. A new DAS goes to the newest
+          mini until it would grow past max_bytes, then to a new mini. With
+          num_mini new DASes go to a new mini until there are num_mini of
+          them and then to the smallest, so DASes are spread over the
+          minis.
+    '''
+
+    def __init__(self, path='.', first_mini=1, num_mini=None,
+                 max_bytes=MAX_MINI_BYTES):
+        self.path = path
+        self.first_mini = first_mini
+        self.num_mini = num_mini
+        self.max_bytes = max_bytes
+        # DAS serial number -> mini number
+        self.das_minis = {}
+        # Mini number -> bytes
+        self.sizes = {}
+        # Largest mini number a DAS was put in
+        self.newest = None
+        self.listed = False
+
+    def index(self, rows):
+        '''   Add the DASes in Index_t rows of master.ph5   '''
+        for r in rows:
+            mo = miniPH5RE.match(r['external_file_name_s'])
+            if not mo:
+                continue
+            n = int(mo.groups()[0])
+            self.das_minis.setdefault(str(r['serial_number_s']), n)
+            if self.newest is None or n > self.newest:
+                self.newest = n
+
+    def filename(self, n):
+        return os.path.join(self.path, mini_name(n) + '.ph5')
+
+    def size(self, n):
+        '''   Bytes in mini n, stat'ed the first time it is asked for   '''
+        if n not in self.sizes:
+            try:
+                self.sizes[n] = os.path.getsize(self.filename(n))
+            except OSError:
+                self.sizes[n] = 0
+
+        return self.sizes[n]
+
+    def refresh(self, n):
+        '''   Bytes in mini n, stat'ed again. The ledger is kept if the
+              file is not on disk yet.
+        '''
+        try:
+            self.sizes[n] = os.path.getsize(self.filename(n))
+        except OSError:
+            pass
+
+        return self.size(n)
+
+    def smallest(self):
+        '''   Number of the smallest mini   '''
+        if not self.listed:
+            # Minis on disk that are not in Index_t yet
+            for f in os.listdir(self.path):
+                mo = miniPH5RE.match(f)
+                if mo:
+                    self.size(int(mo.groups()[0]))
+            self.listed = True
+
+        return min(self.sizes, key=lambda n: (self.size(n), n))
+
+    def allocate(self, das, size_of_data=0):
+        '''   Return the name of the mini for das and add size_of_data
+              to its size.
+        '''
+        das = str(das)
+        n = self.das_minis.get(das)
+        if n is None:
+            n = self.new_das_mini(size_of_data)
+            self.das_minis[das] = n
+            if self.newest is None or n > self.newest:
+                self.newest = n
+        self.sizes[n] = self.size(n) + size_of_data
+
+        return mini_name(n)
+
+    def new_das_mini(self, size_of_data):
+        if self.newest is None:
+            # This is the first DAS added
+            return self.first_mini
+
+        if self.num_mini is not None:
+            if self.newest - (self.first_mini - 1) < self.num_mini:
+                return self.newest + 1
+            return self.smallest()
+
+        if size_of_data + self.refresh(self.newest) > self.max_bytes:
+            return self.newest + 1
+
+        return self.newest
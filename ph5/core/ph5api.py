@@ -215,23 +215,186 @@ class Trace(object):
         return timedoy.timecorrect(self.start_time, self.time_correction_ms)
 
 
+class DasIndex(object):
+    '''   Sorted start/stop interval index of a Das_t
+          nrows -> Number of rows in Das_t when the index was built
+          groups -> Keyed on (channel_number_i, sample_rate_i,
+                    sample_rate_multiplier_i), points to a tuple of numpy
+                    arrays (starts, stops, max_stops, rows) sorted on start,
+                    max_stops is the running maximum of stops and rows the
+                    row numbers in Das_t
+          Methods:
+          lookup -> Return the Das_t row numbers of windows in a time range
+    '''
+    __slots__ = ('nrows', 'groups')
+
+    def __init__(self, das_t):
+        '''   das_t -> Das_t read as a numpy structured array   '''
+        self.nrows = len(das_t)
+        self.groups = {}
+        if self.nrows == 0:
+            return
+        chans = das_t['channel_number_i']
+        srs = das_t['sample_rate_i']
+        srms = das_t['sample_rate_multiplier_i']
+        starts = das_t['time']['epoch_l'].astype(np.float64) + \
+            das_t['time']['micro_seconds_i'] / 1000000.
+        stops = starts.copy()
+        has_rate = srs > 0
+        # Window lengths as the numexpr query of query_das_t had them
+        stops[has_rate] += das_t['sample_count_i'][has_rate] / \
+            srs[has_rate].astype(np.float64) / srms[has_rate]
+        for key in set(zip(chans.tolist(), srs.tolist(), srms.tolist())):
+            rows = np.nonzero((chans == key[0]) &
+                              (srs == key[1]) &
+                              (srms == key[2]))[0]
+            order = np.argsort(starts[rows], kind='mergesort')
+            rows = rows[order]
+            self.groups[key] = (starts[rows],
+                                stops[rows],
+                                np.maximum.accumulate(stops[rows]),
+                                rows)
+
+    def lookup(self, start_epoch, stop_epoch, chan=None, sample_rate=None,
+               sample_rate_multiplier=1, by_start=False, inclusive=True):
+        '''   Find Das_t windows overlapping start_epoch to stop_epoch
+              Inputs:
+                 start_epoch -> epoch time in seconds
+                 stop_epoch -> epoch time in seconds
+                 chan -> only windows for this channel
+                 sample_rate -> only windows with this sample_rate_i and
+                 sample_rate_multiplier
+                 by_start -> only windows that start in the time range
+                 inclusive -> iff False, windows that stop exactly at
+                 start_epoch are not included
+              Returns:
+                 Sorted numpy array of Das_t row numbers
+        '''
+        found = []
+        for key, group in self.groups.items():
+            if chan is not None and key[0] != chan:
+                continue
+            if sample_rate is not None and \
+                    (key[1] != sample_rate or
+                     key[2] != sample_rate_multiplier):
+                continue
+            starts, stops, max_stops, rows = group
+            hi = np.searchsorted(starts, stop_epoch, side='right')
+            if by_start:
+                lo = np.searchsorted(starts, start_epoch, side='left')
+                found.append(rows[lo:hi])
+            else:
+                # Windows before lo all stop before start_epoch
+                if inclusive:
+                    lo = np.searchsorted(max_stops, start_epoch, side='left')
+                    keep = stops[lo:hi] >= start_epoch
+                else:
+                    lo = np.searchsorted(max_stops, start_epoch,
+                                         side='right')
+                    keep = stops[lo:hi] > start_epoch
+                found.append(rows[lo:hi][keep])
+
+        if not found:
+            return np.array([], dtype=np.int64)
+
+        return np.sort(np.concatenate(found))
+
+
+class TimeIndex(object):
+    '''   Time_t of one DAS sorted on start time
+          rows -> Time_t rows of the DAS as a list of dictionaries in
+                  table order
+          starts, stops, max_stops -> numpy arrays of the start and stop of
+                  each row sorted on start, max_stops is the running
+                  maximum of stops
+          order -> Position in rows of each sorted start
+          odd -> Position in rows of windows that stop before they start
+          Methods:
+          lookup -> Return the Time_t row _cor uses for a time range
+    '''
+    __slots__ = ('rows', 'starts', 'stops', 'max_stops', 'order', 'odd')
+
+    def __init__(self, rows):
+        self.rows = rows
+        starts = np.array([fepoch(t['start_time/epoch_l'],
+                                  t['start_time/micro_seconds_i'])
+                           for t in rows], dtype=np.float64)
+        stops = np.array([fepoch(t['end_time/epoch_l'],
+                                 t['end_time/micro_seconds_i'])
+                          for t in rows], dtype=np.float64)
+        good = starts <= stops
+        self.odd = np.nonzero(~good)[0].tolist()
+        order = np.nonzero(good)[0]
+        order = order[np.argsort(starts[order], kind='mergesort')]
+        self.order = order
+        self.starts = starts[order]
+        self.stops = stops[order]
+        self.max_stops = np.maximum.accumulate(self.stops) if len(order) \
+            else self.stops
+
+    def lookup(self, start_fepoch, stop_fepoch):
+        '''   Return the first row, in table order, with a window that
+              is_in start_fepoch to stop_fepoch or None
+        '''
+        if start_fepoch > stop_fepoch:
+            found = range(len(self.rows))
+        else:
+            hi = np.searchsorted(self.starts, stop_fepoch, side='right')
+            lo = np.searchsorted(self.max_stops, start_fepoch, side='left')
+            found = self.order[lo:hi][self.stops[lo:hi] >= start_fepoch]
+            found = found.tolist() + self.odd
+
+        for i in sorted(found):
+            t = self.rows[i]
+            if is_in(fepoch(t['start_time/epoch_l'],
+                            t['start_time/micro_seconds_i']),
+                     fepoch(t['end_time/epoch_l'],
+                            t['end_time/micro_seconds_i']),
+                     start_fepoch, stop_fepoch):
+                return t
+
+        return None
+
+
 class PH5(experiment.ExperimentGroup):
     das_gRE = re.compile("Das_g_(.*)")
 
-    def __init__(self, path=None, nickname=None, editmode=False):
+    def __init__(self, path=None, nickname=None, editmode=False,
+                 chunk_cache=None, max_open_minis=experiment.MAX_OPEN_MINIS):
         '''   path -> Path to ph5 file
               nickname -> The master ph5 file name, ie. master.ph5
               editmode -> Always False
+              chunk_cache -> experiment.ChunkCache of Data_a chunks, may be
+              shared by several PH5 objects. One of the default size is
+              made if not given. chunk_cache.hits and chunk_cache.misses
+              count chunks found in and read into the cache.
+              max_open_minis -> Maximum number of mini ph5 files kept open
+              to resolve Das_g links, see mini_pool.opens and
+              mini_pool.hits.
         '''
         if not os.path.exists(os.path.join(path, nickname)):
             raise APIError(0, "PH5 file does not exist: {0}".format(
                 os.path.join(path, nickname)))
         experiment.ExperimentGroup.__init__(
             self, currentpath=path, nickname=nickname)
+        if chunk_cache is None:
+            chunk_cache = experiment.ChunkCache()
+        self.chunk_cache = chunk_cache
+        self.mini_pool = experiment.MiniPool(max_open_minis)
         if self.currentpath is not None and self.nickname is not None:
             self.ph5open(editmode)
             self.initgroup()
-
+            if not editmode:
+                self.ph5_g_receivers.chunk_cache = self.chunk_cache
+                self.ph5_g_receivers.mini_pool = self.mini_pool
+
+        # Das_t_index[das], DasIndex kept until the file is closed
+        self.Das_t_index = {}
+        # Time_t and Time_t_index[das] are kept until the file is closed
+        # or the number of rows in Time_t changes
+        self.Time_t = None
+        self.Time_t_index = {}
+        self.Time_t_nrows = None
         self.clear()
 
     def clear(self):
@@ -247,7 +410,6 @@ class PH5(experiment.ExperimentGroup):
         # Offset_t[offset_name] = { 'byid':byid, 'order':order, 'keys':keys }
         self.Offset_t = {}
         self.Index_t = None
-        self.Time_t = None
         self.Receiver_t = None
         self.Experiment_t = None
         self.Response_t = None
@@ -259,8 +421,16 @@ class PH5(experiment.ExperimentGroup):
 
     def close(self):
         self.clear()
+        self.Das_t_index = {}
+        self.Time_t = None
+        self.Time_t_index = {}
+        self.Time_t_nrows = None
         self.ph5close()
 
+    def ph5close(self):
+        self.mini_pool.close()
+        experiment.ExperimentGroup.ph5close(self)
+
     def channels(self, array, station):
         '''
            Inputs:
@@ -550,10 +720,12 @@ class PH5(experiment.ExperimentGroup):
         '''
         self.Array_t_names = self.ph5_g_sorts.namesArray_t()
 
-    def read_array_t(self, name):
+    def read_array_t(self, name, as_array=False):
         '''   Read Array_t n
               Inputs:
                  name -> the name of the array as a string 'Array_t_xxx'
+                 as_array -> Return the table as columns.Records and leave
+                 Array_t unchanged
               Sets:
                  Array_t[name]['byid'] Keyed by station id as a list of dict of
                  array_t lines by channel
@@ -563,6 +735,11 @@ class PH5(experiment.ExperimentGroup):
         '''
         if not self.Array_t_names:
             self.read_array_t_names()
+        if as_array:
+            if name not in self.Array_t_names:
+                return None
+            rows, keys = self.ph5_g_sorts.read_arrays(name, as_array=True)
+            return rows
         if name in self.Array_t_names:
             rows, keys = self.ph5_g_sorts.read_arrays(name)
             byid, order = by_id(
@@ -630,21 +807,47 @@ class PH5(experiment.ExperimentGroup):
         '''
         rows, keys = self.ph5_g_receivers.read_time()
         self.Time_t = {'rows': rows, 'keys': keys}
+        self.Time_t_index = {}
+        self.Time_t_nrows = self.time_t_nrows()
 
-    def get_time_t(self, das):
-        '''   Return Time_t as a list of dictionaries
+    def time_t_nrows(self):
+        '''   Return the number of rows in the Time_t table   '''
+        try:
+            return self.ph5_g_receivers.ph5_t_time.nrows
+        except AttributeError:
+            return 0
+
+    def get_time_t_index(self, das):
+        '''   Return the TimeIndex of a DAS. Time_t is split by DAS
+              the first time it is needed after it is read. Time_t is
+              only read again if its number of rows has changed.
               Returns:
-                 time_t (a list of dictionaries)
+                 TimeIndex
         '''
-        if not self.Time_t:
+        if not self.Time_t or self.Time_t_nrows != self.time_t_nrows():
             self.read_time_t()
 
-        time_t = []
-        for t in self.Time_t['rows']:
-            if t['das/serial_number_s'] == das:
-                time_t.append(t)
+        if not self.Time_t_index:
+            bydas = {}
+            for t in self.Time_t['rows']:
+                d = t['das/serial_number_s']
+                if d not in bydas:
+                    bydas[d] = []
+                bydas[d].append(t)
+            for d in bydas:
+                self.Time_t_index[d] = TimeIndex(bydas[d])
 
-        return time_t
+        if das not in self.Time_t_index:
+            return TimeIndex([])
+
+        return self.Time_t_index[das]
+
+    def get_time_t(self, das):
+        '''   Return Time_t as a list of dictionaries
+              Returns:
+                 time_t (a list of dictionaries)
+        '''
+        return list(self.get_time_t_index(das).rows)
 
     def read_receiver_t(self):
         '''   Read Receiver_t
@@ -767,8 +970,10 @@ class PH5(experiment.ExperimentGroup):
                     stop_epoch=None,
                     sample_rate=None,
                     sample_rate_multiplier=1,
-                    check_samplerate=True):
-        ''' Uses queries to get data from specific das table'''
+                    check_samplerate=True,
+                    as_array=False):
+        ''' Uses queries to get data from specific das table, as
+            columns.Records if as_array is set'''
         das_g = "Das_g_{0}".format(das)
         try:
             node = self.ph5_g_receivers.getdas_g(das)
@@ -782,99 +987,75 @@ class PH5(experiment.ExperimentGroup):
                                     'Das_t')
         except NoSuchNodeError:
             return []
-        try:
-            sample_rate_multiplier_i = tbl.cols.sample_rate_multiplier_i  # noqa
-            sample_rate_multiplier_i = sample_rate_multiplier_i
-        except AttributeError:
+        index = self.get_das_t_index(das, tbl)
+        if not start_epoch:
+            start_epoch = 0
+        if not stop_epoch:
+            stop_epoch = 32509613590
+
+        if sample_rate == 0 or sample_rate is None:
+            rows = index.lookup(start_epoch, stop_epoch, chan=int(chan),
+                                by_start=True)
+        # Windows that stop exactly at start_epoch have no samples in
+        # the time range and are left out
+        elif check_samplerate is False:
+            rows = index.lookup(start_epoch, stop_epoch, chan=int(chan),
+                                inclusive=False)
+        else:
+            rows = index.lookup(start_epoch, stop_epoch, chan=int(chan),
+                                sample_rate=sample_rate,
+                                sample_rate_multiplier=sample_rate_multiplier,
+                                inclusive=False)
+        if len(rows) == 0:
+            return []
+
+        keys, names = columns.keys(tbl)
+        if as_array:
+            return columns.Records(tbl.read_coordinates(rows), keys)
+        return columns.recordstolist(tbl.read_coordinates(rows), keys)
+
+    def get_das_t_index(self, das, tbl):
+        '''   Return the DasIndex of a Das_t, building it the first time
+              it is needed or when Das_t has changed size
+              Inputs:
+                 das -> DAS serial number
+                 tbl -> the Das_t table node
+              Returns:
+                 DasIndex
+        '''
+        if das in self.Das_t_index and \
+                self.Das_t_index[das].nrows == tbl.nrows:
+            return self.Das_t_index[das]
+
+        if 'sample_rate_multiplier_i' not in tbl.colnames:
             errmsg = ("%s has sample_rate_multiplier_i "
                       "missing. Please run fix_srm to fix "
                       "sample_rate_multiplier_i for PH5 data."
                       % tbl._v_parent._v_name.replace('Das_g', 'Das_t'))
             raise APIError(-1, errmsg)
 
-        if len(list(tbl.where('sample_rate_multiplier_i==0'))) > 0:
+        das_t = tbl.read()
+        if np.any(das_t['sample_rate_multiplier_i'] == 0):
             errmsg = ("%s has sample_rate_multiplier_i "
                       "with value 0. Please run fix_srm to fix "
                       "sample_rate_multiplier_i for PH5 data."
                       % tbl._v_parent._v_name.replace('Das_g', 'Das_t'))
             raise APIError(-1, errmsg)
 
-        epoch_i = tbl.cols.time.epoch_l  # noqa
-        micro_seconds_i = tbl.cols.time.micro_seconds_i  # noqa
-        sample_count_i = tbl.cols.sample_count_i  # noqa
-        sample_rate_i = tbl.cols.sample_rate_i  # noqa
-        epoch_i = epoch_i
-        micro_seconds_i = micro_seconds_i
-        sample_count_i = sample_count_i
-        sample_rate_i = sample_rate_i
-        das = []
-        if not start_epoch:
-            start_epoch = 0
-        if not stop_epoch:
-            stop_epoch = 32509613590
+        self.Das_t_index[das] = DasIndex(das_t)
 
-        if sample_rate == 0 or sample_rate is None:
-            numexprstr = (
-                    '(channel_number_i == '
-                    + str(chan) + ' )&(epoch_i+micro_seconds_i/1000000>='
-                    + str(start_epoch) +
-                    ')&(epoch_i+micro_seconds_i/1000000<='
-                    + str(stop_epoch) + ')'
-            )
-        elif check_samplerate is False:
-            numexprstr = (
-                 '(channel_number_i == '
-                 + str(chan) + ' )&(epoch_i+micro_seconds_i/1000000 >= '
-                 + str(start_epoch) +
-                 '-sample_count_i/sample_rate_i/sample_rate_multiplier_i)'
-                 '&(epoch_i+micro_seconds_i/1000000 <= '
-                 + str(stop_epoch) + ')'
-                 )
-        else:
-            numexprstr = (
-                '(channel_number_i == '
-                + str(chan) + ' )&(epoch_i+micro_seconds_i/1000000>='
-                + str(start_epoch) +
-                '-sample_count_i/sample_rate_i/sample_rate_multiplier_i)'
-                '&(epoch_i+micro_seconds_i/1000000<='
-                + str(stop_epoch) + ')&(sample_rate_i==' +
-                str(sample_rate) +
-                ')&(sample_rate_multiplier_i==' +
-                str(sample_rate_multiplier) + ')'
-            )
-
-        for row in tbl.where(numexprstr):
-            row_dict = {'array_name_SOH_a': row['array_name_SOH_a'],
-                        'array_name_data_a': row['array_name_data_a'],
-                        'array_name_event_a': row['array_name_event_a'],
-                        'array_name_log_a': row['array_name_log_a'],
-                        'channel_number_i': row['channel_number_i'],
-                        'event_number_i': row['event_number_i'],
-                        'raw_file_name_s': row['raw_file_name_s'],
-                        'receiver_table_n_i': row['receiver_table_n_i'],
-                        'response_table_n_i': row['response_table_n_i'],
-                        'sample_count_i': row['sample_count_i'],
-                        'sample_rate_i': row['sample_rate_i'],
-                        'sample_rate_multiplier_i':
-                            row['sample_rate_multiplier_i'],
-                        'stream_number_i': row['stream_number_i'],
-                        'time/ascii_s': row['time/ascii_s'],
-                        'time/epoch_l': row['time/epoch_l'],
-                        'time/micro_seconds_i':
-                            row['time/micro_seconds_i'],
-                        'time/type_s': row['time/type_s'],
-                        'time_table_n_i': row['time_table_n_i']
-                        }
-            das.append(row_dict)
-        return das
+        return self.Das_t_index[das]
 
-    def read_das_t(self, das, start_epoch=None, stop_epoch=None, reread=True):
+    def read_das_t(self, das, start_epoch=None, stop_epoch=None, reread=True,
+                   as_array=False):
         '''   Read Das_t, return Das_t keyed on DAS serial number
               Inputs:
                  das -> DAS serial number as string or name of das group
                  start_epoch -> epoch time in seconds
                  stop_epoch -> epoch time in seconds
                  reread -> Re-read table even if Das_t[das] exists
+                 as_array -> Return the rows, in the same order, as
+                 columns.Records and leave Das_t unchanged
               Sets:
                  Das_t[das]['rows'] (a list of dictionaries)
                  Das_t[das]['keys'] (a list of dictionary keys)
@@ -888,7 +1069,7 @@ class PH5(experiment.ExperimentGroup):
         else:
             das_g = "Das_g_{0}".format(das)
 
-        if das in dass and not reread and not start_epoch:
+        if das in dass and not reread and not start_epoch and not as_array:
             if das in self.Das_t_full:
                 self.Das_t[das] = self.Das_t_full[das]
                 return das
@@ -902,43 +1083,50 @@ class PH5(experiment.ExperimentGroup):
         if node is None:
             return None
         rows_keep = []
-        rows = []
         rk = {}
-        rows, keys = self.ph5_g_receivers.read_das()
-        self.Das_t_full[das] = {'rows': rows, 'keys': keys}
         if stop_epoch is not None and start_epoch is not None:
-            for r in self.Das_t_full[das]['rows']:
-                # Start and stop for this das event window
-                start = float(r['time/epoch_l']) + \
-                        float(r['time/micro_seconds_i']) / 1000000.
-
-                if r['sample_rate_i'] > 0:
-                    stop = start + (float(r['sample_count_i']) / (
-                            float(r['sample_rate_i']) /
-                            float(r['sample_rate_multiplier_i'])))
-                else:
-                    stop = start
+            tbl = self.ph5_g_receivers.current_t_das
+            try:
+                index = self.get_das_t_index(das, tbl)
+            except APIError as e:
+                raise experiment.HDF5InteractionError(7, e.msg)
+            keys, names = columns.keys(tbl)
+            rows = index.lookup(start_epoch, stop_epoch)
+            if as_array:
+                records = columns.Records(tbl.read_coordinates(rows), keys)
+                return records[das_t_order(records)]
+            if len(rows) > 0:
+                rows = columns.recordstolist(tbl.read_coordinates(rows),
+                                             keys)
+            else:
+                rows = []
+            # Same order as ReceiversGroup.read_das
+            rows.sort(key=lambda r: int(r['time/epoch_l']))
+            for r in rows:
                 if r['sample_rate_i'] > 0:
                     sr = float(r['sample_rate_i']) / \
                         float(r['sample_rate_multiplier_i'])
                 else:
                     sr = 0
-                # We need to keep this
-                if is_in(start, stop, start_epoch, stop_epoch):
-                    if sr not in rk:
-                        rk[sr] = []
-                    rk[sr].append(r)
+                if sr not in rk:
+                    rk[sr] = []
+                rk[sr].append(r)
             rkk = rk.keys()
             # Sort so higher sample rates are first
             rkk.sort(reverse=True)
             for s in rkk:
                 rows_keep.extend(rk[s])
+        elif as_array:
+            rows, keys = self.ph5_g_receivers.read_das(as_array=True)
+            return rows
         else:
+            rows, keys = self.ph5_g_receivers.read_das()
+            self.Das_t_full[das] = {'rows': rows, 'keys': keys}
             rows_keep = rows
 
         if len(rows_keep) > 0:
             self.Das_t[das] = {'rows': rows_keep,
-                               'keys': self.Das_t_full[das]['keys']}
+                               'keys': keys}
             self.num_found_das += 1
         else:
             das = None
@@ -948,6 +1136,7 @@ class PH5(experiment.ExperimentGroup):
     def forget_das_t(self, das):
         node = self.ph5_g_receivers.getdas_g(das)
         try:
+            # Does nothing when the mini file is open in mini_pool
             node.umount()
         except NoSuchNodeError:
             # when no minixxx.ph5 is used
@@ -1140,7 +1329,7 @@ class PH5(experiment.ExperimentGroup):
 
         clock = Clock()
         if apply_time_correction:
-            Time_t = self.get_time_t(das)
+            Time_t = self.get_time_t_index(das)
             time_cor_guess_ms, clock = _cor(start_fepoch, stop_fepoch, Time_t)
             if das in self.Das_t:
                 sr = sample_rate
@@ -1158,26 +1347,98 @@ class PH5(experiment.ExperimentGroup):
             clock.comment.append("No time correction applied.")
             time_cor_guess_samples = 0
 
-        samples_read = 0
-        first = True
-        new_trace = False
+        segments = self._plan_cut(Das_t, start_fepoch, stop_fepoch, chan,
+                                  sample_rate, time_cor_guess_samples)
         traces = []
-        das_t = []
+        for seg in segments:
+            data = self._read_segment(seg)
+            trace = Trace(data,
+                          seg['start_fepoch'],
+                          0,  # time_correction_ms
+                          len(data),  # nsamples
+                          sample_rate,
+                          seg['ttype'],
+                          seg['byteorder'],
+                          seg['das_t'],
+                          None,  # receiver_t
+                          None,  # response_t
+                          clock=clock)
+            traces.append(trace)
+        if not traces:
+            return [Trace(np.array([]), start_fepoch, 0.,
+                          0, sample_rate, None, None, [], None,
+                          None, clock=clock)]
+
+        das_t = traces[0].das_t
+        if das_t:
+            receiver_t = self.get_receiver_t(das_t[0])
+            response_t = self.get_response_t(das_t[0])
+        else:
+            receiver_t = None
+            response_t = None
+        ret = []
 
-        window_start_fepoch0 = None
-        window_stop_fepoch = None
-        trace_start_fepoch = None
-        data = None
+        for t in traces:
+            if apply_time_correction:
+                window_start_fepoch0 = t.start_time
+                window_stop_fepoch = window_start_fepoch0 + (
+                    t.nsamples / float(sample_rate))
+                time_correction, clock = \
+                    _cor(window_start_fepoch0.epoch(fepoch=True),
+                         window_stop_fepoch.epoch(fepoch=True),
+                         Time_t)
+                if time_correction != time_cor_guess_ms:
+                    t.clock.comment.append(
+                        "Time correction mismatch. {0}ms/{1}ms"
+                        .format(time_correction, time_cor_guess_ms))
+            else:
+                time_correction = 0.
+            # Set time correction
+            t.time_correction_ms = time_correction
+            # Set receiver_t and response_t
+            t.receiver_t = receiver_t
+            t.response_t = response_t
+            ret.append(t)
+
+        if 'PH5API_DEBUG' in os.environ and os.environ['PH5API_DEBUG']:
+            for t in ret:
+                print('-=' * 40)
+                print(t)
+
+        return ret
+
+    def _plan_cut(self, Das_t, start_fepoch, stop_fepoch, chan,
+                  sample_rate, time_cor_guess_samples=0):
+        '''   Work out which samples of which Data_a arrays make up a cut
+              before any data is read
+              Inputs:
+                 Das_t -> list of Das_t rows sorted on start time
+                 start_fepoch -> time to cut start of trace
+                 stop_fepoch -> time to cut end of trace
+                 chan -> channel to cut
+                 sample_rate -> sample rate in samples per second
+                 time_cor_guess_samples -> shift applied to the data arrays
+              Returns:
+                 A list of gap free segments, each a dictionary:
+                 {   'start_fepoch': Time of first sample,
+                     'nsamples': Total number of samples in segment,
+                     'ttype': Data sample point type,
+                     'byteorder': Data byteorder,
+                     'das_t': List of Das_t rows used,
+                     'reads': List of (trace_reference, start, stop, n)
+                 }
+        '''
+        si = 1. / float(sample_rate)
+        segments = []
+        seg = None
         for d in Das_t:
             sr = float(d['sample_rate_i']) / \
-                 float(d['sample_rate_multiplier_i'])
+                float(d['sample_rate_multiplier_i'])
             window_start_fepoch = fepoch(
                 d['time/epoch_l'], d['time/micro_seconds_i'])
             if (d['channel_number_i'] != chan) or (
                     sr != sample_rate) or (window_start_fepoch > stop_fepoch):
                 continue
-            if window_start_fepoch0 is None:
-                window_start_fepoch0 = window_start_fepoch
             # Number of samples in window
             window_samples = d['sample_count_i']
             # Window stop epoch
@@ -1186,17 +1447,14 @@ class PH5(experiment.ExperimentGroup):
             # Requested start before start of window, we must need to
             # start cutting at start of window
             if start_fepoch < window_start_fepoch:
-                cut_start_fepoch = window_start_fepoch
                 cut_start_sample = 0
             else:
                 # Cut start is somewhere in window
-                cut_start_fepoch = start_fepoch
-                cut_start_sample = int(math.ceil(((cut_start_fepoch -
+                cut_start_sample = int(math.ceil(((start_fepoch -
                                                    window_start_fepoch) *
                                                   sr)))
             # Requested stop is after end of window so we need rest of window
             if stop_fepoch > window_stop_fepoch:
-                cut_stop_fepoch = window_stop_fepoch
                 cut_stop_sample = window_samples
             else:
                 # Requested stop is somewhere in window
@@ -1205,142 +1463,80 @@ class PH5(experiment.ExperimentGroup):
                                         math.ceil((cut_stop_fepoch -
                                                    window_start_fepoch) * sr),
                                         6))
-            # Get trace reference and cut data available in this window
+            # Get trace reference for data available in this window
             trace_reference = self.ph5_g_receivers.find_trace_ref(
                 d['array_name_data_a'].strip())
-
-            if trace_reference is None:
-                continue
-
             if not trace_reference:
                 continue
 
-            data_tmp = self.ph5_g_receivers.read_trace(
-                trace_reference,
-                start=int(round(cut_start_sample - time_cor_guess_samples)),
-                stop=int(round(cut_stop_sample - time_cor_guess_samples)))
-            current_trace_type, current_trace_byteorder = (
-                self.ph5_g_receivers.trace_info(trace_reference))
-            if first:
-                # Correct start time to 'actual' time of first sample
-                if trace_start_fepoch is None:
-                    trace_start_fepoch = \
-                        window_start_fepoch + cut_start_sample / sr
-                first = False
-                dt = 'int32'
-                if current_trace_type == 'float':
-                    dt = 'float32'
-
-                data = np.array([], dtype=dt)
-            else:
-                # Time difference between the end of last window and the start
-                # of this one
-                time_diff = abs(window_start_fepoch)
-                # Overlaps are positive
-                d['gap_overlap'] = time_diff - (1. / sr)
-                # Data gap
-                if abs(time_diff) > (1. / sr):
-                    new_trace = True
-            if len(data_tmp) > 0:
-                #  Gap!!!
-                if new_trace:
-                    # Save trace before gap
-                    trace = Trace(data,
-                                  trace_start_fepoch,
-                                  0,  # time_correction
-                                  len(data),  # samples_read
-                                  sr,
-                                  current_trace_type,
-                                  current_trace_byteorder,
-                                  das_t,
-                                  None,  # receiver_t
-                                  None,  # response_t
-                                  clock=clock)
-                    traces.append(trace)
-                    #
-                    # Start of trace after gap
-                    #
-                    start_fepoch = trace_start_fepoch
-                    trace_start_fepoch = window_start_fepoch
-                    samples_read = len(data_tmp)
-
-                    dt = 'int32'
-                    if current_trace_type == 'float':
-                        dt = 'float32'
-                    data = np.array([], dtype=dt)
-
-                    data = np.append(data, data_tmp)
-                    das_t = [d]
-                    new_trace = False
-                else:
-                    data = np.append(data, data_tmp)
-                    samples_read += len(data_tmp)
-                    das_t.append(d)
-                # adjust the number of data samples as to not over extend the
-                # cut_stop_fepoch
-                if data is None:
-                    return [Trace(np.array([]), start_fepoch, 0.,
-                                  0, sample_rate, None, None, das_t, None,
-                                  None, clock=clock)]
-                calc_stop_fepoch = trace_start_fepoch + (len(data) / sr)
-
-                # calculate number of overextending samples
-                # num_overextend_samples is specific to the data per das table
-                # needs to be embedded in for loop to work properly.
-                num_overextend_samples = int(math.floor(calc_stop_fepoch -
-                                                        cut_stop_fepoch) * sr)
-                samples_to_cut = int(len(data) - num_overextend_samples)
-                if num_overextend_samples > 0:
-                    # trim the data array to exclude the over extending samples
-                    data = data[0:samples_to_cut]
-        # Done reading all the traces catch the last bit
-        trace = Trace(data,
-                      trace_start_fepoch,
-                      0,  # time_correction_ms
-                      len(data),  # nsamples
-                      sample_rate,
-                      current_trace_type,
-                      current_trace_byteorder,
-                      das_t,
-                      None,  # receiver_t
-                      None,  # response_t
-                      clock=clock)
-        traces.append(trace)
-        if das_t:
-            receiver_t = self.get_receiver_t(das_t[0])
-            response_t = self.get_response_t(das_t[0])
-        else:
-            receiver_t = None
-            response_t = None
-        ret = []
+            start = int(round(cut_start_sample - time_cor_guess_samples))
+            stop = int(round(cut_stop_sample - time_cor_guess_samples))
+            # Same bounds as reading the slice [start:stop] of the array
+            start, stop, step = slice(start, stop).indices(
+                trace_reference.nrows)
+            n = stop - start
+            if n <= 0:
+                continue
 
-        for t in traces:
-            if apply_time_correction:
-                window_start_fepoch0 = t.start_time
-                window_stop_fepoch = window_start_fepoch0 + (t.nsamples / sr)
-                time_correction, clock = \
-                    _cor(window_start_fepoch0.epoch(fepoch=True),
-                         window_stop_fepoch.epoch(fepoch=True),
-                         Time_t)
-                if time_correction != time_cor_guess_ms:
-                    t.clock.comment.append(
-                        "Time correction mismatch. {0}ms/{1}ms"
-                        .format(time_correction, time_cor_guess_ms))
+            ttype, byteorder = self.ph5_g_receivers.trace_info(
+                trace_reference)
+            first_sample_fepoch = window_start_fepoch + cut_start_sample / sr
+            if seg is not None:
+                # Time difference between the end of the segment and the
+                # start of this window, overlaps are negative
+                time_diff = first_sample_fepoch - (
+                    seg['start_fepoch'] + seg['nsamples'] * si)
+                d['gap_overlap'] = time_diff
+                if abs(time_diff) > si or ttype != seg['ttype']:
+                    # Gap!!!
+                    seg = None
+            if seg is None:
+                seg = {'start_fepoch': first_sample_fepoch,
+                       'nsamples': 0,
+                       'ttype': ttype,
+                       'byteorder': byteorder,
+                       'das_t': [],
+                       'reads': []}
+                segments.append(seg)
+            seg['reads'].append((trace_reference, start, stop, n))
+            seg['nsamples'] += n
+            seg['das_t'].append(d)
+            # Windows that overlap by less than a sample are merged, do not
+            # over extend the segment past stop_fepoch (issue #298)
+            max_samples = int(math.ceil(round(
+                (stop_fepoch - seg['start_fepoch']) * sample_rate, 6)))
+            while seg['nsamples'] > max_samples:
+                trace_reference, start, stop, n = seg['reads'].pop()
+                over = min(n, seg['nsamples'] - max_samples)
+                seg['nsamples'] -= over
+                if n > over:
+                    seg['reads'].append(
+                        (trace_reference, start, stop - over, n - over))
+
+        return segments
+
+    def _read_segment(self, seg):
+        '''   Read the data for a segment planned by _plan_cut into a single
+              preallocated array
+        '''
+        dt = 'int32'
+        if seg['ttype'] == 'float':
+            dt = 'float32'
+        data = np.empty(seg['nsamples'], dtype=dt)
+        i = 0
+        for trace_reference, start, stop, n in seg['reads']:
+            if trace_reference.atom.dtype == data.dtype:
+                # Read straight into the output buffer
+                self.ph5_g_receivers.read_trace(trace_reference,
+                                                start=start,
+                                                stop=stop,
+                                                out=data[i:i + n])
             else:
-                time_correction = 0.
-            # Set time correction
-            t.time_correction_ms = time_correction
-            # Set receiver_t and response_t
-            t.receiver_t = receiver_t
-            t.response_t = response_t
-            ret.append(t)
-
-        if 'PH5API_DEBUG' in os.environ and os.environ['PH5API_DEBUG']:
-            for t in ret:
-                print('-=' * 40)
-                print(t)
+                data[i:i + n] = self.ph5_g_receivers.read_trace(
+                    trace_reference, start=start, stop=stop)
+            i += n
 
-        return ret
+        return data
 
     def get_extent(self, das, component, sample_rate, start=None, end=None):
         '''
@@ -1417,100 +1613,44 @@ class PH5(experiment.ExperimentGroup):
         :param end:  end time epoch
         :return: list of tuples (sample_rate, start, end)
         '''
-        das_t_t = None
-        gaps = 0
         if component is None:
             raise ValueError("Component required for get_availability")
         if sample_rate is None:
             raise ValueError("Sample rate required for get_availability")
 
-        self.read_das_t(das, start, end, reread=True)
-
-        if das not in self.Das_t:
-            das_t_t = self.query_das_t(
+        das_t = self.read_das_t(das, start, end, reread=True, as_array=True)
+        if not das_t:
+            das_t = self.query_das_t(
                 das,
                 chan=component,
                 start_epoch=start,
                 stop_epoch=end,
-                sample_rate=sample_rate)
-            if not das_t_t:
+                sample_rate=sample_rate,
+                as_array=True)
+            if not das_t:
                 LOGGER.warning("No Das table found for " + das)
                 return None
-        if not das_t_t:
-            Das_t = filter_das_t(self.Das_t[das]['rows'], component)
-        else:
-            Das_t = filter_das_t(das_t_t, component)
+        das_t = filter_das_t_array(das_t, component)
+        srs = das_t.col('sample_rate_i')
         if sample_rate > 0:
-            Das_t = [das_t for das_t in Das_t if
-                     das_t['sample_rate_i'] /
-                     das_t['sample_rate_multiplier_i'] == sample_rate]
+            das_t = das_t[srs // das_t.col('sample_rate_multiplier_i') ==
+                          sample_rate]
         else:
-            Das_t = [das_t for das_t in Das_t if
-                     das_t['sample_rate_i'] == sample_rate]
-
-        new_das_t = sorted(Das_t, key=lambda k: k['time/epoch_l'])
+            das_t = das_t[srs == sample_rate]
+        das_t = das_t[np.argsort(das_t.col('time/epoch_l'), kind='mergesort')]
 
-        if not new_das_t:
+        if not das_t:
             LOGGER.warning("No Das table found for " + das)
             return None
 
-        gaps = 0
-        prev_start = None
-        prev_end = None
-        prev_len = None
-        prev_sr = None
-        times = []
-        for entry in new_das_t:
-            # set the values for this entry
-            cur_time = (float(entry['time/epoch_l']) +
-                        float(entry['time/micro_seconds_i']) /
-                        1000000)
-            if entry['sample_rate_i'] > 0:
-                cur_len = (float(entry['sample_count_i']) /
-                           float(entry['sample_rate_i']) /
-                           float(entry['sample_rate_multiplier_i']))
-                cur_sr = (float(entry['sample_rate_i']) /
-                          float(entry['sample_rate_multiplier_i']))
-            else:
-                cur_len = 0
-                cur_sr = 0
-            cur_end = cur_time + cur_len
-
-            if (prev_start is None and prev_end is None and
-                    prev_len is None and prev_sr is None):
-                prev_start = cur_time
-                prev_end = cur_end
-                prev_len = cur_len
-                prev_sr = cur_sr
-            else:
-                if (cur_time == prev_start and
-                        cur_len == prev_len and
-                        cur_sr == prev_sr):
-                    # duplicate entry - skip
-                    continue
-                elif (cur_time > prev_end or
-                        cur_sr != prev_sr):
-                    # there is a gap so add a new entry
-                    times.append((prev_sr,
-                                  prev_start,
-                                  prev_end))
-                    # increment the number of gaps and reset previous
-                    gaps = gaps + 1
-                    prev_start = cur_time
-                    prev_end = cur_end
-                    prev_len = cur_len
-                    prev_sr = cur_sr
-                elif (cur_time == prev_end and
-                        cur_sr == prev_sr):
-                    # extend the end time since this was a continuous segment
-                    prev_end = cur_end
-                    prev_len = cur_len
-                    prev_sr = cur_sr
-
-        # add the last continuous segment
-        times.append((prev_sr,
-                      prev_start,
-                      prev_end))
+        starts, lengths, rates = das_t_windows(das_t)
+        first, last, used = merge_windows(starts, lengths, rates)
+        # Sample rate 0 is returned as int 0
+        times = [(rate or 0, first_start, last_end)
+                 for rate, first_start, last_end in
+                 zip(rates[first].tolist(),
+                     starts[first].tolist(),
+                     (starts[last] + lengths[last]).tolist())]
 
         self.forget_das_t(das)
 
@@ -1588,6 +1728,17 @@ def seed_channel_code(array_t):
         return "---"
 
 
+def das_t_order(records):
+    '''   Order of Das_t columns.Records as read_das_t orders rows, higher
+          sample rates first then by epoch.
+    '''
+    sr = records.col('sample_rate_i').astype(float)
+    srm = records.col('sample_rate_multiplier_i')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sr = np.where(sr > 0, sr / srm, 0.)
+    return np.lexsort((records.col('time/epoch_l'), -sr))
+
+
 def by_id(rows, key='id_s', secondary_key=None, unique_key=True):
     '''   Order table info by id_s (usually) then if required a secondary key.
     '''
@@ -1795,9 +1946,20 @@ def _cor(start_fepoch, stop_fepoch, Time_t, max_drift_rate=MAX_DRIFT_RATE):
         Time_t = []
 
     time_t = None
-    for t in Time_t:
-        if hasattr(t, 'corrected_i'):
-            if t['corrected_i'] != 1:
+    if isinstance(Time_t, TimeIndex):
+        time_t = Time_t.lookup(start_fepoch, stop_fepoch)
+    else:
+        for t in Time_t:
+            if hasattr(t, 'corrected_i'):
+                if t['corrected_i'] != 1:
+                    data_start = fepoch(t['start_time/epoch_l'],
+                                        t['start_time/micro_seconds_i'])
+                    data_stop = fepoch(t['end_time/epoch_l'],
+                                       t['end_time/micro_seconds_i'])
+                    if is_in(data_start, data_stop, start_fepoch, stop_fepoch):
+                        time_t = t
+                        break
+            else:
                 data_start = fepoch(t['start_time/epoch_l'],
                                     t['start_time/micro_seconds_i'])
                 data_stop = fepoch(t['end_time/epoch_l'],
@@ -1805,19 +1967,13 @@ def _cor(start_fepoch, stop_fepoch, Time_t, max_drift_rate=MAX_DRIFT_RATE):
                 if is_in(data_start, data_stop, start_fepoch, stop_fepoch):
                     time_t = t
                     break
-        else:
-            data_start = fepoch(t['start_time/epoch_l'],
-                                t['start_time/micro_seconds_i'])
-            data_stop = fepoch(t['end_time/epoch_l'],
-                               t['end_time/micro_seconds_i'])
-            if is_in(data_start, data_stop, start_fepoch, stop_fepoch):
-                time_t = t
-                break
 
     if time_t is None:
         clock.comment.append("No clock drift information available.")
         return 0., clock
 
+    data_start = fepoch(time_t['start_time/epoch_l'],
+                        time_t['start_time/micro_seconds_i'])
     clock = Clock(slope=time_t['slope_d'], offset_secs=time_t['offset_d'],
                   max_drift_rate_allowed=max_drift_rate)
     # Handle fixed offset correction
@@ -1834,6 +1990,107 @@ def _cor(start_fepoch, stop_fepoch, Time_t, max_drift_rate=MAX_DRIFT_RATE):
     return time_correction_ms, clock
 
 
+def das_t_col(das_t, key):
+    '''   Column key of Das_t as columns.Records or a list of row
+          dictionaries as a numpy array   '''
+    if isinstance(das_t, columns.Records):
+        return das_t.col(key)
+
+    return np.array([r[key] for r in das_t])
+
+
+def das_t_windows(das_t):
+    '''   Start times, lengths in seconds and sample rates of Das_t rows
+          as numpy arrays, 0 for rows without a sample rate
+          Inputs:
+             das_t -> columns.Records or a list of row dictionaries
+          Returns:
+             starts, lengths, rates
+    '''
+    def col(key):
+        return das_t_col(das_t, key)
+
+    starts = col('time/epoch_l').astype(np.float64) + \
+        col('time/micro_seconds_i') / 1000000.
+    counts = col('sample_count_i').astype(np.float64)
+    srs = col('sample_rate_i').astype(np.float64)
+    srms = col('sample_rate_multiplier_i').astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        has_rate = srs > 0
+        rates = np.where(has_rate, srs / srms, 0.)
+        # Lengths as get_availability had them
+        lengths = np.where(has_rate, counts / srs / srms, 0.)
+
+    return starts, lengths, rates
+
+
+def merge_windows(starts, lengths, rates):
+    '''   Merge windows sorted on start time into contiguous spans. A
+          window that starts where a span ends at the same rate extends
+          it, one that starts later or at another rate begins a new span
+          and one that overlaps the span is left out.
+          Inputs:
+             starts, lengths, rates -> numpy arrays of the windows
+          Returns:
+             first, last -> numpy arrays of the index of the first and
+             last window of each span
+             used -> numpy boolean array, True for windows in a span
+    '''
+    n = len(starts)
+    ends = starts + lengths
+    same = (starts[1:] == starts[:-1]) & (lengths[1:] == lengths[:-1]) & \
+        (rates[1:] == rates[:-1])
+    if not np.any(starts[1:] < ends[:-1]) and not np.any(same):
+        # No window overlaps the one before it, all are used
+        breaks = np.nonzero((starts[1:] > ends[:-1]) |
+                            (rates[1:] != rates[:-1]))[0]
+        first = np.append(0, breaks + 1)
+        last = np.append(breaks, n - 1)
+        return first, last, np.ones(n, dtype=bool)
+
+    # Merged one window at a time
+    first = []
+    last = []
+    used = np.zeros(n, dtype=bool)
+    for i in xrange(n):
+        if first:
+            j = last[-1]
+            if starts[i] == starts[first[-1]] and \
+                    lengths[i] == lengths[j] and rates[i] == rates[j]:
+                # Duplicate of the start of the span
+                continue
+            elif starts[i] > ends[j] or rates[i] != rates[j]:
+                first.append(i)
+                last.append(i)
+            elif starts[i] == ends[j]:
+                last[-1] = i
+            else:
+                continue
+        else:
+            first.append(i)
+            last.append(i)
+        used[i] = True
+
+    return np.array(first, dtype=int), np.array(last, dtype=int), used
+
+
+def filter_das_t_array(das_t, chan):
+    '''   filter_das_t for Das_t as columns.Records   '''
+    das_t = das_t[das_t.col('channel_number_i') == chan]
+    if len(das_t) > 1:
+        # Drop rows with the same time and sample rate as the row before
+        same = np.ones(len(das_t) - 1, dtype=bool)
+        for key in ('sample_rate_i', 'sample_rate_multiplier_i',
+                    'time/micro_seconds_i', 'time/epoch_l'):
+            c = das_t.col(key)
+            same &= c[1:] == c[:-1]
+        das_t = das_t[np.append(True, ~same)]
+    starts = das_t.col('time/epoch_l') + \
+        das_t.col('time/micro_seconds_i') / 1000000.
+
+    return das_t[np.argsort(starts, kind='mergesort')]
+
+
 def filter_das_t(Das_t, chan):
     def sort_on_epoch(a, b):
         a_epoch = a['time/epoch_l'] + \
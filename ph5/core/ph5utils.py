@@ -10,6 +10,12 @@ ph5toexml.py.
 # add inday_breakup() function
 
 import fnmatch
+import collections
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
 from datetime import datetime, timedelta
 from obspy.geodetics import locations2degrees
 from ph5.core.timedoy import epoch2passcal, passcal2epoch, TimeDOY, TimeError
@@ -17,6 +23,11 @@ import time
 import re
 
 PROG_VERSION = "2019.81"
+LOGGER = logging.getLogger(__name__)
+# Responses PH5ResponseCache keeps in memory
+RESPONSE_CACHE_SIZE = 256
+# Bytes of response pickle files PH5ResponseCache keeps on disk
+RESPONSE_CACHE_BYTES = 256 * 1024 * 1024
 
 
 class PH5Response(object):
@@ -68,6 +79,127 @@ class PH5ResponseManager(object):
                 return ph5_resp.n_i
 
 
+class PH5ResponseCache(object):
+    """
+    Least recently used cache of parsed responses shared between requests,
+    keyed on (experiment file, response array name, mtime of the file).
+    Responses are kept pickled so get returns a new object each time that
+    the caller can change. With path set the pickles are also kept as
+    files in path, so processes given the same path share them. Only
+    point path at a directory this service alone writes to.
+    :param: path : directory of the pickle files, None to keep them in
+        memory only
+    :param: maxsize : Maximum number of responses kept in memory
+    :param: maxbytes : Maximum bytes of pickle files kept in path
+    """
+
+    def __init__(self, path=None, maxsize=RESPONSE_CACHE_SIZE,
+                 maxbytes=RESPONSE_CACHE_BYTES):
+        self.path = path
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self.responses = collections.OrderedDict()
+
+    def clear(self):
+        self.responses.clear()
+
+    @staticmethod
+    def get_key(filename, name):
+        """
+        Returns the cache key of response array name of ph5 file filename
+        """
+        filename = os.path.abspath(filename)
+        return filename, name, os.path.getmtime(filename)
+
+    def get_filename(self, key):
+        return os.path.join(self.path,
+                            hashlib.sha1(repr(key)).hexdigest() + '.pickle')
+
+    def get(self, key):
+        """
+        Returns the response cached under key, None if there is none
+        """
+        data = self.responses.pop(key, None)
+        if data is None and self.path:
+            filename = self.get_filename(key)
+            try:
+                with open(filename, 'rb') as fh:
+                    data = fh.read()
+                # Least recently used files are evicted first
+                os.utime(filename, None)
+            except (IOError, OSError):
+                data = None
+        if data is None:
+            self.misses += 1
+            return None
+        try:
+            response = pickle.loads(data)
+        except Exception:
+            LOGGER.warning("Ignoring unreadable cached response {0}"
+                           .format(key[1]))
+            self.misses += 1
+            return None
+        # Most recently used is last
+        self.add(key, data)
+        self.hits += 1
+        return response
+
+    def add(self, key, data):
+        self.responses[key] = data
+        while len(self.responses) > self.maxsize:
+            self.responses.popitem(last=False)
+
+    def put(self, key, response):
+        """
+        Cache response under key
+        """
+        data = pickle.dumps(response, pickle.HIGHEST_PROTOCOL)
+        self.add(key, data)
+        if not self.path:
+            return
+        try:
+            if not os.path.exists(self.path):
+                os.makedirs(self.path)
+            # Written to a temporary file and renamed so other processes
+            # never read part of a file
+            fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(data)
+            os.rename(tmp, self.get_filename(key))
+            self.evict()
+        except (IOError, OSError) as e:
+            LOGGER.warning("Failed to write response cache: {0}".format(e))
+
+    def evict(self):
+        """
+        Remove the least recently used pickle files until they take up
+        maxbytes or less
+        """
+        files = []
+        nbytes = 0
+        for f in os.listdir(self.path):
+            if not f.endswith('.pickle'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.path, f))
+            except OSError:
+                # removed by another process
+                continue
+            files.append((st.st_mtime, st.st_size, f))
+            nbytes += st.st_size
+        files.sort()
+        for mtime, size, f in files:
+            if nbytes <= self.maxbytes:
+                break
+            try:
+                os.remove(os.path.join(self.path, f))
+            except OSError:
+                pass
+            nbytes -= size
+
+
 """
 ===============
 Utility methods
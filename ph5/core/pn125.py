@@ -11,6 +11,7 @@ import os
 import struct
 import sys
 import logging
+import numpy as np
 import rt_125a_py
 
 PROG_VERSION = '2018.268'
@@ -26,10 +27,31 @@ TRDPAGE = 528
 TRDBLOCK = TRDPAGE * 66
 
 
+# Columns of the page header array returned by rt_125a_py.read_pages,
+# columns from gain are -1 if the page is not a data page, year to
+# sample_rate are -1 if the page has no extended header. The samples of a
+# data page are samples[offset:offset + count].
+PAGE_COLUMNS = ('page_type', 'unit_id', 'sequence', 'flags',
+                'gain', 'event', 'samples',
+                'year', 'doy', 'hour', 'minute', 'seconds', 'sample_rate',
+                'offset', 'count')
+PAGE_DTYPE = np.dtype([(c, np.int32) for c in PAGE_COLUMNS])
+
+
 class TRDError (exceptions.Exception):
     pass
 
 
+def decode_pages(buf):
+    '''   Decode all pages in buf with one call to rt_125a_py.
+          Returns an array of PAGE_DTYPE page headers and an int32 array
+          of the samples of all data pages in page order.
+    '''
+    headers, samples = rt_125a_py.read_pages(buf)
+
+    return headers.view(PAGE_DTYPE).reshape(len(headers)), samples
+
+
 class ReadBuffer (object):
     '''   buf = string buffer
           ptr = next read position
@@ -411,6 +433,93 @@ class pn125:
                 self.closeEvent()
                 return self.trace.sampleCount
 
+    def getEvents(self):
+        '''   Read the whole file and decode all of its pages at once.
+              Yields (Event125, Page125) for each event as getEvent
+              would return them, the trace of an event is an int32
+              array. SOH and event table pages are read into sohbuf and
+              eventTable.
+        '''
+        try:
+            with open(self.filename, 'rb') as fh:
+                buf = fh.read()
+            headers, samples = decode_pages(buf)
+        except Exception as e:
+            raise TRDError(e)
+
+        types = headers['page_type']
+        flags = headers['flags']
+        good = (types != 0xFF) & (types != 0x00)
+        data = headers['offset'] >= 0
+        # Pages that end an event
+        last = good & (flags & 0x02 != 0) & (types != 5)
+        ends = np.flatnonzero(last)
+        # Event of each page, its samples are contiguous
+        event_of = np.cumsum(last) - last
+        sample_ends = np.cumsum(np.where(data, headers['count'], 0))
+        # First page with an extended header, last data page of each event
+        first_ext = np.full(len(ends) + 1, len(headers), dtype=np.intp)
+        ext = np.flatnonzero(data & (flags & 0x05 != 0))
+        np.minimum.at(first_ext, event_of[ext], ext)
+        last_data = np.full(len(ends) + 1, -1, dtype=np.intp)
+        in_page = np.flatnonzero(data)
+        np.maximum.at(last_data, event_of[in_page], in_page)
+
+        # SOH, event table and unrecognized pages are read one at a time
+        other = good & (types != 3)
+        for i in np.flatnonzero(other | last):
+            page_type = types[i]
+            try:
+                b = buf[i * TRDPAGE + 7:(i + 1) * TRDPAGE]
+                if page_type == 1:
+                    self.soh(b)
+                elif page_type == 5:
+                    self.table(b)
+                elif page_type != 3:
+                    LOGGER.warning(
+                        "Unrecognized page type: %d" % page_type)
+            except Exception as e:
+                raise TRDError(e)
+
+            if not last[i]:
+                continue
+
+            k = event_of[i]
+            start = sample_ends[ends[k - 1]] if k else 0
+            trace = Event125()
+            trace.trace = samples[start:sample_ends[i]]
+            trace.sampleCount = len(trace.trace)
+            if trace.sampleCount == 0:
+                # As getEvent, an empty event ends the file
+                return
+
+            trace.event = int(headers['event'][last_data[k]])
+            j = first_ext[k]
+            if j < len(headers):
+                h = headers[j]
+                trace.year = int(h['year'])
+                trace.doy = int(h['doy'])
+                trace.hour = int(h['hour'])
+                trace.minute = int(h['minute'])
+                trace.seconds = int(h['seconds'])
+                trace.sampleRate = int(h['sample_rate'])
+                try:
+                    trace.fsd, trace.gain = self.extg(int(h['gain']))
+                except Exception as e:
+                    raise TRDError(e)
+
+            page = Page125()
+            page.pageType = int(page_type)
+            page.unitID = int(headers['unit_id'][i]) + 10000
+            page.sequence = int(headers['sequence'][i])
+            page.first = int(flags[i] & 0x01)
+            page.last = int(flags[i] & 0x02) >> 1
+            page.ext = int(flags[i] & 0x04) >> 2
+            self.trace = trace
+            self.page = page
+
+            yield trace, page
+
 
 if __name__ == "__main__":
     import time
@@ -78,8 +78,10 @@ class ReadBuffer(object):
     '''   buf = string buffer
           ptr = next read position
           len = total len of buffer in bytes
+          packets = all packets of buf decoded by rt_130_h.decode_packets
     '''
-    __slots__ = 'buf', 'ptr', 'len', 'set', 'clear', 'rewind', 'inc'
+    __slots__ = 'buf', 'ptr', 'len', 'packets', 'set', 'clear', 'rewind', \
+        'inc', 'packet'
 
     def __init__(self):
         self.clear()
@@ -88,11 +90,31 @@ class ReadBuffer(object):
         self.buf = b
         self.len = len(b)
         self.ptr = 0
+        self.packets = None
 
     def clear(self):
         self.buf = None
         self.ptr = None
         self.len = None
+        self.packets = None
+
+    def packet(self):
+        '''   Return the decoded header row and the samples of the last
+              packet read from buf, or None. All packets of buf are
+              decoded on the first call.
+        '''
+        if not self.buf or self.ptr % PACKET_SIZE:
+            return None
+
+        if self.packets is None:
+            self.packets = rt_130_h.decode_packets(self.buf)
+
+        types, headers, samples = self.packets
+        i = self.ptr // PACKET_SIZE - 1
+        if i < 0 or i >= len(headers):
+            return None
+
+        return headers[i], samples
 
     def rewind(self):
         self.set('')
@@ -1530,7 +1552,7 @@ class PN130:
             self.DTcnt += 1
             try:
                 dt = rt_130_h.DT()
-                c = dt.decode(pbuf)
+                c = dt.decode(pbuf, self.reader.buf.packet())
                 packet_data_stream = c.data_stream
                 packet_event_number = c.event
                 packet_channel_number = c.channel
@@ -1557,9 +1579,9 @@ class PN130:
             if c.data_format == 0xc0 or c.data_format == 0xc2:
                 # x0 = c.data[-2]
                 xn = c.data[-1]
-                del c.data[-2:]
+                c.data = c.data[:-2]
 
-                if self.verbose and c.data:
+                if self.verbose and len(c.data):
                     if xn != c.data[-1]:
                         self.ERRS.append(
                             "Garbled data packet at:"
@@ -1877,7 +1899,7 @@ class PN130:
                 return pbuf
             else:
                 dt = rt_130_h.DT()
-                ttmp = dt.decode(pbuf)
+                ttmp = dt.decode(pbuf, self.reader.buf.packet())
                 if self.SEEN[ttmp.data_stream] is True:
                     return pbuf
 
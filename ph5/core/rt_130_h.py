@@ -13,6 +13,7 @@ import exceptions
 import os
 import os.path
 import string
+import numpy as np
 import rt_130_py
 import construct
 
@@ -254,7 +255,11 @@ class DT(object):
 
         return ret
 
-    def decode(self, buf):
+    def decode(self, buf, packet=None):
+        '''   packet -- the header row and samples of buf from
+                        decode_packets, used instead of decoding the data
+                        again if it was decoded.
+        '''
         try:
             dt = DT_object()
             ret = rt_130_py.get_data_header(buf)
@@ -264,7 +269,11 @@ class DT(object):
             dt.samples = ret[3]
             dt.flags = ret[4]
             dt.data_format = ret[5]
-            if dt.data_format == 0x16:
+            if packet is not None and packet[0]['offset'] >= 0:
+                header, samples = packet
+                dt.data = samples[header['offset']:
+                                  header['offset'] + decoded_size(header)]
+            elif dt.data_format == 0x16:
                 dt.data = rt_130_py.read_int16(buf, dt.samples)
             elif dt.data_format == 0x32:
                 dt.data = rt_130_py.read_int32(buf, dt.samples)
@@ -295,6 +304,56 @@ class DT(object):
         return dt
 
 
+#
+# Decode all packets of a buffer at once
+#
+# Columns of the header array returned by rt_130_py.read_packets, data
+# packet columns are -1 for other packets. Samples of packet i are
+# samples[offset:offset + count], followed by x0 and xn for steim data as
+# read_steim1 and read_steim2 return them. offset is -1 if the data could
+# not be decoded.
+PACKET_COLUMNS = ('experiment', 'year', 'unit', 'doy', 'hr', 'mn', 'sc',
+                  'ms', 'bytes', 'sequence',
+                  'event', 'data_stream', 'channel', 'samples', 'flags',
+                  'data_format', 'offset', 'count', 'x0', 'xn')
+PACKET_DTYPE = np.dtype([(c, np.int32) for c in PACKET_COLUMNS])
+STEIM_FORMATS = (0xc0, 0xc2)
+
+
+def decoded_size(header):
+    '''   Number of values kept in samples for a decoded data packet   '''
+    if header['data_format'] in STEIM_FORMATS:
+        return header['count'] + 2
+
+    return header['count']
+
+
+def decode_packets(buf):
+    '''   Decode all 1024 byte packets in buf, a string or a memory map,
+          with one call to rt_130_py.
+          Returns the packet types, an array of PACKET_DTYPE packet
+          headers and an int32 array of samples.
+    '''
+    headers, samples = rt_130_py.read_packets(buf)
+    num_packets = len(headers)
+    types = np.frombuffer(buf, dtype='S2', count=num_packets * 512)[::512]
+
+    return types, headers.view(PACKET_DTYPE).reshape(num_packets), samples
+
+
+def group_samples(traces):
+    '''   Join the samples of the DT packets of one unit, data stream,
+          channel and event, in packet order, with one copy.
+          traces -- the samples of each packet, slices of the
+                    decode_packets samples or lists
+          Returns an int32 array.
+    '''
+    if len(traces) == 0:
+        return np.zeros(0, dtype=np.int32)
+
+    return np.concatenate([np.asarray(t, dtype=np.int32) for t in traces])
+
+
 class EH_object(object):
     __slots__ = (
         'EventNumber', 'DataStream', 'Flags', 'DataFormat',
@@ -9,8 +9,10 @@
 
 import exceptions
 import sys
+import binascii
 import construct
 import bcd_py
+import numpy
 
 PROG_VERSION = '2016.287 Developmental'
 
@@ -2361,3 +2363,198 @@ def convert_bcd_fields(ret, nbcd, nnibbles):
         ret[k] = bcd_py.bcd2int(bcd, 0, n)
 
     return ret
+
+
+#
+# Decode many trace headers at once
+#
+# (name, number of bytes, kind)
+#   kind: 'u' -> unsigned big endian
+#         's' -> signed big endian
+#         'n' -> unsigned native byte order, a swapped BitField
+#         'f' -> big endian IEEE float
+#         'bcd' -> BCD, 2 digits per byte
+#         'fraction' -> 16 bit fixed point binary fraction
+#         'bits' -> swapped BitField in a Struct, one bit per byte
+#
+TRACE_HEADER_FIELDS = (
+    (("tape_file", 2, 'bcd'),
+     ("scan_type", 1, 'bcd'),
+     ("channel_set", 1, 'bcd'),
+     ("trace_number", 2, 'bcd'),
+     ("first_timing_word", 3, 'bcd'),
+     ("trace_extension_blocks", 1, 'n'),
+     ("sample_skew_value", 1, 'n'),
+     ("trace_edit_code", 1, 'n'),
+     ("time_break_window", 3, 'n'),
+     ("extended_channel_set", 2, 'n'),
+     ("extended_file_number", 3, 'n')),
+    (("receiver_line", 3, 'u'),
+     ("receiver_point", 3, 'u'),
+     ("receiver_point_index", 1, 'u'),
+     ("samples_per_trace", 3, 'u'),
+     ("extended_receiver_line_number", 5, 'u'),
+     ("extended_receiver_point_number", 5, 'u'),
+     ("sensor_type", 1, 'u'),
+     ("reserved01", 11, 'u')),
+    (("shot_line", 4, 'u'),
+     ("shot_point", 4, 'u'),
+     ("shot_point_index", 1, 'u'),
+     ("shot_point_X", 4, 'u'),
+     ("shot_point_Y", 4, 'u'),
+     ("shot_point_X_final", 4, 'u'),
+     ("shot_point_Y_final", 4, 'u'),
+     ("shot_point_depth_final", 4, 'u'),
+     ("final_shot_info", 1, 'u'),
+     ("energy_source", 1, 'u'),
+     ("reserved01", 1, 'u')),
+    (("shot_epoch", 8, 'u'),
+     ("shot_skew_time", 8, 'u'),
+     ("clock_correction", 8, 'u'),
+     ("clock_correction_not_applied", 8, 'u')),
+    (("pre_shot_guard_band", 4, 'u'),
+     ("post_shot_guard_band", 4, 'u'),
+     ("preamp_gain_db", 1, 'u'),
+     ("trace_flag", 1, 'u'),
+     ("record_type", 1, 'u'),
+     ("shot_status", 1, 'u'),
+     ("reserved01", 4, 'u'),
+     ("reserved02", 8, 'u'),
+     ("first_break_pick_time", 4, 'f'),
+     ("rms_noise", 4, 'f')),
+    (("line_number", 4, 'u'),
+     ("point", 4, 'u'),
+     ("point_index", 1, 'u'),
+     ("receiver_point_X", 4, 'u'),
+     ("receiver_point_Y", 4, 'u'),
+     ("receiver_point_X_final", 4, 'u'),
+     ("receiver_point_Y_final", 4, 'u'),
+     ("receiver_point_depth_final", 4, 'u'),
+     ("receiver_info", 1, 'u'),
+     ("reserved01", 2, 'u')),
+    (("H1X", 4, 'f'),
+     ("H2X", 4, 'f'),
+     ("VX", 4, 'f'),
+     ("H1Y", 4, 'f'),
+     ("H2Y", 4, 'f'),
+     ("VY", 4, 'f'),
+     ("H1Z", 4, 'f'),
+     ("H2Z", 4, 'f')),
+    (("VZ", 4, 'f'),
+     ("azimuth", 4, 'f'),
+     ("pitch", 4, 'f'),
+     ("roll", 4, 'f'),
+     ("remote_temp", 4, 'f'),
+     ("remote_humidity", 4, 'f'),
+     ("reserved01", 8, 'u')),
+    (("test_code", 4, 'u'),
+     ("first_test_oscillator_attenuation", 4, 'u'),
+     ("second_test_oscillator_attenuation", 4, 'u'),
+     ("start_delay_usec", 4, 'u'),
+     ("dc_filter", 4, 'u'),
+     ("dc_filter_freq", 4, 'u'),
+     ("pre_amp_path", 4, 'u'),
+     ("oscillator_siganl_type", 4, 'u')),
+    (("generator_signal_type", 4, 'u'),
+     ("generator_freq_1", 4, 'u'),
+     ("generator_freq_2", 4, 'u'),
+     ("generator amplitude_1", 4, 'u'),
+     ("generator_amplitude_2", 4, 'u'),
+     ("generator_duty_cycle", 4, 'u'),
+     ("generator_duration_usec", 4, 'u'),
+     ("generator_activation_time_usec", 4, 'u')),
+    (("idle_level", 4, 'u'),
+     ("active_level", 4, 'u'),
+     ("generator_pattern_1", 4, 'u'),
+     ("generator_patern_2", 4, 'u'),
+     ("reserved01", 16, 'bits')))
+
+#   BCD_DIGITS[b] -> (high nibble, low nibble)
+BCD_DIGITS = numpy.array([(b >> 4, b & 0x0F) for b in range(256)],
+                         dtype=numpy.int64)
+
+
+def bcd_to_int(raw):
+    '''   Vectorized bcd_py.bcd2int of all digits of each row of raw   '''
+    ret = numpy.zeros(len(raw), dtype=numpy.int64)
+    for digits in BCD_DIGITS[raw].transpose(1, 2, 0).reshape(-1, len(raw)):
+        ret = numpy.where(digits > 9, ret * 16 + digits, ret * 10 + digits)
+
+    return ret
+
+
+class Header_layout (object):
+    '''   A byte aligned header block, decoded for many headers at once
+          with numpy giving the same values as the construct parsers.
+          fields -> ((name, number of bytes, kind), ...)
+    '''
+    __slots__ = ('fields', 'size')
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.size = sum(f[1] for f in fields)
+
+    def decode_field(self, b, kind):
+        '''   Returns a list of the values of a field,
+              b -> uint8 array of the bytes of the field, one row per header
+        '''
+        nbytes = b.shape[1]
+        if kind == 'bcd':
+            return bcd_to_int(b).tolist()
+        if kind == 'f':
+            return numpy.ascontiguousarray(b).view('>f4')[:, 0].tolist()
+        if kind == 'bits':
+            b = b & 1
+            if sys.byteorder != 'big':
+                # Same byte order as construct.lib.swap_bytes
+                b = b[:, [ord(c) for c in construct.lib.swap_bytes(
+                    "".join(map(chr, range(nbytes))))]]
+            col = numpy.zeros(len(b), dtype=numpy.int64)
+            for i in range(nbytes):
+                col = (col << 1) | b[:, i]
+            return col.tolist()
+        if kind == 'n' and sys.byteorder != 'big':
+            b = b[:, ::-1]
+        if nbytes >= 8:
+            col = None
+            if nbytes == 8:
+                col = numpy.ascontiguousarray(b).view('>u8')[:, 0]
+            if col is None or (col >> 63).any():
+                # Python integers of any size
+                return [int(binascii.hexlify(r.tostring()), 16) for r in b]
+            return col.astype(numpy.int64).tolist()
+
+        col = numpy.zeros(len(b), dtype=numpy.int64)
+        for i in range(nbytes):
+            col = (col << 8) | b[:, i]
+        if kind == 's':
+            nbits = nbytes * 8
+            col = col - (col >> (nbits - 1)) * 2 ** nbits
+        elif kind == 'fraction':
+            col = col / float(2 ** 16)
+
+        return col.tolist()
+
+    def decode(self, raw):
+        '''   Returns a construct.Container for each header,
+              raw -> uint8 array, one header per row
+        '''
+        names = [f[0] for f in self.fields]
+        columns = []
+        offset = 0
+        for name, nbytes, kind in self.fields:
+            columns.append(self.decode_field(raw[:, offset:offset + nbytes],
+                                             kind))
+            offset += nbytes
+
+        ret = []
+        for i in xrange(len(raw)):
+            c = construct.Container()
+            dict.update(c, zip(names, [col[i] for col in columns]))
+            object.__setattr__(c, '__keys_order__', list(names))
+            ret.append(c)
+
+        return ret
+
+
+TRACE_HEADER_LAYOUTS = [Header_layout(f) for f in TRACE_HEADER_FIELDS]
@@ -12,6 +12,8 @@ import sys
 import construct
 import bcd_py
 
+from ph5.core.segd_h import Header_layout
+
 PROG_VERSION = "2021.130"
 
 
@@ -342,3 +344,28 @@ class Trace_header_extension(Header_block):
         if n == 6:
             self.keys = (
                 ("not_used", 32*8),)
+
+
+def header_layout(keys):
+    """
+    segd_h.Header_layout giving the same values as Header_block.parse
+    : keys param: keys of a byte aligned header block
+    """
+    fields = []
+    for k in keys:
+        if 'fraction' in k[0]:
+            kind = 'fraction'
+        elif len(k) < 3:
+            kind = 'u'
+        elif k[2] == 'bcd':
+            kind = 'bcd'
+        else:
+            kind = 's'
+        fields.append((k[0], k[1] / 8, kind))
+    return Header_layout(tuple(fields))
+
+
+TRACE_HEADER_LAYOUT = header_layout(Trace_header.keys)
+# Extensions after the 7th have no keys
+TRACE_HEADER_EXTENSION_LAYOUTS = [
+    header_layout(Trace_header_extension(i).keys) for i in range(7)]
@@ -10,11 +10,17 @@ import sys
 import logging
 import os
 import exceptions
+import collections
+import itertools
+import mmap
 import numpy as np
+import bcd_py
 from ph5.core import segd_h
 
 PROG_VERSION = "2021.112"
 LOGGER = logging.getLogger(__name__)
+# Number of trace headers decoded at once by process_trace_headers
+TRACE_HEADER_BATCH = 1024
 
 
 class InputsError (exceptions.Exception):
@@ -60,10 +66,13 @@ class TraceHeaders (object):
 
 
 class Reader ():
-    def __init__(self, infile=None):
+    def __init__(self, infile=None, use_mmap=False):
         self.manufacturer = 'FairfieldNodal'
         self.infile = infile
         self.FH = None
+        # Memory map of infile, read_trace returns views of it
+        self.use_mmap = use_mmap
+        self.MM = None
         self.endianess = 'big'  # SEG-D is always big endian(?)
         # From General headers
         self.file_number = None
@@ -82,6 +91,10 @@ class Reader ():
         # From trace headers
         self.samples = None
         self.bytes_read = 0
+        # Decoded trace headers, (TraceHeaders, size in bytes)
+        self.decoded_trace_headers = collections.deque()
+        # Trace headers decoded at once, 1 to parse one trace at a time
+        self.trace_header_batch = TRACE_HEADER_BATCH
 
     def open_infile(self):
         try:
@@ -89,6 +102,16 @@ class Reader ():
         except Exception as e:
             LOGGER.error(e)
             self.FH = None
+            return
+
+        if self.use_mmap:
+            try:
+                self.MM = mmap.mmap(self.FH.fileno(), 0,
+                                    access=mmap.ACCESS_READ)
+            except Exception as e:
+                LOGGER.warning(
+                    "Can't memory map {0}: {1}".format(self.infile, e))
+                self.MM = None
 
     def read_buf(self, size):
         buf = None
@@ -405,9 +428,70 @@ class Reader ():
 
         return container
 
+    def decode_trace_headers(self, count):
+        '''   Decode the headers of up to count traces after the file
+              position at once and keep them for process_trace_headers.
+              The file position is not changed. Decoding stops before
+              a trace that process_trace_headers would fail to read.
+        '''
+        pos = self.FH.tell()
+        raws = []
+        try:
+            while len(raws) < count:
+                buf = self.FH.read(20)
+                if len(buf) != 20:
+                    break
+                n = ord(buf[9])
+                if n == 0:
+                    chan_set = bcd_py.bcd2int(buf[3], 0, 2) - 1
+                    n = self.reel_headers.channel_set_descriptor[chan_set].\
+                        number_trace_header_extensions
+                # Only 10 are read
+                n = min(n, 10)
+                if n < 5:
+                    break
+                buf += self.FH.read(32 * n)
+                if len(buf) != 20 + 32 * n:
+                    break
+                # samples_per_trace of trace header 1
+                samples = int(buf[27:30].encode('hex'), 16)
+                self.FH.seek(4 * samples, os.SEEK_CUR)
+                raws.append((n, buf))
+        except Exception:
+            pass
+        finally:
+            self.FH.seek(pos)
+
+        # Traces with the same number of extensions are decoded together
+        for n, group in itertools.groupby(raws, key=lambda r: r[0]):
+            bufs = [r[1] for r in group]
+            raw = np.frombuffer("".join(bufs), dtype=np.uint8).reshape(
+                len(bufs), -1)
+            layouts = segd_h.TRACE_HEADER_LAYOUTS
+            ths = layouts[0].decode(raw[:, :20])
+            thNs = [layouts[i + 1].decode(raw[:, 20 + 32 * i:52 + 32 * i])
+                    for i in range(n)]
+            for j in range(len(bufs)):
+                trace_headers = TraceHeaders()
+                trace_headers.trace_header = ths[j]
+                trace_headers.trace_header_N = [thN[j] for thN in thNs]
+                set_trace_header_values(trace_headers)
+                self.decoded_trace_headers.append((trace_headers,
+                                                   len(bufs[j])))
+
     def process_trace_headers(self):
-        self.trace_headers = TraceHeaders()
+        if not self.decoded_trace_headers and self.trace_header_batch > 1:
+            self.decode_trace_headers(self.trace_header_batch)
+        if self.decoded_trace_headers:
+            self.trace_headers, size = \
+                self.decoded_trace_headers.popleft()
+            self.FH.seek(size, os.SEEK_CUR)
+            self.bytes_read += size
+            self.samples = self.trace_headers.trace_header_N[
+                0].samples_per_trace
+            return self.samples
 
+        self.trace_headers = TraceHeaders()
         self.trace_headers.trace_header = self.read_trace_header()
         n = self.trace_headers.trace_header.trace_extension_blocks
         if n == 0:
@@ -456,20 +540,7 @@ class Reader ():
         # Note: SEG-D 2.1 allows a total of 15 trace header extensions.
         # We only read 10 as per Fairfield rg1.6
 
-        self.trace_headers.line_number = self.trace_headers.trace_header_N[
-            4].line_number
-        self.trace_headers.event_number = self.trace_headers.trace_header_N[
-            1].shot_point
-        self.trace_headers.trace_epoch = self.trace_headers.trace_header_N[
-            2].shot_epoch
-        self.trace_headers.preamp_gain_db = self.trace_headers.trace_header_N[
-            3].preamp_gain_db
-        self.trace_headers.lat = self.trace_headers.trace_header_N[
-            4].receiver_point_Y_final
-        self.trace_headers.lon = self.trace_headers.trace_header_N[
-            4].receiver_point_X_final
-        self.trace_headers.ele = self.trace_headers.trace_header_N[
-            4].receiver_point_depth_final
+        set_trace_header_values(self.trace_headers)
 
         self.samples = self.trace_headers.trace_header_N[
             0].samples_per_trace
@@ -492,6 +563,9 @@ class Reader ():
             general_header_blocks[0].data_sample_format_code
 
         bytes_per_sample = 4  # Assumes 32 bit IEEE floats
+        if f == 8058 and self.MM is not None:
+            return self.read_trace_view(bytes_per_sample * number_of_samples)
+
         buf = self.read_buf(bytes_per_sample * number_of_samples)
         # IEEE floats - 4 byte - Should be big endian
         if f == 8058:
@@ -511,6 +585,25 @@ class Reader ():
 
         return ret
 
+    def read_trace_view(self, size):
+        '''   Return the next size bytes of 32 bit IEEE floats as a view
+              of the memory map, in file byte order   '''
+        offset = self.FH.tell()
+        size = max(min(size, len(self.MM) - offset), 0)
+        if size % 4:
+            raise InputsError(
+                "Error: Could not read data trace: "
+                "string size must be a multiple of element size")
+        self.FH.seek(size, os.SEEK_CUR)
+        self.bytes_read += size
+        dtype = np.dtype(np.float32).newbyteorder(
+            '>' if self.endianess == 'big' else '<')
+        if size == 0:
+            return np.empty(0, dtype=dtype)
+
+        return np.frombuffer(self.MM, dtype=dtype, count=size // 4,
+                             offset=offset)
+
     def process_trace(self, trace_index):
         samples = self.process_trace_headers()
         ret = self.read_trace(samples)
@@ -530,7 +623,56 @@ class Reader ():
             return False
         except EOFError:
             self.FH.close()
+            # Views of the memory map keep it open until they are freed
+            self.MM = None
             return True
+
+
+def set_trace_header_values(trace_headers):
+    '''   Set the values of trace_headers read from its extensions   '''
+    thN = trace_headers.trace_header_N
+    trace_headers.line_number = thN[4].line_number
+    trace_headers.event_number = thN[1].shot_point
+    trace_headers.trace_epoch = thN[2].shot_epoch
+    trace_headers.preamp_gain_db = thN[3].preamp_gain_db
+    trace_headers.lat = thN[4].receiver_point_Y_final
+    trace_headers.lon = thN[4].receiver_point_X_final
+    trace_headers.ele = thN[4].receiver_point_depth_final
+
+
+def join_traces(traces):
+    '''   Join trace arrays into one float32 array in native byte order.
+          Traces that are evenly spaced views of the same buffer, as
+          read_trace returns for a channel set of a memory mapped file,
+          are copied and byte swapped in one pass through a strided view.
+    '''
+    if len(traces) == 1:
+        return traces[0].astype(np.float32, copy=False)
+
+    first = traces[0]
+    n = first.size
+    if n and first.base is not None and \
+            all(t.base is first.base and t.size == n and
+                t.dtype == first.dtype for t in traces):
+        addresses = [t.__array_interface__['data'][0] for t in traces]
+        stride = addresses[1] - addresses[0]
+        if stride >= n * first.itemsize and \
+                all(b - a == stride
+                    for a, b in zip(addresses, addresses[1:])):
+            view = np.lib.stride_tricks.as_strided(
+                first, shape=(len(traces), n),
+                strides=(stride, first.itemsize))
+            return view.astype(np.float32).reshape(-1)
+
+    ret = np.empty(sum(t.size for t in traces), dtype=np.float32)
+    i = 0
+    for t in traces:
+        ret[i:i + t.size] = t
+        i += t.size
+
+    return ret
+
+
 #
 # Mix in's
 #
@@ -11,6 +11,9 @@ import sys
 import logging
 import os
 import exceptions
+import collections
+import itertools
+import mmap
 
 import numpy as np
 try:
@@ -21,10 +24,13 @@ except ImportError:
     raise ImportError(errmsg)
 
 from ph5.core import segd_h_smartsolo as segd_h
+from ph5.core.segd_h import Header_layout
 from ph5.core.timedoy import TimeDOY
 
 PROG_VERSION = "2021.155"
 LOGGER = logging.getLogger(__name__)
+# Number of trace headers decoded at once by process_trace_headers
+TRACE_HEADER_BATCH = 1024
 
 
 class InputsError (exceptions.Exception):
@@ -72,10 +78,13 @@ class TraceHeaders (object):
 
 
 class Reader ():
-    def __init__(self, infile=None):
+    def __init__(self, infile=None, use_mmap=False):
         self.manufacturer = 'SmartSolo'
         self.infile = infile
         self.FH = None
+        # Memory map of infile, read_trace returns views of it
+        self.use_mmap = use_mmap
+        self.MM = None
         self.endianess = 'big'  # SEG-D is always big endian(?)
         # From General headers
         self.file_number = None
@@ -93,6 +102,10 @@ class Reader ():
         self.samples = None
         self.bytes_read = 0
         self.id_number = None
+        # Decoded trace headers, (TraceHeaders, size in bytes, epoch)
+        self.decoded_trace_headers = collections.deque()
+        # Trace headers decoded at once, 1 to parse one trace at a time
+        self.trace_header_batch = TRACE_HEADER_BATCH
 
     def open_infile(self):
         try:
@@ -100,6 +113,16 @@ class Reader ():
         except Exception as e:
             LOGGER.error(e)
             self.FH = None
+            return
+
+        if self.use_mmap:
+            try:
+                self.MM = mmap.mmap(self.FH.fileno(), 0,
+                                    access=mmap.ACCESS_READ)
+            except Exception as e:
+                LOGGER.warning(
+                    "Can't memory map {0}: {1}".format(self.infile, e))
+                self.MM = None
 
     def read_buf(self, size):
         buf = None
@@ -253,44 +276,118 @@ class Reader ():
         self.reel_headers.external_header = self.read_block(
             1024, segd_h.External_header_block())
 
-    def process_trace_headers(self):
-        self.trace_headers = TraceHeaders()
-
-        self.trace_headers.trace_header = self.read_block(
-            20, segd_h.Trace_header())
-        n = self.trace_headers.trace_header.trace_extension_blocks
-        for i in range(n):
-            self.trace_headers.trace_header_N.append(
-                self.read_block(32, segd_h.Trace_header_extension(i)))
-
-        self.id_number = self.trace_headers.trace_header_N[
-            5].unit_serial_number
-        self.trace_headers.event_number = \
-            self.trace_headers.trace_header.trace_number
+    def set_trace_header_values(self, trace_headers):
+        """
+        Set the values of trace_headers read from its extensions,
+        except trace_epoch
+        """
+        trace_headers.event_number = trace_headers.trace_header.trace_number
 
-        thN0 = self.trace_headers.trace_header_N[0]
-        self.samples = thN0.samples_per_trace
+        thN0 = trace_headers.trace_header_N[0]
         # ignore fraction part
-        self.trace_headers.line_number = \
+        trace_headers.line_number = \
             thN0.extended_receiver_line_number_integer
-        self.trace_headers.receiver_point = \
+        trace_headers.receiver_point = \
             thN0.extended_receiver_point_number_integer
 
-        thN3 = self.trace_headers.trace_header_N[3]
-        self.trace_headers.lat = self.degree2decimal(thN3.IGU_GPS_lat_integer,
-                                                     thN3.IGU_GPS_lat_fraction)
-        self.trace_headers.lon = self.degree2decimal(thN3.IGU_GPS_lon_integer,
-                                                     thN3.IGU_GPS_lon_fraction)
-        self.trace_headers.ele = thN3.IGU_GPS_height
-        self.trace_headers.preamp_gain_db = self.preamp_gain_db
-        TB_GPS_time_time_sec = self.trace_headers.trace_header_N[
-                                  1].TB_GPS_time_microsec/1000000.
-        # Use astropy package to convert time from gps to utc
-        # https: // docs.astropy.org / en / stable / time /
-        gps_time = asTime(TB_GPS_time_time_sec, format='gps')
-        trace_epoch_sec = asTime(gps_time, format='unix', scale='utc').value
+        thN3 = trace_headers.trace_header_N[3]
+        trace_headers.lat = self.degree2decimal(thN3.IGU_GPS_lat_integer,
+                                                thN3.IGU_GPS_lat_fraction)
+        trace_headers.lon = self.degree2decimal(thN3.IGU_GPS_lon_integer,
+                                                thN3.IGU_GPS_lon_fraction)
+        trace_headers.ele = thN3.IGU_GPS_height
+        trace_headers.preamp_gain_db = self.preamp_gain_db
+
+    def gps_to_epoch(self, gps_time_sec):
+        """
+        Use astropy package to convert time from gps to utc
+        https: // docs.astropy.org / en / stable / time /
+        gps_time_sec may be an array
+        """
+        gps_time = asTime(gps_time_sec, format='gps')
+        return asTime(gps_time, format='unix', scale='utc').value
+
+    def decode_trace_headers(self, count):
+        """
+        Decode the headers of up to count traces after the file position
+        at once and keep them for process_trace_headers.
+        The file position is not changed. Decoding stops before a trace
+        that process_trace_headers would fail to read.
+        """
+        pos = self.FH.tell()
+        raws = []
+        try:
+            while len(raws) < count:
+                buf = self.FH.read(20)
+                if len(buf) != 20:
+                    break
+                n = ord(buf[9])
+                if n < 6:
+                    break
+                buf += self.FH.read(32 * n)
+                if len(buf) != 20 + 32 * n:
+                    break
+                # samples_per_trace of trace header extension 1
+                samples = int(buf[27:30].encode('hex'), 16)
+                self.FH.seek(4 * samples, os.SEEK_CUR)
+                raws.append((n, buf))
+        finally:
+            self.FH.seek(pos)
+
+        # Traces with the same number of extensions are decoded together
+        for n, group in itertools.groupby(raws, key=lambda r: r[0]):
+            bufs = [r[1] for r in group]
+            raw = np.frombuffer("".join(bufs), dtype=np.uint8).reshape(
+                len(bufs), -1)
+            ths = segd_h.TRACE_HEADER_LAYOUT.decode(raw[:, :20])
+            thNs = []
+            for i in range(n):
+                if i < len(segd_h.TRACE_HEADER_EXTENSION_LAYOUTS):
+                    layout = segd_h.TRACE_HEADER_EXTENSION_LAYOUTS[i]
+                else:
+                    layout = Header_layout(())
+                thNs.append(layout.decode(raw[:, 20 + 32 * i:52 + 32 * i]))
+            epochs = self.gps_to_epoch(
+                np.array([thN1.TB_GPS_time_microsec
+                          for thN1 in thNs[1]]) / 1000000.)
+            for j in range(len(bufs)):
+                trace_headers = TraceHeaders()
+                trace_headers.trace_header = ths[j]
+                trace_headers.trace_header_N = [thN[j] for thN in thNs]
+                self.set_trace_header_values(trace_headers)
+                trace_headers.trace_epoch = epochs[j] * 10.**6
+                self.decoded_trace_headers.append(
+                    (trace_headers, len(bufs[j]), epochs[j]))
+
+    def process_trace_headers(self):
+        if not self.decoded_trace_headers and self.trace_header_batch > 1:
+            self.decode_trace_headers(self.trace_header_batch)
+        if self.decoded_trace_headers:
+            self.trace_headers, size, trace_epoch_sec = \
+                self.decoded_trace_headers.popleft()
+            self.FH.seek(size, os.SEEK_CUR)
+            self.bytes_read += size
+        else:
+            self.trace_headers = TraceHeaders()
+
+            self.trace_headers.trace_header = self.read_block(
+                20, segd_h.Trace_header())
+            n = self.trace_headers.trace_header.trace_extension_blocks
+            for i in range(n):
+                self.trace_headers.trace_header_N.append(
+                    self.read_block(32, segd_h.Trace_header_extension(i)))
+
+            self.set_trace_header_values(self.trace_headers)
+            TB_GPS_time_time_sec = self.trace_headers.trace_header_N[
+                                      1].TB_GPS_time_microsec/1000000.
+            trace_epoch_sec = self.gps_to_epoch(TB_GPS_time_time_sec)
+            self.trace_headers.trace_epoch = \
+                trace_epoch_sec * 10.**6   # microsec
+
+        self.id_number = self.trace_headers.trace_header_N[
+            5].unit_serial_number
+        self.samples = self.trace_headers.trace_header_N[0].samples_per_trace
         trace_epoch_ms = trace_epoch_sec * 10.**3
-        self.trace_headers.trace_epoch = trace_epoch_sec * 10.**6   # microsec
         number_of_samples_in_traces = self.trace_headers.trace_header_N[
             0].samples_per_trace
         trace_endtime_ms = trace_epoch_ms + (
@@ -321,6 +418,9 @@ class Reader ():
             general_header_blocks[0].data_sample_format_code
 
         bytes_per_sample = 4  # Assumes 32 bit IEEE floats
+        if f == 8058 and self.MM is not None:
+            return self.read_trace_view(bytes_per_sample * number_of_samples)
+
         buf = self.read_buf(bytes_per_sample * number_of_samples)
         # IEEE floats - 4 byte - Should be big endian
         if f == 8058:
@@ -340,6 +440,25 @@ class Reader ():
 
         return ret
 
+    def read_trace_view(self, size):
+        '''   Return the next size bytes of 32 bit IEEE floats as a view
+              of the memory map, in file byte order   '''
+        offset = self.FH.tell()
+        size = max(min(size, len(self.MM) - offset), 0)
+        if size % 4:
+            raise InputsError(
+                "Error: Could not read data trace: "
+                "string size must be a multiple of element size")
+        self.FH.seek(size, os.SEEK_CUR)
+        self.bytes_read += size
+        dtype = np.dtype(np.float32).newbyteorder(
+            '>' if self.endianess == 'big' else '<')
+        if size == 0:
+            return np.empty(0, dtype=dtype)
+
+        return np.frombuffer(self.MM, dtype=dtype, count=size // 4,
+                             offset=offset)
+
     def process_trace(self, trace_index):
 
         if trace_index == 0:
@@ -368,4 +487,6 @@ class Reader ():
             return False
         except EOFError:
             self.FH.close()
+            # Views of the memory map keep it open until they are freed
+            self.MM = None
             return True
@@ -0,0 +1,180 @@
+'''
+Tests for ph5.core.availability
+'''
+import os
+import sys
+import shutil
+import unittest
+
+from mock import patch
+from testfixtures import LogCapture
+
+from ph5.core import availability, ph5api
+from ph5.clients import ph5availability
+from ph5.utilities import index_availability_t
+from ph5.core.tests.test_base import LogTestCase, TempDirTestCase
+
+
+def das_row(epoch, count, sample_rate=100, micro_seconds=0):
+    return {'time/epoch_l': epoch, 'time/micro_seconds_i': micro_seconds,
+            'sample_count_i': count, 'sample_rate_i': sample_rate,
+            'sample_rate_multiplier_i': 1}
+
+
+class TestAvailability(TempDirTestCase, LogTestCase):
+    def setUp(self):
+        super(TestAvailability, self).setUp()
+        for name in ('master.ph5', 'miniPH5_00001.ph5'):
+            shutil.copy(os.path.join(self.home, 'ph5/test_data/ph5', name),
+                        name)
+        self.ph5 = None
+
+    def tearDown(self):
+        if self.ph5 is not None:
+            self.ph5.close()
+        super(TestAvailability, self).tearDown()
+
+    def read_availability_t(self):
+        self.ph5 = ph5api.PH5(path='.', nickname='master.ph5')
+        rows, keys = self.ph5.ph5_g_sorts.read_availability()
+        self.ph5.close()
+        self.ph5 = None
+        return rows
+
+    def index(self):
+        testargs = ['index_availability_t', '-n', 'master']
+        with patch.object(sys, 'argv', testargs):
+            index_availability_t.main()
+
+    def test_spans(self):
+        das_t = [das_row(0, 1000),
+                 # contiguous
+                 das_row(10, 1000),
+                 # duplicate
+                 das_row(10, 1000),
+                 # overlap
+                 das_row(15, 1000),
+                 # gap
+                 das_row(30, 500),
+                 # new sample rate
+                 das_row(35, 100, sample_rate=10)]
+        self.assertEqual(
+            [(0., 20., 2000, 2), (30., 35., 500, 0), (35., 45., 100, 0)],
+            [(s['start_epoch_d'], s['end_epoch_d'], s['sample_count_l'],
+              s['overlap_count_i']) for s in availability.spans(das_t)])
+
+    def test_build(self):
+        self.index()
+        rows = self.read_availability_t()
+        self.assertEqual(18, len(rows))
+        r = rows[0]
+        self.assertEqual(('Array_t_001', '500', '', 'DP1', '3X500', 1, 500),
+                         (r['array_name_s'], r['seed_station_name_s'],
+                          r['seed_location_code_s'], r['seed_channel_code_s'],
+                          r['das/serial_number_s'], r['channel_number_i'],
+                          r['sample_rate_i']))
+        self.assertEqual(30000, r['sample_count_l'])
+        self.assertAlmostEqual(60., r['end_epoch_d'] - r['start_epoch_d'])
+        # 9001 has 9 spans
+        self.assertEqual(9, len([s for s in rows
+                                 if s['seed_station_name_s'] == '9001']))
+
+        testargs = ['index_availability_t', '-n', 'master', '--nuke']
+        with patch.object(sys, 'argv', testargs):
+            index_availability_t.main()
+        self.assertEqual([], self.read_availability_t())
+
+    def test_refresh(self):
+        self.index()
+        rows = self.read_availability_t()
+        # Drop the rows of 12183 as if it was loaded after the table
+        # was built
+        self.ph5 = ph5api.PH5(path='.', nickname='master.ph5',
+                              editmode=True)
+        availability.write(self.ph5, [r for r in rows
+                                      if r['das/serial_number_s'] != '12183'])
+        self.ph5.close()
+        self.ph5 = None
+        self.assertEqual(9, len(self.read_availability_t()))
+
+        availability.refresh('./master.ph5', ['12183'])
+        self.assertEqual(rows, self.read_availability_t())
+
+    def test_ph5availability(self):
+        # answers from Availability_t are the same as from Das_t
+        self.index()
+        self.ph5 = ph5api.PH5(path='.', nickname='master.ph5')
+        avail = ph5availability.PH5Availability(self.ph5)
+        queries = [{},
+                   {'station': '8001'},
+                   {'channel': 'HH*'},
+                   {'station': '9001', 'starttime': 1550849950,
+                    'endtime': 1550850100},
+                   {'station': '500', 'starttime': 1502294405.4,
+                    'endtime': 1502294405.6}]
+        for q in queries:
+            for include_sample_rate in (False, True):
+                for get in (avail.get_availability,
+                            avail.get_availability_extent):
+                    avail.use_availability_t = True
+                    from_t = get(include_sample_rate=include_sample_rate,
+                                 **q)
+                    avail.use_availability_t = False
+                    from_das_t = get(
+                        include_sample_rate=include_sample_rate, **q)
+                    self.assertTrue(from_t)
+                    self.assertEqual(sorted(from_das_t), sorted(from_t))
+
+    def test_array_t_changed(self):
+        # Availability_t is not used once Array_t changed after it was
+        # built, until it is built again
+        self.index()
+        self.ph5 = ph5api.PH5(path='.', nickname='master.ph5',
+                              editmode=True)
+        self.assertTrue(availability.is_current(self.ph5))
+        self.ph5.ph5.get_node('/Experiment_g/Sorts_g',
+                              'Array_t_001').remove_rows(0, 1)
+        self.assertFalse(availability.is_current(self.ph5))
+        stored = availability.stored_fingerprint(self.ph5)
+        # a loader refreshing some DASes keeps the table out of date
+        with LogCapture() as log:
+            availability.update(self.ph5, ['12183'])
+        self.assertEqual(stored, availability.stored_fingerprint(self.ph5))
+        self.assertIn('out of date', str(log))
+        self.ph5.close()
+
+        self.ph5 = ph5api.PH5(path='.', nickname='master.ph5')
+        avail = ph5availability.PH5Availability(self.ph5)
+        with LogCapture() as log:
+            self.assertIsNone(avail.read_availability_t())
+        self.assertIn('reading Das_t', str(log))
+        self.assertFalse(avail.use_availability_t)
+        self.ph5.close()
+
+        self.index()
+        self.ph5 = ph5api.PH5(path='.', nickname='master.ph5')
+        self.assertTrue(availability.is_current(self.ph5))
+        avail = ph5availability.PH5Availability(self.ph5)
+        self.assertTrue(avail.read_availability_t())
+
+    def test_array_t_edited(self):
+        # an edited Array_t with the same rows is a change
+        self.index()
+        self.ph5 = ph5api.PH5(path='.', nickname='master.ph5',
+                              editmode=True)
+        array_t = self.ph5.ph5.get_node('/Experiment_g/Sorts_g',
+                                        'Array_t_001')
+        stored = availability.fingerprint(self.ph5)
+        for column, value in (('pickup_time/epoch_l', 1502294500),
+                              ('seed_location_code_s', '01'),
+                              ('sample_rate_i', 250)):
+            old = array_t.read(field=column)
+            array_t.modify_column(0, 1, column=[value], colname=column)
+            self.assertFalse(availability.is_current(self.ph5))
+            self.assertNotEqual(stored, availability.fingerprint(self.ph5))
+            array_t.modify_column(column=old, colname=column)
+            self.assertTrue(availability.is_current(self.ph5))
+
+
+if __name__ == "__main__":
+    unittest.main()
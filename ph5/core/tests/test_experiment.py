@@ -3,9 +3,12 @@ Tests for experiment
 '''
 import os
 import unittest
+import numpy
+import tables
 
-from ph5.core import ph5api, experiment
-from ph5.core.tests.test_base import LogTestCase, TempDirTestCase
+from ph5.core import ph5api, experiment, columns
+from ph5.core.tests.test_base import LogTestCase, TempDirTestCase, \
+    initialize_ex
 
 
 class TestExperiment_srm(TempDirTestCase, LogTestCase):
@@ -109,5 +112,208 @@ class TestExperiment_srm(TempDirTestCase, LogTestCase):
         self.assertEqual(len(ret), 3)
 
 
+class TestExperiment_populate(TempDirTestCase, LogTestCase):
+    def tearDown(self):
+        self.ex.ph5close()
+        super(TestExperiment_populate, self).tearDown()
+
+    def test_populate_list(self):
+        # a list of rows is appended in one call, values are cast from
+        # strings as for a single row and missing columns keep the default
+        self.ex = initialize_ex('master.ph5', '.', True)
+        self.ex.ph5_g_sorts.newOffsetSort('Offset_t_001_001')
+        rows = [{'event_id_s': '1001', 'receiver_id_s': str(i),
+                 'offset/value_d': str(i * 10.5), 'offset/units_s': 'm'}
+                for i in range(1, 101)]
+        rows[1]['offset/value_d'] = ''
+        self.ex.ph5_g_sorts.populateOffset_t(rows, name='Offset_t_001_001')
+        ret, keys = self.ex.ph5_g_sorts.read_offset('Offset_t_001_001')
+        self.assertEqual(len(ret), 100)
+        self.assertEqual(ret[0]['receiver_id_s'], '1')
+        self.assertEqual(ret[0]['offset/value_d'], 10.5)
+        self.assertEqual(ret[1]['offset/value_d'], 0.)
+        self.assertEqual(ret[99]['offset/value_d'], 1050.)
+        self.assertEqual(ret[99]['azimuth/value_f'], 0.)
+
+        # a missing required key fails the whole list
+        rows = [{'das/serial_number_s': '12183', 'start_time/epoch_l': 1,
+                 'end_time/epoch_l': 2, 'offset_d': 0., 'slope_d': 0.},
+                {'das/serial_number_s': '12183', 'start_time/epoch_l': 3}]
+        with self.assertRaises(experiment.HDF5InteractionError) as context:
+            self.ex.ph5_g_receivers.populateTime_t_(rows)
+        self.assertEqual(context.exception.errno, 2)
+        ret, keys = self.ex.ph5_g_receivers.read_time()
+        self.assertEqual(len(ret), 0)
+
+    def test_update_many(self):
+        # rows are matched on the key, all rows with the key are updated
+        self.ex = initialize_ex('master.ph5', '.', True)
+        self.ex.ph5_g_sorts.newOffsetSort('Offset_t_001_001')
+        rows = [{'event_id_s': str(1000 + i % 2), 'receiver_id_s': str(i),
+                 'offset/value_d': str(i)} for i in range(10)]
+        self.ex.ph5_g_sorts.populateOffset_t(rows, name='Offset_t_001_001')
+        table = self.ex.ph5_g_sorts.ph5_t_offset['Offset_t_001_001']
+        self.assertEqual(columns.lindex(table, ' 3', 'receiver_id_s'), 3)
+        self.assertEqual(columns.lindex(table, '10', 'receiver_id_s'), None)
+        self.assertEqual(
+            columns.search(table, 'receiver_id_s', '4')['offset']['value_d'],
+            4.)
+
+        columns.update_many(table,
+                            [{'receiver_id_s': '3', 'offset/value_d': 30.},
+                             {'receiver_id_s': '5', 'offset/units_s': 'm'},
+                             {'receiver_id_s': '3', 'azimuth/value_f': 1.5},
+                             {'receiver_id_s': '10', 'offset/value_d': 1.}],
+                            'receiver_id_s')
+        columns.update(table, {'event_id_s': '1001', 'offset/units_s': 'ft'},
+                       'event_id_s')
+        ret, keys = self.ex.ph5_g_sorts.read_offset('Offset_t_001_001')
+        self.assertEqual(len(ret), 10)
+        self.assertEqual(ret[3]['offset/value_d'], 30.)
+        self.assertEqual(ret[3]['azimuth/value_f'], 1.5)
+        self.assertEqual(ret[5]['offset/value_d'], 5.)
+        self.assertEqual(ret[4]['offset/units_s'], '')
+        for r in ret:
+            self.assertEqual(r['offset/units_s'],
+                             'ft' if r['event_id_s'] == '1001' else '')
+
+        # missing columns are skipped, a bad value raises and changes nothing
+        columns.update(table, {'receiver_id_s': '3', 'no_such_column_s': 'x'},
+                       'receiver_id_s')
+        with self.assertRaises(ValueError):
+            columns.update_many(table,
+                                [{'receiver_id_s': '3',
+                                  'offset/value_d': 'abc'}],
+                                'receiver_id_s')
+        ret, keys = self.ex.ph5_g_sorts.read_offset('Offset_t_001_001')
+        self.assertEqual(ret[3]['offset/value_d'], 30.)
+
+
+class TestExperiment_ChunkCache(TempDirTestCase, LogTestCase):
+    def tearDown(self):
+        self.ex.ph5close()
+        super(TestExperiment_ChunkCache, self).tearDown()
+
+    def test_read(self):
+        self.ex = initialize_ex('master.ph5', '.', True)
+        a = self.ex.ph5.create_earray('/', 'Data_a_0001',
+                                      atom=tables.Int32Atom(), shape=(0,),
+                                      chunkshape=(10,))
+        a.append(numpy.arange(45, dtype='int32'))
+        # enough for 3 chunks
+        cache = experiment.ChunkCache(maxbytes=120)
+        for start, stop in ((0, 45), (5, 25), (10, 20), (44, 45), (40, 60),
+                            (3, 4), (20, 20)):
+            self.assertEqual(a.read(start, stop).tolist(),
+                             cache.read(a, start, stop).tolist())
+        self.assertEqual(a.read().tolist(), cache.read(a).tolist())
+        self.assertEqual([7], cache.read(a, 7).tolist())
+        out = numpy.zeros(12, dtype='int32')
+        cache.read(a, 9, 21, out=out)
+        self.assertEqual(range(9, 21), out.tolist())
+        self.assertLessEqual(cache.nbytes, 120)
+
+        cache = experiment.ChunkCache()
+        cache.read(a, 5, 25)
+        self.assertEqual((0, 3), (cache.hits, cache.misses))
+        cache.read(a, 15, 35)
+        self.assertEqual((2, 4), (cache.hits, cache.misses))
+        # the last chunk is read again after the array grows
+        cache.read(a, 40, 45)
+        self.assertEqual((2, 5), (cache.hits, cache.misses))
+        a.append(numpy.arange(45, 50, dtype='int32'))
+        self.assertEqual(range(35, 50), cache.read(a, 35, 50).tolist())
+        self.assertEqual((3, 6), (cache.hits, cache.misses))
+
+        # read_trace uses the cache when it is set
+        self.ex.ph5_g_receivers.chunk_cache = cache
+        self.assertEqual(range(15, 35),
+                         self.ex.ph5_g_receivers.read_trace(a, 15, 35)
+                         .tolist())
+        self.assertEqual((6, 6), (cache.hits, cache.misses))
+        # reads of more than max_chunks chunks read whole chunks directly
+        self.assertEqual(range(0, 50),
+                         self.ex.ph5_g_receivers.read_trace(a).tolist())
+        self.assertEqual((6, 6, 1),
+                         (cache.hits, cache.misses, cache.direct))
+
+    def test_read_direct(self):
+        self.ex = initialize_ex('master.ph5', '.', True)
+        a = self.ex.ph5.create_earray('/', 'Data_a_0001',
+                                      atom=tables.Int32Atom(), shape=(0,),
+                                      chunkshape=(10,))
+        a.append(numpy.arange(95, dtype='int32'))
+        cache = experiment.ChunkCache(max_chunks=2)
+        for start, stop in ((5, 45), (0, 40), (10, 95), (3, 95), (15, 30),
+                            (20, 20), (0, 95)):
+            self.assertEqual(a.read(start, stop).tolist(),
+                             cache.read(a, start, stop).tolist())
+        # only the chunks at either end are cached
+        cache = experiment.ChunkCache(max_chunks=2)
+        out = numpy.zeros(40, dtype='int32')
+        cache.read(a, 5, 45, out=out)
+        self.assertEqual(range(5, 45), out.tolist())
+        self.assertEqual((0, 2, 1), (cache.hits, cache.misses, cache.direct))
+        self.assertEqual([0, 4], sorted(k[2] for k in cache.chunks))
+        # an overlapping read finds them
+        cache.read(a, 40, 50)
+        self.assertEqual((1, 2, 1), (cache.hits, cache.misses, cache.direct))
+
+        # reads larger than the cache are read directly too
+        cache = experiment.ChunkCache(maxbytes=120)
+        self.assertEqual(range(0, 40), cache.read(a, 0, 40).tolist())
+        self.assertEqual((0, 0, 1), (cache.hits, cache.misses, cache.direct))
+
+
+class TestExperiment_DataStorage(TempDirTestCase, LogTestCase):
+    def tearDown(self):
+        self.ex.ph5close()
+        super(TestExperiment_DataStorage, self).tearDown()
+
+    def test_from_chunk(self):
+        self.ex = initialize_ex('master.ph5', '.', True)
+        storage = experiment.DataStorage.from_chunk('4096')
+        self.assertEqual((4096,), storage.chunkshape(100))
+        storage = experiment.DataStorage.from_chunk('2.5s')
+        self.assertEqual((250,), storage.chunkshape(100))
+        self.assertIsNone(storage.chunkshape())
+        self.assertIsNone(experiment.DataStorage().chunkshape(100))
+        for chunk in ('', '0', 'xs', '-1s'):
+            with self.assertRaises(ValueError):
+                experiment.DataStorage.from_chunk(chunk)
+        with self.assertRaises(ValueError):
+            experiment.DataStorage(complib='gzip')
+        with self.assertRaises(ValueError):
+            experiment.DataStorage(complevel=10)
+
+    def test_newarray(self):
+        self.ex = experiment.ExperimentGroup(nickname='master.ph5')
+        self.ex.data_storage = experiment.DataStorage(
+            chunk_seconds=2, complib='blosc:lz4', complevel=5)
+        self.ex.ph5open(True)
+        self.ex.initgroup()
+        receivers = self.ex.ph5_g_receivers
+        receivers.newdas('1X1')
+        data = numpy.arange(1000, dtype='int32')
+        a = receivers.newarray('Data_a_0001', data, dtype='int32',
+                               sample_rate=40)
+        b, = receivers.newarrays([('Data_a_0002', data, None, 100)],
+                                 dtype='int32')
+        c = receivers.newarray('Data_a_0003', data, dtype='int32')
+        self.assertEqual((80,), a.chunkshape)
+        self.assertEqual((200,), b.chunkshape)
+        for x in (a, b, c):
+            self.assertEqual('blosc:lz4', x.filters.complib)
+            self.assertEqual(5, x.filters.complevel)
+            self.assertEqual(data.tolist(), x.read().tolist())
+
+        # the default is as before DataStorage
+        receivers.data_storage = None
+        d = receivers.newarray('Data_a_0004', data, dtype='int32')
+        self.assertEqual('zlib', d.filters.complib)
+        self.assertEqual(experiment.ZLIBCOMP, d.filters.complevel)
+        self.assertTrue(d.filters.shuffle)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,163 @@
+'''
+Tests for ph5.core.journal
+'''
+import os
+import sys
+import shutil
+import unittest
+
+import tables
+from mock import patch
+
+from ph5.core import journal
+from ph5.utilities import texan2ph5
+from ph5.core.tests.test_base import LogTestCase, TempDirTestCase,\
+    initialize_ex
+
+
+class TestJournal(TempDirTestCase, LogTestCase):
+    def setUp(self):
+        super(TestJournal, self).setUp()
+        trd = os.path.join(self.home, 'ph5/test_data/rt125a/I2183RAW.TRD')
+        self.names = ['I2183RAW.TRD', 'I2183RAW_1.TRD']
+        for name in self.names:
+            shutil.copy(trd, name)
+        with open('trd_list', 'w') as list_file:
+            list_file.write("".join(n + "\n" for n in self.names))
+        self.EX = None
+
+    def tearDown(self):
+        if self.EX is not None:
+            self.EX.ph5close()
+        super(TestJournal, self).tearDown()
+
+    def load(self, *args):
+        testargs = ['texan2ph5', '-n', 'master', '-f', 'trd_list'] + \
+            list(args)
+        # Each run starts from the module state of a new process
+        texan2ph5.INDEX_T = None
+        texan2ph5.JOURNAL = None
+        texan2ph5.MINIS = None
+        with patch.object(sys, 'argv', testargs):
+            texan2ph5.main()
+
+    def read_tables(self):
+        self.EX = initialize_ex('master.ph5', '.', False)
+        receivers = self.EX.ph5_g_receivers
+        receivers.setcurrent(receivers.getdas_g('12183'))
+        rows, keys = receivers.read_das()
+        das_t = [(r['array_name_data_a'], r['raw_file_name_s'],
+                  r['time/epoch_l']) for r in rows]
+        arrays = sorted(receivers.current_g_das._v_children.keys())
+        rows, keys = receivers.read_index()
+        index_t = [(r['serial_number_s'], r['start_time/epoch_l'],
+                    r['end_time/epoch_l']) for r in rows]
+        self.EX.ph5close()
+        self.EX = None
+        return das_t, arrays, index_t
+
+    def new_experiment(self):
+        self.EX = initialize_ex('master.ph5', '.', True)
+        self.EX.ph5close()
+        self.EX = None
+
+    def test_checksum(self):
+        self.assertEqual(journal.checksum(self.names[0]),
+                         journal.checksum(self.names[1]))
+        with open(self.names[1], 'ab') as fh:
+            fh.write('\0')
+        self.assertNotEqual(journal.checksum(self.names[0]),
+                            journal.checksum(self.names[1]))
+
+    def test_skip(self):
+        # files in the journal are not loaded again
+        self.new_experiment()
+        self.load('--journal')
+        loaded = self.read_tables()
+        self.assertEqual(18, len(loaded[0]))
+
+        self.load('--journal')
+        self.assertEqual(loaded, self.read_tables())
+        j = journal.Journal('.')
+        self.assertTrue(all(j.ingested(n) for n in self.names))
+        self.assertEqual([], j.not_ingested(self.names))
+
+        # a changed file is loaded again
+        with open(self.names[1], 'ab') as fh:
+            fh.write('\0')
+        self.assertEqual(self.names[1:], j.not_ingested(self.names))
+        j.close()
+
+    def test_ingested_mtime(self):
+        # files with the size and mtime in the journal are not read
+        j = journal.Journal('.')
+        for name in self.names:
+            j.begin(name)
+            j.done()
+        j.close()
+        j = journal.Journal('.')
+        with patch.object(journal, 'checksum',
+                          wraps=journal.checksum) as checksum:
+            self.assertTrue(j.ingested(self.names[0]))
+            self.assertEqual(0, checksum.call_count)
+
+            # same size, new mtime: checksummed and still ingested
+            mtime = os.path.getmtime(self.names[0])
+            os.utime(self.names[0], (mtime + 10, mtime + 10))
+            self.assertTrue(j.ingested(self.names[0]))
+            self.assertEqual(1, checksum.call_count)
+
+            # same size, new mtime and changed contents
+            with open(self.names[1], 'r+b') as fh:
+                first = fh.read(1)
+                fh.seek(0)
+                fh.write(chr(ord(first) ^ 1))
+            os.utime(self.names[1], (mtime + 10, mtime + 10))
+            self.assertFalse(j.ingested(self.names[1]))
+            self.assertEqual(2, checksum.call_count)
+        j.close()
+
+    def test_rollback(self):
+        # a file left partly written by a failed run is removed and
+        # loaded again, giving the same PH5 as one run without a journal
+        self.new_experiment()
+        self.load()
+        expected = self.read_tables()
+        os.remove('master.ph5')
+        os.remove('miniPH5_00001.ph5')
+
+        self.new_experiment()
+        done = journal.Journal.done
+        calls = []
+
+        def fail_second(j):
+            calls.append(j.current.file)
+            if len(calls) == 2:
+                raise RuntimeError("Killed")
+            done(j)
+
+        with patch.object(journal.Journal, 'done', fail_second):
+            with self.assertRaises(RuntimeError):
+                self.load('--journal')
+        texan2ph5.closePH5()
+        texan2ph5.JOURNAL.close()
+        # the rows of the second file are in PH5 but it is not done, the
+        # run stopped before the external links of master.ph5 were made
+        with tables.open_file('miniPH5_00001.ph5') as mini:
+            self.assertEqual(18, mini.get_node(
+                '/Experiment_g/Receivers_g/Das_g_12183/Das_t').nrows)
+        j = journal.Journal('.')
+        self.assertEqual([os.path.abspath(self.names[1])],
+                         [i.file for i in j.incomplete()])
+        j.close()
+
+        self.load('--journal')
+        self.assertEqual(expected, self.read_tables())
+        j = journal.Journal('.')
+        self.assertEqual([], j.incomplete())
+        self.assertEqual([], j.not_ingested(self.names))
+        j.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+'''
+Tests for ph5.core.miniallocator
+'''
+import unittest
+
+from mock import patch
+
+from ph5.core import miniallocator
+from ph5.core.tests.test_base import LogTestCase, TempDirTestCase
+
+
+class TestMiniAllocator(TempDirTestCase, LogTestCase):
+    def index_row(self, das, n):
+        return {'serial_number_s': das,
+                'external_file_name_s': './miniPH5_{0:05d}.ph5'.format(n)}
+
+    def test_allocate(self):
+        minis = miniallocator.MiniAllocator('.', 1, None, 100)
+        self.assertEqual('miniPH5_00001', minis.allocate('A', 60))
+        # the same DAS stays in its mini
+        self.assertEqual('miniPH5_00001', minis.allocate('A', 60))
+        # a new DAS goes to a new mini once the newest is full
+        self.assertEqual('miniPH5_00002', minis.allocate('B', 60))
+        self.assertEqual('miniPH5_00002', minis.allocate('C', 30))
+        self.assertEqual({1: 120, 2: 90}, minis.sizes)
+
+    def test_index(self):
+        with open('miniPH5_00003.ph5', 'w') as fh:
+            fh.write('x' * 50)
+        minis = miniallocator.MiniAllocator('.', 1, None, 100)
+        minis.index([self.index_row('A', 1), self.index_row('B', 3)])
+        self.assertEqual('miniPH5_00001', minis.allocate('A', 10))
+        self.assertEqual('miniPH5_00003', minis.allocate('C', 10))
+        self.assertEqual(60, minis.sizes[3])
+        self.assertEqual('miniPH5_00004', minis.allocate('D', 51))
+
+    def test_refresh(self):
+        # the newest mini on disk is smaller than the bytes given to it,
+        # it is stat'ed again before a new DAS is put in it
+        with open('miniPH5_00001.ph5', 'w') as fh:
+            fh.write('x' * 10)
+        minis = miniallocator.MiniAllocator('.', 1, None, 100)
+        self.assertEqual('miniPH5_00001', minis.allocate('A', 60))
+        self.assertEqual('miniPH5_00001', minis.allocate('A', 30))
+        self.assertEqual(100, minis.sizes[1])
+        with open('miniPH5_00001.ph5', 'a') as fh:
+            fh.write('x' * 40)
+        getsize = miniallocator.os.path.getsize
+        with patch.object(miniallocator.os.path, 'getsize',
+                          side_effect=getsize) as mock_getsize:
+            self.assertEqual('miniPH5_00001', minis.allocate('B', 50))
+        self.assertEqual(1, mock_getsize.call_count)
+        self.assertEqual(100, minis.sizes[1])
+        self.assertEqual('miniPH5_00002', minis.allocate('C', 51))
+
+    def test_num_mini(self):
+        minis = miniallocator.MiniAllocator('.', 5, 3)
+        das = ['A', 'B', 'C', 'D', 'E', 'F']
+        sizes = [40, 10, 20, 10, 10, 10]
+        # new DASes go to new minis, then to the smallest
+        self.assertEqual(['miniPH5_00005', 'miniPH5_00006',
+                          'miniPH5_00007', 'miniPH5_00006',
+                          'miniPH5_00006', 'miniPH5_00007'],
+                         [minis.allocate(d, s) for d, s in zip(das, sizes)])
+
+    def test_ledger(self):
+        # each mini is stat'ed once
+        for n in (1, 2, 3):
+            with open('miniPH5_{0:05d}.ph5'.format(n), 'w') as fh:
+                fh.write('x' * n)
+        minis = miniallocator.MiniAllocator('.', 1, 3)
+        minis.index([self.index_row(d, n)
+                     for n, d in ((1, 'A'), (2, 'B'), (3, 'C'))])
+        getsize = miniallocator.os.path.getsize
+        with patch.object(miniallocator.os.path, 'getsize',
+                          side_effect=getsize) as mock_getsize:
+            allocated = [minis.allocate(d, 2) for d in 'DEFGHI']
+        self.assertEqual(3, mock_getsize.call_count)
+        self.assertEqual(['miniPH5_00001', 'miniPH5_00002',
+                          'miniPH5_00001', 'miniPH5_00003',
+                          'miniPH5_00002', 'miniPH5_00001'], allocated)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,9 +2,13 @@
 Tests for ph5api
 '''
 import os
+import shutil
 import unittest
 
-from ph5.core import ph5api
+import numpy as np
+import tables
+
+from ph5.core import ph5api, experiment
 from ph5.core.tests.test_base import LogTestCase, TempDirTestCase
 
 
@@ -152,6 +156,17 @@ class TestPH5API(LogTestCase):
         self.assertEqual(channel[0]['response_table_n_i'], 0)
         self.assertEqual(channel[0]['channel_number_i'], 3)
 
+        # same array as records
+        records = self.ph5API_object.read_array_t('Array_t_001',
+                                                  as_array=True)
+        self.assertEqual(keys, records.keys)
+        self.assertEqual(self.ph5API_object.Array_t['Array_t_001']['order'],
+                         records.col('id_s').tolist()[::3])
+        self.assertEqual(channel[0], records[2])
+        self.assertEqual(channel[0], records[records.col('id_s') == '500'][2])
+        self.assertIsNone(self.ph5API_object.read_array_t('Array_t_099',
+                                                          as_array=True))
+
         # checking 1st channel of array 2... auto generated by obsoytoph5
 
         self.assertFalse(hasattr(self.ph5API_object.Array_t, 'Array_t_002'))
@@ -345,6 +360,42 @@ class TestPH5API(LogTestCase):
         self.assertEqual(2, table[0]['event_number_i'])
         self.ph5API_object.forget_das_t('3X500')
 
+        # the Das_t index is built once and reused
+        index = self.ph5API_object.Das_t_index['3X500']
+        self.assertEqual(6, index.nrows)
+        table = self.ph5API_object.query_das_t('3X500',
+                                               chan=1,
+                                               start_epoch=1502294400,
+                                               stop_epoch=1502294430,
+                                               sample_rate=500,
+                                               sample_rate_multiplier=1)
+        self.assertEqual(1, len(table))
+        self.assertEqual(1, table[0]['event_number_i'])
+        self.assertIs(index, self.ph5API_object.Das_t_index['3X500'])
+        self.ph5API_object.forget_das_t('3X500')
+
+        # the first window is 1502294400.38 to 1502294430.38, a query
+        # that starts where it stops leaves it out
+        for start, events in ((1502294430.38, [2]),
+                              (1502294430.37, [1, 2])):
+            table = self.ph5API_object.query_das_t('3X500',
+                                                   chan=1,
+                                                   start_epoch=start,
+                                                   stop_epoch=1502309218,
+                                                   sample_rate=500,
+                                                   sample_rate_multiplier=1)
+            self.assertEqual(events, [t['event_number_i'] for t in table])
+        # 3788 samples at 100 sps stop at 1463568517.88, not at .00 as the
+        # integer division of the numexpr query had it
+        table = self.ph5API_object.query_das_t('9EEF',
+                                               chan=1,
+                                               start_epoch=1463568517.5,
+                                               stop_epoch=1463568517.6,
+                                               sample_rate=100)
+        self.assertEqual([(1463568480, 3788)],
+                         [(t['time/epoch_l'], t['sample_count_i'])
+                          for t in table])
+
         # test query LOG channel
         table = self.ph5API_object.query_das_t('5553',
                                                chan=-2,
@@ -407,9 +458,49 @@ class TestPH5API(LogTestCase):
         self.assertEqual(3,
                          self.ph5API_object.Das_t['9EEF']['rows']
                          [2]['channel_number_i'])
+        rows = self.ph5API_object.Das_t['9EEF']['rows']
 
         self.ph5API_object.forget_das_t('9EEF')
 
+        # read das as records, rows are made as needed and Das_t is not set
+        records = self.ph5API_object.read_das_t('9EEF', as_array=True)
+        self.assertFalse('9EEF' in self.ph5API_object.Das_t)
+        self.assertEqual(3, len(records))
+        self.assertEqual(rows, list(records))
+        self.assertEqual(rows[2], records[2])
+        self.assertEqual([1, 2, 3],
+                         records.col('channel_number_i').tolist())
+        records = self.ph5API_object.read_das_t('12183',
+                                                start_epoch=1550850093,
+                                                stop_epoch=1550850152,
+                                                as_array=True)
+        self.assertEqual(['Data_a_0006', 'Data_a_0007'],
+                         [r['array_name_data_a'] for r in records])
+        self.ph5API_object.forget_das_t('12183')
+
+    def test_mini_pool(self):
+        # all dases are in miniPH5_00001.ph5, it is opened once
+        pool = self.ph5API_object.mini_pool
+        for das in ('12183', '9EEF', '3X500', '5553'):
+            self.ph5API_object.read_das_t(das)
+            self.assertTrue(self.ph5API_object.Das_t[das]['rows'])
+            self.ph5API_object.forget_das_t(das)
+        self.assertEqual(1, pool.opens)
+        self.assertEqual(3, pool.hits)
+        mini = os.path.join(self.home, 'ph5/test_data/ph5/miniPH5_00001.ph5')
+        self.assertTrue(pool.files[mini].isopen)
+
+        # the least recently used file is closed
+        pool = experiment.MiniPool(max_open=1)
+        fh = pool.get_file(mini)
+        self.assertIs(fh, pool.get_file(mini))
+        pool.get_file(os.path.join(self.home, 'ph5/test_data/ph5/master.ph5'))
+        self.assertFalse(fh.isopen)
+        self.assertEqual(1, len(pool.files))
+        self.assertEqual((2, 1), (pool.opens, pool.hits))
+        pool.close()
+        self.assertFalse(pool.files)
+
     def test_time_t(self):
         """
         tests reading of time_t
@@ -446,6 +537,56 @@ class TestPH5API(LogTestCase):
         self.assertEqual(-1.66452e-09,
                          table[0]['slope_d'])
 
+        # Time_t is split by das once, _cor finds the same row in the
+        # index as in the list
+        index = self.ph5API_object.get_time_t_index('12183')
+        self.assertIs(index, self.ph5API_object.get_time_t_index('12183'))
+        self.assertEqual(table, index.rows)
+        self.assertFalse(self.ph5API_object.get_time_t_index('12345').rows)
+        start = ph5api.fepoch(table[0]['start_time/epoch_l'],
+                              table[0]['start_time/micro_seconds_i'])
+        for window in ((start, start + 60), (start - 60, start),
+                       (start - 120, start - 60)):
+            cor, clock = ph5api._cor(window[0], window[1], table)
+            cor_index, clock_index = ph5api._cor(window[0], window[1], index)
+            self.assertEqual(cor, cor_index)
+            self.assertEqual(clock.slope, clock_index.slope)
+            self.assertEqual(clock.comment, clock_index.comment)
+        self.assertIs(table[0], index.lookup(start - 60, start))
+        self.assertIsNone(index.lookup(start - 120, start - 60))
+
+    def test_time_t_kept_across_clear(self):
+        """
+        Time_t is read and split by das once, not once per clear()
+        """
+        reads = []
+        read_time_t = self.ph5API_object.read_time_t
+
+        def counting_read_time_t():
+            reads.append(1)
+            read_time_t()
+        self.ph5API_object.read_time_t = counting_read_time_t
+
+        for i in range(2):
+            traces = self.ph5API_object.cut('12183',
+                                            1550849943,
+                                            1550849953,
+                                            1,
+                                            500,
+                                            True,
+                                            das_t=None)
+            self.assertTrue(traces[0].data.size)
+            self.ph5API_object.clear()
+        self.assertEqual(1, len(reads))
+        index = self.ph5API_object.get_time_t_index('12183')
+        self.assertIs(index, self.ph5API_object.Time_t_index['12183'])
+
+        # a different number of rows in Time_t reads it again
+        self.ph5API_object.Time_t_nrows -= 1
+        self.assertIsNot(index,
+                         self.ph5API_object.get_time_t_index('12183'))
+        self.assertEqual(2, len(reads))
+
     def test_response_t(self):
         """
         test reading of response table
@@ -866,6 +1007,22 @@ class TestPH5API(LogTestCase):
                                         False,
                                         das_t=None)
 
+        # cutting again finds the chunks of Data_a in the cache
+        cache = self.ph5API_object.chunk_cache
+        hits, misses = cache.hits, cache.misses
+        self.assertTrue(misses)
+        again = self.ph5API_object.cut('12183',
+                                       1550849943,
+                                       1550850189,
+                                       1,
+                                       500,
+                                       False,
+                                       das_t=None)
+        self.assertEqual(misses, cache.misses)
+        self.assertEqual(hits + misses, cache.hits)
+        self.assertEqual([t.data.tolist() for t in traces],
+                         [t.data.tolist() for t in again])
+
         # 9 traces with NO time corrections
         # all same sample rate and ttype
         self.assertTrue(9, len(traces))
@@ -958,6 +1115,21 @@ class TestPH5API(LogTestCase):
         self.assertEqual(-122580344,
                          traces[0].data[-1])
 
+        # contiguous Das_t windows are assembled into a single trace
+        traces = self.ph5API_object.cut('3X500',
+                                        1502294400,
+                                        1502294470,
+                                        3,
+                                        500,
+                                        False,
+                                        das_t=None)
+        self.assertEqual(1, len(traces))
+        self.assertEqual(1502294400.38,
+                         traces[0].start_time.epoch(fepoch=True))
+        self.assertEqual(30000, traces[0].nsamples)
+        self.assertEqual(2, len(traces[0].das_t))
+        self.assertEqual(1317166976, traces[0].data[2500])
+
     def test_get_extent(self):
         # test das that exists
         earliest, latest = self.ph5API_object.get_extent(
@@ -1114,6 +1286,59 @@ class TestPH5API(LogTestCase):
         self.assertEqual((100.0, 1545085230.681998, 1545085240.691998),
                          times[0])
 
+    def test_plan_cut_overlap(self):
+        # a window that overlaps the one before it by less than a sample
+        # is merged into its segment, which must still end at stop_fepoch
+        self.ph5API_object.read_das_t('12183')
+        d = ph5api.filter_das_t(
+            self.ph5API_object.Das_t['12183']['rows'], 1)[0]
+        overlap = dict(d)
+        # 0.9 sample before the end of d
+        overlap['time/epoch_l'] = 1550849948
+        overlap['time/micro_seconds_i'] = 998200
+        segments = self.ph5API_object._plan_cut(
+            [d, overlap], 1550849943, 1550849949.01, 1, 500)
+        self.assertEqual(1, len(segments))
+        self.assertEqual(3005, segments[0]['nsamples'])
+        self.assertEqual(3005, sum(n for ref, start, stop, n
+                                   in segments[0]['reads']))
+        self.assertEqual(3005, len(
+            self.ph5API_object._read_segment(segments[0])))
+
+    def test_das_t_windows(self):
+        das_t = [{'time/epoch_l': 10, 'time/micro_seconds_i': 500000,
+                  'sample_count_i': 100, 'sample_rate_i': 10,
+                  'sample_rate_multiplier_i': 2},
+                 {'time/epoch_l': 20, 'time/micro_seconds_i': 0,
+                  'sample_count_i': 1, 'sample_rate_i': 0,
+                  'sample_rate_multiplier_i': 1}]
+        starts, lengths, rates = ph5api.das_t_windows(das_t)
+        self.assertEqual([10.5, 20.], starts.tolist())
+        # sample_count_i / sample_rate_i / sample_rate_multiplier_i, as
+        # get_availability computed window lengths
+        self.assertEqual([5., 0.], lengths.tolist())
+        self.assertEqual([5., 0.], rates.tolist())
+
+    def test_merge_windows(self):
+        def merge(windows):
+            starts, lengths, rates = [np.array(c, dtype=float)
+                                      for c in zip(*windows)]
+            first, last, used = ph5api.merge_windows(starts, lengths, rates)
+            return (zip(first.tolist(), last.tolist()), used.tolist())
+
+        # contiguous, gap, new sample rate
+        self.assertEqual(([(0, 1), (2, 2), (3, 3)], [True] * 4),
+                         merge([(0, 10, 100), (10, 10, 100),
+                                (30, 5, 100), (35, 10, 10)]))
+        # a duplicate and an overlapping window are left out
+        self.assertEqual(([(0, 1), (4, 4)],
+                          [True, True, False, False, True]),
+                         merge([(0, 10, 100), (10, 10, 100), (10, 10, 100),
+                                (15, 10, 100), (30, 5, 100)]))
+        # the duplicate of the first window of a span
+        self.assertEqual(([(0, 2)], [True, False, True]),
+                         merge([(0, 0, 100), (0, 0, 100), (0, 1, 100)]))
+
     def test_channels(self):
         # should give 3 channels
         chans = self.ph5API_object.channels(
@@ -1218,6 +1443,62 @@ class TestPH5API(LogTestCase):
         self.assertIsNone(self.ph5API_object.ph5)
 
 
+class TestPH5API_mini_pool(TempDirTestCase, LogTestCase):
+    def setUp(self):
+        super(TestPH5API_mini_pool, self).setUp()
+        # 9EEF in miniPH5_00002.ph5, the other DASes in miniPH5_00001.ph5
+        testpath = os.path.join(self.home, 'ph5/test_data/ph5')
+        for name in ('master.ph5', 'miniPH5_00001.ph5'):
+            shutil.copy(os.path.join(testpath, name), name)
+        shutil.copy('miniPH5_00001.ph5', 'miniPH5_00002.ph5')
+        with tables.open_file('master.ph5', 'a') as master:
+            master.remove_node('/Experiment_g/Receivers_g', 'Das_g_9EEF')
+            master.create_external_link(
+                '/Experiment_g/Receivers_g', 'Das_g_9EEF',
+                'miniPH5_00002.ph5:/Experiment_g/Receivers_g/Das_g_9EEF')
+        self.ph5_object = ph5api.PH5(path='.', nickname='master.ph5',
+                                     max_open_minis=1)
+
+    def tearDown(self):
+        self.ph5_object.close()
+        super(TestPH5API_mini_pool, self).tearDown()
+
+    def test_alternate_minis(self):
+        # reading two minis in turn with one kept open
+        pool = self.ph5_object.mini_pool
+        cuts = {}
+        for i in range(2):
+            for das in ('9EEF', '3X500'):
+                rows = self.ph5_object.query_das_t(
+                    das, 1, 0, 2000000000, check_samplerate=False)
+                start = rows[0]['time/epoch_l']
+                traces = self.ph5_object.cut(
+                    das, start, start + 1, chan=1,
+                    sample_rate=rows[0]['sample_rate_i'])
+                cut = traces[0].data.tolist()
+                self.assertTrue(cut)
+                self.assertEqual(cuts.setdefault(das, cut), cut)
+                self.assertEqual(1, len(pool.files))
+        self.assertEqual(4, pool.opens)
+
+    def test_pin(self):
+        # the current das and pinned nodes are kept open
+        pool = self.ph5_object.mini_pool
+        receivers = self.ph5_object.ph5_g_receivers
+        self.ph5_object.read_das_t('9EEF')
+        das_t = receivers.current_t_das
+        pool.pin(das_t._v_file.filename)
+        self.ph5_object.read_das_t('3X500')
+        self.assertEqual(3, das_t.nrows)
+        self.assertEqual(2, len(pool.files))
+        self.assertTrue(receivers.current_t_das.nrows)
+
+        pool.unpin(das_t._v_file.filename)
+        self.assertFalse(das_t._v_isopen)
+        self.assertEqual(1, len(pool.files))
+        self.assertTrue(receivers.current_t_das.nrows)
+
+
 class TestPH5API_srm_query_das_t(TempDirTestCase, LogTestCase):
     def tearDown(self):
         self.ph5_object.ph5close()
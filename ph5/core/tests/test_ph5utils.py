@@ -1,8 +1,10 @@
 """
 Tests for ph5utils
 """
+import os
 import unittest
 from ph5.core import ph5utils
+from ph5.core.tests.test_base import TempDirTestCase
 import datetime
 
 
@@ -439,5 +441,54 @@ class TestPH5Utils(unittest.TestCase):
             rounded)
 
 
+class TestPH5ResponseCache(TempDirTestCase):
+    def test_memory(self):
+        cache = ph5utils.PH5ResponseCache(maxsize=2)
+        cache.put('a', {'stages': [1, 2]})
+        cache.put('b', {'stages': [3]})
+        # each get is a new copy
+        resp = cache.get('a')
+        self.assertEqual({'stages': [1, 2]}, resp)
+        resp['stages'].pop()
+        self.assertEqual({'stages': [1, 2]}, cache.get('a'))
+        self.assertEqual((2, 0), (cache.hits, cache.misses))
+        # b is least recently used
+        cache.put('c', {})
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual({}, cache.get('c'))
+        self.assertEqual(1, cache.misses)
+
+    def test_disk(self):
+        open('master.ph5', 'w').close()
+        key = ph5utils.PH5ResponseCache.get_key('master.ph5',
+                                                '/Experiment_g/Responses_g/x')
+        self.assertEqual((os.path.abspath('master.ph5'),
+                          '/Experiment_g/Responses_g/x',
+                          os.path.getmtime('master.ph5')), key)
+
+        cache = ph5utils.PH5ResponseCache(path='cache')
+        cache.put(key, [1, 2, 3])
+        # another process with the same path
+        other = ph5utils.PH5ResponseCache(path='cache')
+        self.assertEqual([1, 2, 3], other.get(key))
+        self.assertEqual(1, len(os.listdir('cache')))
+
+        # unreadable files are misses
+        with open(other.get_filename(key), 'wb') as fh:
+            fh.write('not a pickle')
+        other.clear()
+        self.assertIsNone(other.get(key))
+
+        # least recently used files are removed first
+        cache.put(key, [1, 2, 3])
+        filename = cache.get_filename(key)
+        os.utime(filename, (0, 0))
+        cache.maxbytes = os.path.getsize(filename)
+        key2 = key[:2] + (key[2] + 1,)
+        cache.put(key2, [4, 5, 6])
+        self.assertEqual([os.path.basename(cache.get_filename(key2))],
+                         os.listdir('cache'))
+
+
 if __name__ == "__main__":
     unittest.main()
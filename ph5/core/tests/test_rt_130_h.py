@@ -0,0 +1,61 @@
+'''
+Tests for rt_130_h
+'''
+import os
+import unittest
+import zipfile
+
+import rt_130_py
+from ph5.core import rt_130_h
+from ph5.core.tests.test_base import LogTestCase
+
+
+class TestRT130_decode_packets(LogTestCase):
+    def setUp(self):
+        super(TestRT130_decode_packets, self).setUp()
+        home = os.getcwd()
+        rt130 = zipfile.ZipFile(
+            os.path.join(home, 'ph5/test_data/rt130/2016139.9EEF.ZIP'))
+        self.bufs = [rt130.read(n) for n in rt130.namelist()]
+
+    def test_decode_packets(self):
+        # all packets of a buffer decode as one packet at a time
+        num_dt = 0
+        for buf in self.bufs:
+            types, headers, samples = rt_130_h.decode_packets(buf)
+            self.assertEqual(len(buf) // 1024, len(headers))
+            for i, header in enumerate(headers):
+                pbuf = buf[i * 1024:(i + 1) * 1024]
+                self.assertEqual(pbuf[:2], types[i])
+                ph = rt_130_py.get_packet_header(pbuf)
+                self.assertEqual(list(ph[1:]),
+                                 [header[c] for c in
+                                  rt_130_h.PACKET_COLUMNS[:10]])
+                if types[i] != 'DT':
+                    self.assertEqual(-1, header['offset'])
+                    continue
+                num_dt += 1
+                dt = rt_130_h.DT().decode(pbuf)
+                self.assertEqual(
+                    (dt.event, dt.data_stream, dt.channel, dt.samples),
+                    (header['event'], header['data_stream'],
+                     header['channel'], header['samples']))
+                self.assertEqual(list(dt.data),
+                                 rt_130_h.DT().decode(
+                                     pbuf, (header, samples)).data.tolist())
+        self.assertTrue(num_dt)
+
+    def test_group_samples(self):
+        types, headers, samples = rt_130_h.decode_packets(self.bufs[0])
+        traces = [samples[h['offset']:h['offset'] + h['count']]
+                  for h in headers if h['offset'] >= 0]
+        # lists, as DT.decode returns for packets not decoded in bulk
+        traces.append([1, 2, 3])
+        grouped = rt_130_h.group_samples(traces)
+        self.assertEqual('int32', grouped.dtype.name)
+        self.assertEqual([s for t in traces for s in t], grouped.tolist())
+        self.assertEqual([], rt_130_h.group_samples([]).tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()
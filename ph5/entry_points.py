@@ -220,6 +220,11 @@ class CommandList():
                            'ph5.utilities.fix_srm:main',
                            'For fixing sample_rate_multiplier_i=0 or missing.',
                            type=EntryPointTypes.ALL),
+                EntryPoint('index_availability_t',
+                           'ph5.utilities.index_availability_t:main',
+                           'Build the availability table used by '
+                           'ph5availability.',
+                           type=EntryPointTypes.ALL),
                 EntryPoint('index_offset_t',
                            'ph5.utilities.index_offset_t:main',
                            'Index offset table in ph5 file to speed '
@@ -7,6 +7,9 @@
 #
 
 import argparse
+import collections
+import itertools
+import multiprocessing
 import sys
 import logging
 import os
@@ -16,7 +19,8 @@ import time
 import math
 import re
 from ph5 import LOGGING_FORMAT
-from ph5.core import experiment, kef, pn130, timedoy
+from ph5.core import availability, experiment, journal, kef, \
+    miniallocator, pn130, rt_130_h, timedoy
 
 PROG_VERSION = '2019.14'
 LOGGER = logging.getLogger(__name__)
@@ -29,7 +33,6 @@ ZIPfileRE = re.compile(
     r".*\d\d\d\d\d\d\.(\w\w\w\w)(\.\d\d)?\.[TtZz][AaIi][RrPp]")
 RAWfileRE = re.compile(r".*(\w\w\w\w)\.[Cc][Ff]")
 REFfileRE = re.compile(r".*(\w\w\w\w)\.[Rr][Ee][Ff]")
-miniPH5RE = re.compile(r".*miniPH5_(\d\d\d\d\d)\.ph5")
 
 CURRENT_DAS = None
 DAS_INFO = {}
@@ -38,6 +41,16 @@ F = None
 
 VERBOSE = False
 DEBUG = False
+# Number of processes reading RT-130 files
+PROCESSES = 1
+# Ingestion journal, set with --journal
+JOURNAL = None
+# Chunks and compression of Data_a arrays, experiment.DataStorage
+DATA_STORAGE = None
+# Mini file of each DAS, miniallocator.MiniAllocator
+MINIS = None
+# DASes written to, their Availability_t rows are refreshed
+DASES = set()
 
 os.environ['TZ'] = 'UTC'
 time.tzset()
@@ -304,9 +317,11 @@ def get_args():
            -v   be verbose
            -M   create a specific number of miniPH5 files
            -S   First index of miniPH5_xxxxx.ph5
+           --processes   number of processes reading raw files
+           --journal   keep an ingestion journal
     '''
     global FILES, PH5, WINDOWS, PARAMETERS, SR, NUM_MINI, VERBOSE, DEBUG
-    global FIRST_MINI
+    global FIRST_MINI, PROCESSES, JOURNAL, DATA_STORAGE
 
     parser = argparse.ArgumentParser(
                                 formatter_class=argparse.RawTextHelpFormatter)
@@ -336,6 +351,35 @@ def get_args():
                         help=("The index of the first miniPH5_xxxxx.ph5 "
                               "file of all. Ex: -S 5"),
                         metavar="first_mini", type=int, default=1)
+    parser.add_argument("--processes",
+                        help=("Decode RT-130 files in this many worker "
+                              "processes. PH5 is written by the main "
+                              "process in file order. Ex: --processes 4"),
+                        metavar="processes", type=int, default=1)
+    parser.add_argument("--journal",
+                        help=("Keep an ingestion journal, skip files "
+                              "already in PH5 and roll back files left "
+                              "partly written."),
+                        action="store_true", default=False)
+    parser.add_argument("--chunk",
+                        help=("Samples in a chunk of the Data_a arrays, or "
+                              "seconds with an s suffix. "
+                              "Ex: --chunk 4096 or --chunk 10s"),
+                        metavar="chunk", default=None)
+    parser.add_argument("--complib",
+                        help=("Compression library of the Data_a arrays, "
+                              "zlib, lzo, bzip2, blosc or blosc:[blosclz, "
+                              "lz4, lz4hc, snappy, zlib, zstd]. "
+                              "Default: zlib"),
+                        metavar="complib", default='zlib')
+    parser.add_argument("--complevel",
+                        help=("Compression level of the Data_a arrays, "
+                              "0 to 9. Default: 6"),
+                        metavar="complevel", type=int,
+                        default=experiment.ZLIBCOMP)
+    parser.add_argument("--no_shuffle",
+                        help="Don't shuffle the bytes of the Data_a arrays.",
+                        action="store_true", default=False)
     parser.add_argument("-s", "--samplerate", dest="samplerate",
                         help="Extract only data at given sample rate.",
                         metavar="samplerate")
@@ -381,11 +425,20 @@ def get_args():
                         default=False)
     args = parser.parse_args()
 
+    try:
+        DATA_STORAGE = experiment.DataStorage.from_chunk(
+            args.chunk, complib=args.complib, complevel=args.complevel,
+            shuffle=not args.no_shuffle)
+    except ValueError as e:
+        LOGGER.error(e)
+        sys.exit()
+
     FILES = []
     PH5 = None
     SR = args.samplerate
     NUM_MINI = args.num_mini
     FIRST_MINI = args.first_mini
+    PROCESSES = args.processes
     VERBOSE = args.verbose
     DEBUG = args.debug
     if args.debug:
@@ -423,6 +476,10 @@ def get_args():
         LOGGER.error("Missing required option. Try --help")
         sys.exit()
 
+    if PROCESSES < 1:
+        LOGGER.error("--processes must be 1 or more.")
+        sys.exit()
+
     if not os.path.exists(PH5) and not os.path.exists(PH5 + '.ph5'):
         LOGGER.error("{0} does not exist!".format(PH5))
         sys.exit()
@@ -436,6 +493,9 @@ def get_args():
         ch.setFormatter(formatter)
         LOGGER.addHandler(ch)
 
+    if args.journal:
+        JOURNAL = journal.Journal('.')
+
 
 def initializeExperiment(nickname):
     global EX, PH5
@@ -627,6 +687,9 @@ def writeEvent(points, event):
             # Check to see if group exists for this das, if not build it
             das_g, das_t, receiver_t, time_t = EXREC.ph5_g_receivers.newdas(
                 das_number)
+            DASES.add(str(das_number))
+            if JOURNAL is not None:
+                JOURNAL.das(EXREC.ph5_g_receivers)
             # Fill in das_t
             p_das_t['raw_file_name_s'] = os.path.basename(F)
             p_das_t['array_name_SOH_a'] = EXREC.ph5_g_receivers.nextarray(
@@ -670,15 +733,14 @@ def writeEvent(points, event):
             p_das_t['array_name_data_a'] = EXREC.ph5_g_receivers.nextarray(
                 'Data_a_')
             # XXX   Write data   XXX
-            t = event[c].trace[ii][0]
+            # Samples of all packets written with one append
+            data = rt_130_h.group_samples([t.trace
+                                           for t in event[c].trace[ii]])
             if DEBUG:
-                tcount = len(t.trace)
+                tcount = len(data)
             earray = EXREC.ph5_g_receivers.newarray(
-                p_das_t['array_name_data_a'], t.trace, dtype='int32')
-            for t in event[c].trace[ii][1:]:
-                if DEBUG:
-                    tcount += len(t.trace)
-                earray.append(t.trace)
+                p_das_t['array_name_data_a'], data, dtype='int32',
+                sample_rate=float(irate) / mult)
             if DEBUG:
                 LOGGER.debug(
                     "{0} SR: {1:12.2f}sps Channel: {2} Samples: {3}/{4}"
@@ -805,6 +867,7 @@ def window_contained(e):
 
 def openPH5(filename):
     exrec = experiment.ExperimentGroup(nickname=filename)
+    exrec.data_storage = DATA_STORAGE
     exrec.ph5open(True)
     exrec.initgroup()
     return exrec
@@ -814,55 +877,7 @@ def get_current_data_only(size_of_data, das=None):
     '''   Return opened file handle for data only PH5 file that will be
           less than MAX_PH5_BYTES after raw data is added to it.
     '''
-    def sstripp(s):
-        s = s.replace('.ph5', '')
-        s = s.replace('./', '')
-        return s
-
-    def smallest():
-        '''   Return the name of the smallest miniPH5_xxxxx.ph5   '''
-        minifiles = filter(miniPH5RE.match, os.listdir('.'))
-
-        tiny = minifiles[0]
-        for f in minifiles:
-            if os.path.getsize(f) < os.path.getsize(tiny):
-                tiny = f
-
-        return tiny
-
-    das = str(CURRENT_DAS)
-    # newest = 0
-    newestfile = ''
-    # Get the most recent data only PH5 file or match DAS serialnumber
-    n = 0
-    for index_t in INDEX_T.rows:
-        # This DAS already exists in a ph5 file
-        if index_t['serial_number_s'] == das:
-            newestfile = sstripp(index_t['external_file_name_s'])
-            return openPH5(newestfile)
-        # miniPH5_xxxxx.ph5 with largest xxxxx
-        mh = miniPH5RE.match(index_t['external_file_name_s'])
-        if n < int(mh.groups()[0]):
-            newestfile = sstripp(index_t['external_file_name_s'])
-            n = int(mh.groups()[0])
-
-    if not newestfile:
-        # This is the first file added
-        return openPH5('miniPH5_{0:05d}'.format(FIRST_MINI))
-
-    size_of_exrec = os.path.getsize(newestfile + '.ph5')
-    if NUM_MINI is not None:
-        fm = FIRST_MINI - 1
-        if (int(newestfile[8:13]) - fm) < NUM_MINI:
-            newestfile = "miniPH5_{0:05d}".format(int(newestfile[8:13]) + 1)
-        else:
-            small = sstripp(smallest())
-            return openPH5(small)
-
-    elif (size_of_data + size_of_exrec) > MAX_PH5_BYTES:
-        newestfile = "miniPH5_{0:05d}".format(int(newestfile[8:13]) + 1)
-
-    return openPH5(newestfile)
+    return openPH5(MINIS.allocate(CURRENT_DAS, size_of_data))
 
 
 def writeINDEX():
@@ -908,26 +923,28 @@ def writeINDEX():
     DAS_INFO = {}
 
 
-def updatePH5(f):
-    global EX, EXREC, VERBOSE, PARAMETERS
-    global log_array, soh_array
-    sys.stdout.write(":<Processing>: {0}\n".format(f))
-    sys.stdout.flush()
-    LOGGER.info("Processing: %s..." % f)
-    size_of_data = os.path.getsize(f) * 1.40
-    try:
-        EXREC.ph5close()
-    except BaseException:
-        pass
+class RT130_Event(object):
+    '''   An event decoded from a stream with the log, SOH and error
+          messages read with it. The event is written if contained is
+          True.
+    '''
+    __slots__ = ('points', 'event', 'log', 'soh', 'errs', 'contained')
 
-    EXREC = get_current_data_only(size_of_data)
-    log_array = None
-    soh_array = None
+    def __init__(self, points, event, log, soh, errs, contained):
+        self.points = points
+        self.event = event
+        self.log = log
+        self.soh = soh
+        self.errs = errs
+        self.contained = contained
 
-    def ok_write_stream(stream, points):
-        '''   Write all events in this stream   '''
-        global log_array, soh_array
 
+def iter_events(pn, f):
+    '''   Decode the events of an open PN130, yield RT130_Event in the
+          order they are to be written.
+    '''
+    def stream_events(stream, points):
+        '''   All events in this stream   '''
         events = pn.get_stream_event(stream)
         streams = events.keys()
         for s in streams:
@@ -937,45 +954,20 @@ def updatePH5(f):
             log = pn.get_logs()
             soh = pn.get_soh()
             errs = pn.get_errs()
-            if len(errs) > 0:
-                LOGGER.error("*" * 15 + "   ERRORS   " + "*" * 15)
-                for e in errs:
-                    LOGGER.error(e)
-                LOGGER.error("*" * 15 + "   END   " + "*" * 15)
-
-            if window_contained(event[0]):
-                gwriteEvent(points, event)
-                if log_array is None:
-                    log_array = getLOG()
-                    if log_array is None:
-                        continue
-
-                if soh_array is None:
-                    soh_array = getSOH()
-                    if soh_array is None:
-                        continue
-
-                if len(log) > 0:
-                    log_array.append(log)
-
-                if len(soh) > 0:
-                    soh_array.append(soh)
-            else:
+            contained = window_contained(event[0])
+            yield RT130_Event(points, event, log, soh, errs, contained)
+            if not contained:
                 break
 
-    def ok_write_stream_all():
+    def stream_events_all():
         '''   Clean up batter   '''
         for s in range(pn130.NUM_STREAMS):
             if pn.current_event[s] is not None:
                 pn.previous_event[s] = pn.current_event[s]
                 pts = pn.points[s]
-                ok_write_stream(s, pts)
+                for e in stream_events(s, pts):
+                    yield e
 
-    try:
-        pn = pn130.PN130(f, verbose=int(VERBOSE), par=PARAMETERS)
-    except Exception as e:
-        LOGGER.error("Can't open {0}. {1}".format(f, e))
-        return
     while True:
         try:
             stream, points, end = pn.getEvent()
@@ -986,7 +978,8 @@ def updatePH5(f):
         # End of file
         if end is True:
             if points != 0:
-                ok_write_stream_all()
+                for e in stream_events_all():
+                    yield e
             break
         # Corrupt packet
         if stream > NUM_STREAMS:
@@ -994,7 +987,98 @@ def updatePH5(f):
         # Empty data packet
         if not points:
             continue
-        ok_write_stream(stream, points)
+        for e in stream_events(stream, points):
+            yield e
+
+
+def read_rt130(f):
+    '''   Open RT-130 file f. Returns a generator of RT130_Event, events
+          are decoded as it is iterated, or None if f can't be opened.
+          Nothing is written to PH5 so this can run in a worker process.
+    '''
+    try:
+        pn = pn130.PN130(f, verbose=int(VERBOSE), par=PARAMETERS)
+    except Exception as e:
+        LOGGER.error("Can't open {0}. {1}".format(f, e))
+        return None
+
+    return iter_events(pn, f)
+
+
+def _read_rt130(f):
+    '''   read_rt130 in a worker process, all events are decoded   '''
+    events = read_rt130(f)
+    if events is not None:
+        events = list(events)
+
+    return events
+
+
+def read_pool(pool, files, processes):
+    '''   Decode files with a pool of worker processes.
+          Yields what _read_rt130 returns, in the order of files.
+          At most two files per process are decoded ahead of the caller.
+    '''
+    pending = collections.deque()
+    files = iter(files)
+    while True:
+        for f in itertools.islice(files, 2 * processes - len(pending)):
+            pending.append(pool.apply_async(_read_rt130, (f,)))
+        if not pending:
+            break
+        yield pending.popleft().get()
+
+
+def updatePH5(f, events=None):
+    '''   Write the events of RT-130 file f to PH5.
+          The events are read with read_rt130 if they are not given.
+    '''
+    global EX, EXREC, VERBOSE, PARAMETERS
+    global log_array, soh_array
+    sys.stdout.write(":<Processing>: {0}\n".format(f))
+    sys.stdout.flush()
+    LOGGER.info("Processing: %s..." % f)
+    size_of_data = os.path.getsize(f) * 1.40
+    try:
+        EXREC.ph5close()
+    except BaseException:
+        pass
+
+    EXREC = get_current_data_only(size_of_data)
+    log_array = None
+    soh_array = None
+
+    if events is None:
+        events = read_rt130(f)
+        if events is None:
+            return
+
+    for e in events:
+        if len(e.errs) > 0:
+            LOGGER.error("*" * 15 + "   ERRORS   " + "*" * 15)
+            for err in e.errs:
+                LOGGER.error(err)
+            LOGGER.error("*" * 15 + "   END   " + "*" * 15)
+
+        if not e.contained:
+            continue
+
+        gwriteEvent(e.points, e.event)
+        if log_array is None:
+            log_array = getLOG()
+            if log_array is None:
+                continue
+
+        if soh_array is None:
+            soh_array = getSOH()
+            if soh_array is None:
+                continue
+
+        if len(e.log) > 0:
+            log_array.append(e.log)
+
+        if len(e.soh) > 0:
+            soh_array.append(e.soh)
 
     if DAS_INFO:
         writeINDEX()
@@ -1033,10 +1117,38 @@ def update_external_references():
     LOGGER.info("Done, {0} nodes recreated.".format(n))
 
 
+def match_raw_file(f):
+    '''   Match f to the names of RT-130 raw files   '''
+    for RE in (ZIPfileRE, RAWfileRE, REFfileRE):
+        m = RE.match(f)
+        if m:
+            return m
+
+    return None
+
+
 def main():
     def prof():
-        global PH5, KEFFILE, FILES, DEPFILE, RESP, INDEX_T, CURRENT_DAS, F
+        global FILES
         get_args()
+        if JOURNAL is not None:
+            JOURNAL.rollback()
+            FILES = JOURNAL.not_ingested(FILES)
+        # Workers are started before any PH5 file is opened, they would
+        # keep the HDF5 file locks
+        pool = None
+        if PROCESSES > 1:
+            pool = multiprocessing.Pool(processes=PROCESSES)
+        try:
+            process(pool)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+    def process(pool):
+        global PH5, KEFFILE, FILES, DEPFILE, RESP, INDEX_T, CURRENT_DAS, F, \
+            MINIS
         LOGGER.info("Initializing ph5 file...")
         initializeExperiment(PH5)
 
@@ -1048,13 +1160,17 @@ def main():
             RESP = Resp(EX.ph5_g_responses)
             rows, keys = EX.ph5_g_receivers.read_index()
             INDEX_T = Rows_Keys(rows, keys)
+            MINIS = miniallocator.MiniAllocator(
+                '.', FIRST_MINI, NUM_MINI, MAX_PH5_BYTES)
+            MINIS.index(rows)
+            DASES.clear()
             LOGGER.info("Processing RAW files...")
+        if PROCESSES > 1:
+            decoded = read_pool(pool, filter(match_raw_file, FILES),
+                                PROCESSES)
         for f in FILES:
             F = f
-            for RE in (ZIPfileRE, RAWfileRE, REFfileRE):
-                m = RE.match(f)
-                if m:
-                    break
+            m = match_raw_file(f)
 
             if m:
                 try:
@@ -1062,7 +1178,17 @@ def main():
                 except BaseException:
                     CURRENT_DAS = None
 
-                updatePH5(f)
+                if JOURNAL is not None:
+                    JOURNAL.begin(f, [EX.ph5_g_receivers.ph5_t_index])
+                if PROCESSES > 1:
+                    events = next(decoded)
+                    # Failed to open, logged by the worker
+                    if events is not None:
+                        updatePH5(f, events)
+                else:
+                    updatePH5(f)
+                if JOURNAL is not None:
+                    JOURNAL.done()
             else:
                 LOGGER.warning(
                     "Unrecognized raw file name {0}. Skipping!"
@@ -1078,6 +1204,10 @@ def main():
         if fileprocessed:
             update_external_references()
         closePH5()
+        if DASES:
+            availability.refresh(EX.filename, DASES)
+        if JOURNAL is not None:
+            JOURNAL.close()
         logging.shutdown()
     prof()
 
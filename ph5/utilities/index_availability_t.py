@@ -0,0 +1,69 @@
+#!/usr/bin/env pnpython2
+#
+# Build /Experiment_g/Sorts_g/Availability_t so ph5availability does not
+# need to read every Das_t
+#
+
+import argparse
+import os
+import sys
+import logging
+
+from ph5.core import availability, ph5api
+
+PROG_VERSION = '2021.47'
+LOGGER = logging.getLogger(__name__)
+
+
+def get_args(args):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawTextHelpFormatter)
+    parser.usage = "index_availability_t --nickname ph5-file-prefix"
+
+    parser.description = ("Build the availability table, the spans of "
+                          "data of each station channel, used by "
+                          "ph5availability.\nThe raw data loaders keep it "
+                          "current, run again after Array_t changes."
+                          "\n\nVersion: {0}".format(PROG_VERSION))
+
+    parser.add_argument("-n", "--nickname", dest="ph5_file_prefix",
+                        help="The ph5 file prefix (experiment nickname).",
+                        metavar="ph5_file_prefix", default="master")
+
+    parser.add_argument("-p", "--path", dest="ph5_path",
+                        help=("Path to ph5 files. Default to current "
+                              "directory."),
+                        metavar="ph5_path", default=".")
+
+    parser.add_argument("-N", "--nuke", dest="nuke",
+                        help="Remove the availability table.",
+                        action="store_true", default=False)
+
+    return parser.parse_args(args)
+
+
+def main():
+    args = get_args(sys.argv[1:])
+    nickname = args.ph5_file_prefix
+    if nickname[-4:] != '.ph5':
+        nickname += '.ph5'
+    if not os.path.exists(os.path.join(args.ph5_path, nickname)):
+        LOGGER.error("{0} not found.".format(
+            os.path.join(args.ph5_path, nickname)))
+        sys.exit(-1)
+
+    ph5 = ph5api.PH5(path=args.ph5_path, nickname=nickname, editmode=True)
+    try:
+        if args.nuke:
+            ph5.ph5_g_sorts.nuke_availability_t()
+            LOGGER.info("Removed Availability_t.")
+            return
+        rows = availability.build(ph5)
+        availability.write(ph5, rows)
+        LOGGER.info("Wrote {0} rows to Availability_t.".format(len(rows)))
+    finally:
+        ph5.close()
+
+
+if __name__ == '__main__':
+    main()
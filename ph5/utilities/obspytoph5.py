@@ -6,12 +6,15 @@ Derick Hess
 """
 import logging
 import argparse
+import collections
+import itertools
+import multiprocessing
 import os
 import sys
-import re
 from ph5 import LOGGING_FORMAT
 from ph5.utilities import initialize_ph5
-from ph5.core import experiment, timedoy
+from ph5.core import availability, experiment, journal, miniallocator, \
+    timedoy
 from obspy.io.mseed.core import _is_mseed
 from obspy.io.mseed.util import get_flags
 from obspy import read as reader
@@ -47,6 +50,12 @@ class ObspytoPH5(object):
         self.num_mini = num_mini
         self.first_mini = first_mini
         self.mini_size_max = 26843545600
+        # Mini file of each DAS, DASes already in master.ph5 stay in
+        # their mini
+        self.minis = miniallocator.MiniAllocator(
+            ph5_path, first_mini or 1, num_mini, self.mini_size_max)
+        rows, keys = self.ph5.ph5_g_receivers.read_index()
+        self.minis.index(rows)
         self.verbose = False
         self.array_names = self.ph5.ph5_g_sorts.names()
         self.arrays = list()
@@ -55,51 +64,29 @@ class ObspytoPH5(object):
             for entry in array_:
                 self.arrays.append(entry)
         self.time_t = list()
+        # ph5.core.journal.Journal, set to keep an ingestion journal
+        self.journal = None
+        # experiment.DataStorage of the Data_a arrays written
+        self.data_storage = None
 
-    def openmini(self, mini_num):
+    def openmini(self, mini_name):
         """
         Open PH5 file, miniPH5_xxxxx.ph5
         :type: str
-        :param mini_num: name of mini file to open
+        :param mini_name: name of mini file to open without .ph5, as
+        miniallocator.MiniAllocator.allocate returns it
         :return class: ph5.core.experiment, str: name
         """
 
-        mini_num = str(mini_num).zfill(5)
-        filename = "miniPH5_{0}.ph5".format(mini_num)
+        filename = mini_name + ".ph5"
         exrec = experiment.ExperimentGroup(
             nickname=filename,
             currentpath=self.ph5_path)
+        exrec.data_storage = self.data_storage
         exrec.ph5open(True)
         exrec.initgroup()
         return exrec, filename
 
-    def get_minis(self, dir):
-        """
-        takes a directory and returns a list of all mini files
-        in the current directory
-
-        :type str
-        :param dir
-        :return: list of mini files
-        """
-        miniPH5RE = re.compile(r".*miniPH5_(\d+)\.ph5")
-        minis = list()
-        for entry in os.listdir(dir):
-            # Create full path
-            fullPath = os.path.join(dir, entry)
-            if miniPH5RE.match(entry):
-                minis.append(fullPath)
-        return minis
-
-    def get_size_mini(self, mini_num):
-        """
-        :param mini_num: str
-        :return: size of mini file in bytes
-        """
-        mini_num = str(mini_num).zfill(5)
-        filename = "miniPH5_{0}.ph5".format(mini_num)
-        return os.path.getsize(filename)
-
     def get_das_station_map(self):
         """
         Checks if array tables exist
@@ -127,60 +114,37 @@ class ObspytoPH5(object):
 
         return das_station_map
 
-    def mini_map(self, existing_minis):
-        """
-        :type list
-        :param existing_minis: A list of mini_files with path
-        :return:  list of tuples containing
-        what mini file contains what serial #s
-        """
-        mini_map = list()
-        for mini in existing_minis:
-            mini_num = int(mini.split('.')[-2].split('_')[-1])
-            exrec = experiment.ExperimentGroup(nickname=mini)
-            exrec.ph5open(True)
-            exrec.initgroup()
-            all_das = exrec.ph5_g_receivers.alldas_g()
-            das_list = list()
-            for g in all_das:
-                name = g.split('_')[-1]
-                das_list.append(name)
-            mini_map.append((mini_num, das_list))
-            exrec.ph5close()
-        return mini_map
-
-    def toph5(self, file_tuple):
+    def toph5(self, file_tuple, read=None):
         """
         Takes a tuple (file_name or obspy stream, type)
         and loads it into ph5_object
         :type tuple
         :param file_tuple containing
         file_handle or obspy stream and file type as str
+        :type tuple
+        :param read: what read_file returns for file_tuple if the file
+        has already been read, by a worker process
         :return:
         """
         index_t = list()
         time_corrected = False
         correction = False
-        current_mini = None
         in_type = None
         das_station_map = self.get_das_station_map()
-        existing_minis = self.get_minis(self.ph5_path)
 
         if not das_station_map:
             err = "Array metadata must exist before loading data"
             LOGGER.error(err)
             return "stop", index_t
 
-        # gets mapping of whats dases each minifile contains
-        minis = self.mini_map(existing_minis)
-
         # check if we are opening a file or have an obspy stream
         if isinstance(file_tuple[0], str):
-            st = reader(file_tuple[0], format=file_tuple[1])
+            if read is None:
+                read = read_file(file_tuple)
+            st, flags = read
             in_type = "file"
-            if file_tuple[1] == 'MSEED':
+            if flags is not None:
                 try:
-                    flags = get_flags(file_tuple[0])
                     if flags['activity_flags_counts'][
                              'time_correction_applied'] > 0:
                         LOGGER.info("Timing correction has been applied")
@@ -213,25 +177,6 @@ class ObspytoPH5(object):
                     LOGGER.info("No data for trace {0}...skipping".format(
                         trace.stats.channel))
                     continue
-            if not existing_minis:
-                current_mini = self.first_mini
-            else:
-                current_mini = None
-                for mini in minis:
-                    for entry in das_station_map:
-                        if (entry['serial'] in mini[1] and
-                                entry['station'] == trace.stats.station):
-                            current_mini = mini[0]
-                    if not current_mini:
-                        largest = 0
-                        for x in minis:
-                            if x[0] >= largest:
-                                largest = x[0]
-                        if (self.get_size_mini(largest) <
-                                self.mini_size_max):
-                            current_mini = largest
-                        else:
-                            current_mini = largest + 1
             # iterate through das_station_map
             for entry in das_station_map:
                 time_t = {}
@@ -241,7 +186,9 @@ class ObspytoPH5(object):
                 if trace.stats.station == entry['station']:
 
                     # open mini file
-                    mini_handle, mini_name = self.openmini(current_mini)
+                    mini_handle, mini_name = self.openmini(
+                        self.minis.allocate(entry['serial'],
+                                            trace.data.nbytes))
                     # get node reference or create new node
                     d = mini_handle.ph5_g_receivers.getdas_g(entry['serial'])
                     if not d:
@@ -375,6 +322,8 @@ class ObspytoPH5(object):
                         continue
 
                     mini_handle.ph5_g_receivers.setcurrent(d)
+                    if self.journal is not None:
+                        self.journal.das(mini_handle.ph5_g_receivers)
                     data = array(trace.data)
                     if trace.stats.channel == 'LOG':
                         mini_handle.ph5_g_receivers.newarray(
@@ -384,7 +333,8 @@ class ObspytoPH5(object):
                         data_type = data[0].__class__.__name__
                         mini_handle.ph5_g_receivers.newarray(
                             das['array_name_data_a'], data, dtype=data_type,
-                            description=None)
+                            description=None,
+                            sample_rate=trace.stats.sampling_rate)
                     mini_handle.ph5_g_receivers.populateDas_t(das)
 
                     index_t_entry['external_file_name_s'] = "./{}".format(
@@ -439,6 +389,45 @@ class ObspytoPH5(object):
         return
 
 
+def read_file(file_tuple):
+    """
+    Reads a file with obspy. Nothing is written to PH5
+    so this can run in a worker process.
+    :type tuple
+    :param file_tuple: file name and file type as str
+    :return: obspy stream, miniSEED flags or None
+    """
+    st = reader(file_tuple[0], format=file_tuple[1])
+    flags = None
+    if file_tuple[1] == 'MSEED':
+        try:
+            flags = get_flags(file_tuple[0])
+        except BaseException:
+            pass
+
+    return st, flags
+
+
+def read_pool(pool, file_tuples, processes):
+    """
+    Reads files with a pool of worker processes.
+    At most two files per process are read ahead of the caller.
+    :type list
+    :param file_tuples: tuples of file name and file type
+    :return: generator of what read_file returns,
+    in the order of file_tuples
+    """
+    pending = collections.deque()
+    file_tuples = iter(file_tuples)
+    while True:
+        for f in itertools.islice(file_tuples,
+                                  2 * processes - len(pending)):
+            pending.append(pool.apply_async(read_file, (f,)))
+        if not pending:
+            break
+        yield pending.popleft().get()
+
+
 def getListOfFiles(dirName):
     # create a list of file and sub directories
     # names in the given directory
@@ -511,11 +500,57 @@ def get_args(args):
         help="Verbose logging ",
         action='store_true')
 
+    parser.add_argument(
+        "--processes", dest="processes",
+        help=("Read files with obspy in this many worker processes. "
+              "PH5 is written by the main process in file order. "
+              "Ex: --processes 4"),
+        metavar="processes", type=int, default=1)
+
+    parser.add_argument(
+        "--journal", dest="journal",
+        help=("Keep an ingestion journal, skip files already in PH5 "
+              "and roll back files left partly written."),
+        action='store_true', default=False)
+
+    parser.add_argument(
+        "--chunk", dest="chunk",
+        help=("Samples in a chunk of the Data_a arrays, or seconds with "
+              "an s suffix. Ex: --chunk 4096 or --chunk 10s"),
+        metavar="chunk", default=None)
+
+    parser.add_argument(
+        "--complib", dest="complib",
+        help=("Compression library of the Data_a arrays, zlib, lzo, "
+              "bzip2, blosc or blosc:[blosclz, lz4, lz4hc, snappy, zlib, "
+              "zstd]. Default: zlib"),
+        metavar="complib", default='zlib')
+
+    parser.add_argument(
+        "--complevel", dest="complevel",
+        help="Compression level of the Data_a arrays, 0 to 9. Default: 6",
+        metavar="complevel", type=int, default=experiment.ZLIBCOMP)
+
+    parser.add_argument(
+        "--no_shuffle", dest="no_shuffle",
+        help="Don't shuffle the bytes of the Data_a arrays.",
+        action='store_true', default=False)
+
     return parser.parse_args(args)
 
 
 def main():
     args = get_args(sys.argv[1:])
+    if args.processes < 1:
+        LOGGER.error("--processes must be 1 or more.")
+        sys.exit()
+    try:
+        data_storage = experiment.DataStorage.from_chunk(
+            args.chunk, complib=args.complib, complevel=args.complevel,
+            shuffle=not args.no_shuffle)
+    except ValueError as e:
+        LOGGER.error(e)
+        sys.exit()
 
     if args.nickname[-3:] == 'ph5':
         ph5file = os.path.join(args.ph5path, args.nickname)
@@ -598,6 +633,42 @@ def main():
             else:
                 LOGGER.info("{0} is NOT a valid miniSEED file.".format(f))
 
+    ingest_journal = None
+    if args.journal:
+        ingest_journal = journal.Journal(args.ph5path)
+        ingest_journal.rollback()
+        names = ingest_journal.not_ingested([f[0] for f in valid_files])
+        valid_files = [f for f in valid_files if f[0] in names]
+
+    # Workers are started before the PH5 files are opened, they would
+    # keep the HDF5 file locks
+    pool = None
+    if args.processes > 1:
+        pool = multiprocessing.Pool(processes=args.processes)
+    try:
+        load(args, valid_files, pool, ingest_journal, data_storage)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        if ingest_journal is not None:
+            ingest_journal.close()
+
+
+def load(args, valid_files, pool=None, ingest_journal=None,
+         data_storage=None):
+    """
+    Loads valid files into PH5, the files are read by
+    pool if it is set
+    :type list
+    :param valid_files: tuples of file name and file type
+    :type class: multiprocessing.Pool
+    :param pool:
+    :type class: ph5.core.journal.Journal
+    :param ingest_journal: journal to record the files loaded in
+    :type class: ph5.core.experiment.DataStorage
+    :param data_storage: chunks and compression of the Data_a arrays
+    """
     # take list of valid files and load them into PH5
     ph5_object = experiment.ExperimentGroup(nickname=args.nickname,
                                             currentpath=args.ph5path)
@@ -605,33 +676,47 @@ def main():
     ph5_object.initgroup()
     obs = ObspytoPH5(ph5_object, args.ph5path,
                      args.num_mini, args.first_mini)
+    obs.journal = ingest_journal
+    obs.data_storage = data_storage
     if args.verbose:
         obs.verbose = True
-    obs.get_minis(args.ph5path)
-    if args.num_mini:
-        total = 0
-        for entry in valid_files:
-            total = total + os.path.getsize(entry[0])
-        obs.mini_size_max = (total*.60)/args.num_mini
-    index_t_full = list()
-
-    for entry in valid_files:
-        message, index_t = obs.toph5(entry)
+    receivers = ph5_object.ph5_g_receivers
+    # DASes written to, their Availability_t rows are refreshed
+    dases = set()
+
+    if pool is None:
+        reads = itertools.repeat(None)
+    else:
+        reads = read_pool(pool, valid_files, args.processes)
+
+    for entry, read in itertools.izip(valid_files, reads):
+        if ingest_journal is not None:
+            ingest_journal.begin(entry[0], [receivers.ph5_t_index,
+                                            receivers.ph5_t_time])
+        message, index_t = obs.toph5(entry, read)
+        # Time_t and Index_t are written as each file is loaded so the
+        # journal can tell the rows of a file
+        if len(obs.time_t) > 0:
+            LOGGER.info('Populating Time table')
+            for e in obs.time_t:
+                receivers.populateTime_t_(e)
+            obs.time_t = list()
+        LOGGER.info("Populating Index table")
         for e in index_t:
-            index_t_full.append(e)
+            receivers.populateIndex_t(e)
+            dases.add(e['serial_number_s'])
         if message == "stop":
             LOGGER.error("Stopping program...")
             break
-    if len(obs.time_t) > 0:
-        LOGGER.info('Populating Time table')
-        for entry in obs.time_t:
-            ph5_object.ph5_g_receivers.populateTime_t_(entry)
-    LOGGER.info("Populating Index table")
-    for entry in index_t_full:
-        ph5_object.ph5_g_receivers.populateIndex_t(entry)
+        if ingest_journal is not None:
+            ingest_journal.done()
 
+    # Index_t also has the files loaded by earlier runs
+    index_t_full, keys = receivers.read_index()
     obs.update_external_references(index_t_full)
     ph5_object.ph5close()
+    if dases:
+        availability.refresh(ph5_object.filename, dases)
 
 
 if __name__ == '__main__':
@@ -5,13 +5,13 @@ import os
 import sys
 import warnings
 import logging
-import re
 import time
 import math
 import json
 from math import modf
 from ph5 import LOGGING_FORMAT
-from ph5.core import experiment, timedoy
+from ph5.core import availability, experiment, journal, miniallocator, \
+    timedoy
 
 from obspy import read as readSEG2
 
@@ -19,10 +19,17 @@ PROG_VERSION = "2021.97"
 LOGGER = logging.getLogger(__name__)
 
 MAX_PH5_BYTES = 1073741824 * 1.  # 1 GB (1024 X 1024 X 1024 X 2)
-miniPH5RE = re.compile(r".*miniPH5_(\d\d\d\d\d)\.ph5")
 
 DAS_INFO = {}
 MAP_INFO = {}
+# Ingestion journal, set with --journal
+JOURNAL = None
+# Chunks and compression of Data_a arrays, experiment.DataStorage
+DATA_STORAGE = None
+# Mini file of each DAS, miniallocator.MiniAllocator
+MINIS = None
+# DASes written to, their Availability_t rows are refreshed
+DASES = set()
 
 SIZE_FACTOR = .4
 
@@ -106,8 +113,9 @@ def get_args():
            -p   print out table list
            -M   create a specific number of miniPH5 files
            -S   First index of miniPH5_xxxxx.ph5
+           --journal   keep an ingestion journal
     '''
-    global FILES, PH5, NUM_MINI, FIRST_MINI, PATH
+    global FILES, PH5, NUM_MINI, FIRST_MINI, PATH, JOURNAL, DATA_STORAGE
 
     parser = argparse.ArgumentParser()
     parser.usage = "Version %s seg2toph5 [--help][--raw raw_file |\
@@ -140,8 +148,40 @@ def get_args():
                         help="Do print",
                         dest="doprint",
                         action="store_true", default=False)
+    parser.add_argument("--journal",
+                        help=("Keep an ingestion journal, skip files "
+                              "already in PH5 and roll back files left "
+                              "partly written."),
+                        action="store_true", default=False)
+    parser.add_argument("--chunk",
+                        help=("Samples in a chunk of the Data_a arrays, or "
+                              "seconds with an s suffix. "
+                              "Ex: --chunk 4096 or --chunk 10s"),
+                        metavar="chunk", default=None)
+    parser.add_argument("--complib",
+                        help=("Compression library of the Data_a arrays, "
+                              "zlib, lzo, bzip2, blosc or blosc:[blosclz, "
+                              "lz4, lz4hc, snappy, zlib, zstd]. "
+                              "Default: zlib"),
+                        metavar="complib", default='zlib')
+    parser.add_argument("--complevel",
+                        help=("Compression level of the Data_a arrays, "
+                              "0 to 9. Default: 6"),
+                        metavar="complevel", type=int,
+                        default=experiment.ZLIBCOMP)
+    parser.add_argument("--no_shuffle",
+                        help="Don't shuffle the bytes of the Data_a arrays.",
+                        action="store_true", default=False)
     args = parser.parse_args()
 
+    try:
+        DATA_STORAGE = experiment.DataStorage.from_chunk(
+            args.chunk, complib=args.complib, complevel=args.complevel,
+            shuffle=not args.no_shuffle)
+    except ValueError as e:
+        LOGGER.error(e)
+        sys.exit()
+
     FILES = []
     PH5 = None
     NUM_MINI = args.num_mini
@@ -175,6 +215,9 @@ def get_args():
         ch.setFormatter(formatter)
         LOGGER.addHandler(ch)
 
+    if args.journal:
+        JOURNAL = journal.Journal('.')
+
 
 def initializeExperiment():
     global EX
@@ -188,6 +231,7 @@ def initializeExperiment():
 def openPH5(filename):
     LOGGER.info("Opening: {0}".format(filename))
     exrec = experiment.ExperimentGroup(nickname=filename)
+    exrec.data_storage = DATA_STORAGE
     exrec.ph5open(True)
     exrec.initgroup()
     return exrec
@@ -197,58 +241,7 @@ def get_current_data_only(size_of_data, das=None):
     '''   Return opened file handle for data only PH5 file that will be
           less than MAX_PH5_BYTES after raw data is added to it.
     '''
-
-    def sstripp(s):
-        s = s.replace('.ph5', '')
-        s = s.replace('./', '')
-        return s
-
-    def smallest():
-        '''   Return the name of the smallest miniPH5_xxxxx.ph5   '''
-        minifiles = filter(miniPH5RE.match, os.listdir('.'))
-
-        tiny = minifiles[0]
-        for f in minifiles:
-            if os.path.getsize(f) < os.path.getsize(tiny):
-                tiny = f
-
-        return tiny
-
-    das = str(CURRENT_DAS)
-    newestfile = ''
-    # Get the most recent data only PH5 file or match DAS serialnumber
-    n = 0
-    for index_t in INDEX_T_DAS.rows:
-        # This DAS already exists in a ph5 file
-        if index_t['serial_number_s'] == das:
-            newestfile = sstripp(index_t['external_file_name_s'])
-            return openPH5(newestfile)
-        # miniPH5_xxxxx.ph5 with largest xxxxx
-        mh = miniPH5RE.match(index_t['external_file_name_s'])
-        if n < int(mh.groups()[0]):
-            newestfile = sstripp(index_t['external_file_name_s'])
-            n = int(mh.groups()[0])
-
-    if not newestfile:
-        # This is the first file added
-        mf = 'miniPH5_{0:05d}'.format(FIRST_MINI)
-        return openPH5(mf)
-    else:
-        mf = newestfile + '.ph5'
-
-    size_of_exrec = os.path.getsize(mf)
-    if NUM_MINI is not None:
-        fm = FIRST_MINI - 1
-        if (int(newestfile[8:13]) - fm) < NUM_MINI:
-            newestfile = "miniPH5_{0:05d}".format(int(newestfile[8:13]) + 1)
-        else:
-            small = sstripp(smallest())
-            return openPH5(small)
-
-    elif (size_of_data + size_of_exrec) > MAX_PH5_BYTES:
-        newestfile = "miniPH5_{0:05d}".format(int(newestfile[8:13]) + 1)
-
-    return openPH5(newestfile)
+    return openPH5(MINIS.allocate(CURRENT_DAS, size_of_data))
 
 
 def update_external_references():
@@ -447,6 +440,9 @@ def updatePH5(stream):
 
         # Check to see if group exists for this das, if not build it
         EXREC.ph5_g_receivers.newdas(CURRENT_DAS)
+        DASES.add(str(CURRENT_DAS))
+        if JOURNAL is not None:
+            JOURNAL.das(EXREC.ph5_g_receivers)
         # Update Maps_g
         fd = {}
         td = {}
@@ -504,7 +500,7 @@ def updatePH5(stream):
         # Write out array data (it would be nice if we had int24) we use int32!
         EXREC.ph5_g_receivers.newarray(
             p_das_t['array_name_data_a'], trace.data, dtype='int32',
-            description=des)
+            description=des, sample_rate=trace.stats.sampling_rate)
         update_index_t_info(p_das_t['time/epoch_l'] + (
                     float(p_das_t['time/micro_seconds_i']) / 1000000.),
                             p_das_t['sample_count_i'],
@@ -536,8 +532,11 @@ def getLOG(Das):
 
 
 def main():
-    global F, RESP, INDEX_T_DAS
+    global F, RESP, INDEX_T_DAS, FILES, MINIS
     get_args()
+    if JOURNAL is not None:
+        JOURNAL.rollback()
+        FILES = JOURNAL.not_ingested(FILES)
     import time
     then = time.time()
     initializeExperiment()
@@ -548,6 +547,10 @@ def main():
         Resp(EX.ph5_g_responses)
         rows, keys = EX.ph5_g_receivers.read_index()
         INDEX_T_DAS = Rows_Keys(rows, keys)
+        MINIS = miniallocator.MiniAllocator(
+            '.', FIRST_MINI, NUM_MINI, MAX_PH5_BYTES)
+        MINIS.index(rows)
+        DASES.clear()
 
     for f in FILES:
         F = f
@@ -567,7 +570,12 @@ def main():
                         stream[0].stats.starttime,
                         stream[0].stats.endtime,
                         stream[0].stats.channel))
+                if JOURNAL is not None:
+                    JOURNAL.begin(f, [EX.ph5_g_receivers.ph5_t_index,
+                                      EX.ph5_g_maps.ph5_t_index])
                 updatePH5(stream)
+                if JOURNAL is not None:
+                    JOURNAL.done()
             else:
                 LOGGER.info("Failed to read: {0}.".format(f))
                 LOGGER.error("Can't process {0}".format(f))
@@ -587,6 +595,10 @@ def main():
         EXREC.ph5close()
     except NameError:
         pass
+    if DASES:
+        availability.refresh(EX.filename, DASES)
+    if JOURNAL is not None:
+        JOURNAL.close()
 
 
 if __name__ == '__main__':
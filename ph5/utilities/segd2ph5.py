@@ -14,6 +14,10 @@ import logging
 import time
 import json
 import re
+import collections
+import copy_reg
+import itertools
+import multiprocessing
 from math import modf
 import warnings
 
@@ -22,7 +26,8 @@ import construct
 import bcd_py
 from tables import NaturalNameWarning
 
-from ph5.core import experiment, columns, segdreader, segdreader_smartsolo
+from ph5.core import availability, experiment, columns, journal, \
+    miniallocator, segdreader, segdreader_smartsolo
 from ph5 import LOGGING_FORMAT
 warnings.filterwarnings('ignore', category=NaturalNameWarning)
 
@@ -41,8 +46,15 @@ DAS_INFO = {}
 MAP_INFO = {}
 #   Current raw file processing
 F = None
+#   Ingestion journal, set with --journal
+JOURNAL = None
+# Chunks and compression of Data_a arrays, experiment.DataStorage
+DATA_STORAGE = None
+# Mini file of each DAS, miniallocator.MiniAllocator
+MINIS = None
+# DASes written to, their Availability_t rows are refreshed
+DASES = set()
 #   RE for mini files
-miniPH5RE = re.compile(r".*miniPH5_(\d\d\d\d\d)\.ph5")
 
 # -2.5V to 2.5V
 mV_full_scale = 5000
@@ -176,6 +188,74 @@ class Trace(object):
         self.headers = headers
 
 
+class SegD_Info(object):
+    '''   Reader attributes used by process_traces, copied so the headers
+          can be sent from a worker process   '''
+    __slots__ = ('filename', 'manufacturer', 'chan_sets_per_scan',
+                 'sample_rate', 'deploy_epoch', 'pickup_epoch', 'id_number',
+                 'reel_headers')
+
+    def __init__(self, sd):
+        self.filename = sd.name()
+        self.manufacturer = sd.manufacturer
+        self.chan_sets_per_scan = getattr(sd, 'chan_sets_per_scan', None)
+        self.sample_rate = sd.sample_rate
+        self.deploy_epoch = sd.deploy_epoch
+        self.pickup_epoch = sd.pickup_epoch
+        self.id_number = sd.id_number
+        self.reel_headers = sd.reel_headers
+
+    def name(self):
+        return self.filename
+
+
+class SegD_Trace(object):
+    '''   A combined trace ready for process_traces   '''
+    __slots__ = ('sd', 'headers', 'trace', 'das', 'lat', 'lon')
+
+    def __init__(self, sd, headers, trace, das, lat, lon):
+        self.sd = sd
+        self.headers = headers
+        self.trace = trace
+        self.das = das
+        self.lat = lat
+        self.lon = lon
+
+
+class SegD_File(object):
+    '''   A SEG-D file read by read_segd   '''
+    __slots__ = ('filename', 'name', 'size', 'das', 'part_number',
+                 'node_id', 'number_of_channels', 'traces')
+
+    def __init__(self, filename, name, size, das, part_number, node_id,
+                 number_of_channels, traces):
+        self.filename = filename
+        self.name = name
+        self.size = size
+        self.das = das
+        self.part_number = part_number
+        self.node_id = node_id
+        self.number_of_channels = number_of_channels
+        self.traces = traces
+
+
+def _make_container(cls, keys_order, items):
+    c = cls()
+    dict.update(c, items)
+    object.__setattr__(c, '__keys_order__', keys_order)
+    return c
+
+
+def _reduce_container(c):
+    '''   Pickle construct Containers, which fail to unpickle by default.
+          The key order is kept as is for the json headers.
+    '''
+    return _make_container, (c.__class__, list(c.__keys_order__), dict(c))
+
+
+copy_reg.pickle(construct.Container, _reduce_container)
+
+
 def read_infile(infile):
     '''   Read list of input SEG-D files from a file   '''
     global FILES
@@ -205,7 +285,7 @@ def read_infile(infile):
 
 def get_args():
     global PH5, FILES, EVERY, NUM_MINI, TSPF, UTM, FIRST_MINI, APPEND,\
-        MANUFACTURERS_CODE
+        MANUFACTURERS_CODE, PROCESSES, JOURNAL, DATA_STORAGE
 
     TSPF = False
     from optparse import OptionParser
@@ -277,11 +357,46 @@ def get_args():
                          data loggers,",
                        type='int', default=None)
 
+    oparser.add_option("--processes", dest="processes",
+                       help="Number of processes used to read SEG-D files.\
+                        PH5 is written by the main process. Default 1",
+                       metavar="processes", type='int', default=1)
+
+    oparser.add_option("--journal", dest="journal",
+                       help="Keep an ingestion journal, skip files already\
+                        in PH5 and roll back files left partly written.",
+                       action="store_true", default=False)
+    oparser.add_option("--chunk", dest="chunk",
+                       help="Samples in a chunk of the Data_a arrays, or\
+                       seconds with an s suffix.\
+                       Ex: --chunk 4096 or --chunk 10s",
+                       metavar="chunk", default=None)
+    oparser.add_option("--complib", dest="complib",
+                       help="Compression library of the Data_a arrays,\
+                       zlib, lzo, bzip2, blosc or blosc:[blosclz, lz4,\
+                       lz4hc, snappy, zlib, zstd]. Default: zlib",
+                       metavar="complib", default='zlib')
+    oparser.add_option("--complevel", dest="complevel",
+                       help="Compression level of the Data_a arrays,\
+                       0 to 9. Default: 6",
+                       metavar="complevel", type=int,
+                       default=experiment.ZLIBCOMP)
+    oparser.add_option("--no_shuffle", dest="no_shuffle",
+                       help="Don't shuffle the bytes of the Data_a arrays.",
+                       action="store_true", default=False)
+
     options, args = oparser.parse_args()
 
     if options.rawfile and options.infile:
         oparser.error("argument -f/--file: not allowed with argument -r/--raw")
 
+    try:
+        DATA_STORAGE = experiment.DataStorage.from_chunk(
+            options.chunk, complib=options.complib,
+            complevel=options.complevel, shuffle=not options.no_shuffle)
+    except ValueError as e:
+        oparser.error(e)
+
     FILES = []
     PH5 = None
 
@@ -292,6 +407,7 @@ def get_args():
     TSPF = options.texas_spc
     APPEND = options.combine
     MANUFACTURERS_CODE = options.manufacturers_code
+    PROCESSES = options.processes
 
     if options.infile is not None:
         read_infile(options.infile)
@@ -310,6 +426,9 @@ def get_args():
 
     setLogger()
 
+    if options.journal:
+        JOURNAL = journal.Journal('.')
+
 
 def setLogger():
     if LOGGER.handlers != []:
@@ -344,6 +463,7 @@ def openPH5(filename):
     except BaseException:
         pass
     exrec = experiment.ExperimentGroup(nickname=filename)
+    exrec.data_storage = DATA_STORAGE
     exrec.ph5open(True)
     exrec.initgroup()
     return exrec
@@ -432,55 +552,7 @@ def get_current_data_only(size_of_data, das=None):
     '''   Return opened file handle for data only PH5 file that will be
           less than MAX_PH5_BYTES after raw data is added to it.
     '''
-
-    def sstripp(s):
-        s = s.replace('.ph5', '')
-        s = s.replace('./', '')
-        return s
-
-    def smallest():
-        '''   Return the name of the smallest miniPH5_xxxxx.ph5   '''
-        minifiles = filter(miniPH5RE.match, os.listdir('.'))
-
-        tiny = minifiles[0]
-        for f in minifiles:
-            if os.path.getsize(f) < os.path.getsize(tiny):
-                tiny = f
-
-        return tiny
-
-    das = str(das)
-    newestfile = ''
-    #   Get the most recent data only PH5 file or match DAS serialnumber
-    n = 0
-    for index_t in INDEX_T_DAS.rows:
-        #   This DAS already exists in a ph5 file
-        if index_t['serial_number_s'] == das:
-            newestfile = sstripp(index_t['external_file_name_s'])
-            return openPH5(newestfile)
-        #   miniPH5_xxxxx.ph5 with largest xxxxx
-        mh = miniPH5RE.match(index_t['external_file_name_s'])
-        if n < int(mh.groups()[0]):
-            newestfile = sstripp(index_t['external_file_name_s'])
-            n = int(mh.groups()[0])
-
-    if not newestfile:
-        #   This is the first file added
-        return openPH5('miniPH5_{0:05d}'.format(FIRST_MINI))
-
-    size_of_exrec = os.path.getsize(newestfile + '.ph5')
-    if NUM_MINI is not None:
-        fm = FIRST_MINI - 1
-        if (int(newestfile[8:13]) - fm) < NUM_MINI:
-            newestfile = "miniPH5_{0:05d}".format(int(newestfile[8:13]) + 1)
-        else:
-            small = sstripp(smallest())
-            return openPH5(small)
-
-    elif (size_of_data + size_of_exrec) > MAX_PH5_BYTES:
-        newestfile = "miniPH5_{0:05d}".format(int(newestfile[8:13]) + 1)
-
-    return openPH5(newestfile)
+    return openPH5(MINIS.allocate(das, size_of_data))
 
 
 def getLOG():
@@ -613,6 +685,9 @@ def process_traces(rh, th, tr):
         #   Check to see if group exists for this das, if not build it
         das_g, das_t, receiver_t, time_t = EXREC.ph5_g_receivers.newdas(
             str(Das))
+        DASES.add(str(Das))
+        if JOURNAL is not None:
+            JOURNAL.das(EXREC.ph5_g_receivers)
         #   Build maps group (XXX)
         EXREC.ph5_g_maps.newdas('Das_g_', str(Das))
         if rh.general_header_blocks[0].chan_sets_per_scan == 1:
@@ -695,12 +770,12 @@ def process_traces(rh, th, tr):
                 tr_counts = tr / LSB
                 EXREC.ph5_g_receivers.newarray(
                     p_das_t['array_name_data_a'], tr_counts, dtype='int32',
-                    description=des)
+                    description=des, sample_rate=SD.sample_rate)
             elif SD.manufacturer == 'SmartSolo':
                 # SmartSolo is recorded by mV
                 EXREC.ph5_g_receivers.newarray(
                     p_das_t['array_name_data_a'], tr, dtype='float32',
-                    description=des)
+                    description=des, sample_rate=SD.sample_rate)
         except Exception as e:
             #   Failed, leave as float
             LOGGER.warning(
@@ -710,7 +785,7 @@ def process_traces(rh, th, tr):
             p_response_t['bit_weight/value_d'] = 1.
             EXREC.ph5_g_receivers.newarray(
                 p_das_t['array_name_data_a'], tr, dtype='float32',
-                description=des)
+                description=des, sample_rate=SD.sample_rate)
         update_index_t_info(p_das_t['time/epoch_l'] + (
                     float(p_das_t['time/micro_seconds_i']) / 1000000.),
                             p_das_t['sample_count_i'],
@@ -1122,79 +1197,281 @@ def get_latlon(manu, th):
     return LAT, LON
 
 
+def get_das(sd, warn=False):
+    if sd.manufacturer == 'FairfieldNodal':
+        #   Return line_station or das#[-9:]
+        try:
+            das = "{0}X{1}".format(
+                sd.reel_headers.extended_headers[2].line_number,
+                sd.reel_headers.extended_headers[2].receiver_point)
+        except Exception:
+            try:
+                das = "{0}X{1}".format(
+                    sd.reel_headers.external_header.receiver_line,
+                    sd.reel_headers.external_header.receiver_point)
+            except Exception:
+                das = "sn" + \
+                      str(sd.reel_headers.general_header_blocks[0].
+                          manufactures_sn)
+                if das == 0:
+                    das = "id" + \
+                          str(sd.reel_headers
+                              .extended_headers[0].id_number)[-9:]
+    elif sd.manufacturer == 'SmartSolo':
+        line_number = sd.trace_headers.line_number
+        receiver_point = sd.trace_headers.receiver_point
+        if line_number == -1:
+            if warn:
+                LOGGER.warning(
+                    "Line number is using invalid default value -1. "
+                    "Using 1 instead.")
+            line_number = 1
+        if receiver_point == -1:
+            if warn:
+                LOGGER.warning(
+                    "Receiver point (stationID) is using invalid "
+                    "default value -1. Using 1 instead.")
+            receiver_point = 1
+        das = "{0}X{1}".format(line_number, receiver_point)
+        # das = sd.id_number
+
+    return das
+
+
+def get_node(sd):
+    #   Return node part number, node id, and number of channels
+    pn = None  # Part Number
+    id = None  # Node ID
+    nc = None  # Number of channel sets
+    try:
+        nc = sd.reel_headers.general_header_blocks[0][
+            'chan_sets_per_scan']
+        id = sd.id_number
+        if sd.manufacturer == 'FairfieldNodal':
+            pn = sd.reel_headers.extended_headers[0]['part_number']
+    except Exception:
+        pass
+    return pn, id, nc
+
+
+def combine_traces(traces):
+    '''   Join the traces of the first channel set.
+          Returns the headers of the first trace, the combined trace and
+          the traces of other channel sets.
+    '''
+    thl = []
+    chan_set = None
+    t = []
+    new_traces = []
+    # Need to check for gaps here!
+    for T in traces:
+        thl.append(T.headers)
+        if chan_set is None:
+            chan_set = T.headers.trace_header.channel_set
+        if chan_set == T.headers.trace_header.channel_set:
+            t.append(T.trace)
+        else:
+            new_traces.append(T)
+
+    return thl[0], segdreader.join_traces(t), new_traces
+
+
+def iter_traces(sd):
+    '''   Read the traces of an open reader, yield SegD_Trace for each
+          APPEND traces, or each trace if EVERY is set.
+    '''
+    nleft = APPEND
+    traces = []
+    das = None
+    lat = None
+    lon = None
+    n = 0
+    trace_index = 0
+    while True:
+        if sd.isEOF():
+            if n != 0:
+                th, t, traces = combine_traces(traces)
+                yield SegD_Trace(SegD_Info(sd), th, t, das, lat, lon)
+            break
+
+        try:
+            trace, cs = sd.process_trace(trace_index)
+            trace_index += 1
+        except segdreader.InputsError as e:
+            LOGGER.error("{0}\n".format(sd.infile))
+            LOGGER.error(
+                "Possible bad SEG-D file -- {0}".format(
+                    "".join(e.message)))
+            break
+
+        if not lat and not lon:
+            lat, lon = get_latlon(sd.manufacturer, sd.trace_headers)
+
+        traces.append(Trace(trace, sd.trace_headers))
+        if n == 0:
+            n = 1
+            das = get_das(sd)
+
+        if n >= nleft or EVERY is True:
+            th, t, traces = combine_traces(traces)
+            yield SegD_Trace(SegD_Info(sd), th, t, das, lat, lon)
+            if traces:
+                nleft = APPEND - len(traces)
+            else:
+                nleft = APPEND
+            n = 0
+            continue
+
+        n += 1
+
+
+def read_segd(f):
+    '''   Open SEG-D file f and read its headers.
+          Returns a SegD_File, its traces are read as they are iterated,
+          or None if the file can't be read. Nothing is written to PH5 so
+          this can run in a worker process.
+    '''
+    try:
+        size = os.path.getsize(f)
+    except Exception as e:
+        LOGGER.error("Failed to read {0}, {1}.\
+         Skipping...\n".format(f, str(e.message)))
+        return None
+    try:
+        segd_reader = get_segdreader(f, MANUFACTURERS_CODE)
+    except Exception:
+        return None
+    sd = segd_reader.Reader(infile=f, use_mmap=True)
+
+    try:
+        sd.process_general_headers()
+        sd.process_channel_set_descriptors()
+        sd.process_extended_headers()
+        sd.process_external_headers()
+        if sd.manufacturer == 'SmartSolo':
+            sd.process_trace_headers()
+    except segdreader.InputsError as e:
+        LOGGER.error(
+            "Possible bad SEG-D file -- {0}".format(
+                "".join(e.message)))
+        return None
+
+    das = get_das(sd, warn=True)
+    part_number, node_id, number_of_channels = get_node(sd)
+
+    return SegD_File(f, sd.name(), size, das, part_number, node_id,
+                     number_of_channels, iter_traces(sd))
+
+
+def _read_segd(f):
+    '''   read_segd in a worker process, all traces are read   '''
+    segd = read_segd(f)
+    if segd is not None:
+        segd.traces = list(segd.traces)
+
+    return segd
+
+
+def read_pool(files, processes):
+    '''   Read files with a pool of worker processes.
+          Yields what read_segd returns, in the order of files.
+          At most two files per process are read ahead of the caller.
+    '''
+    pool = multiprocessing.Pool(processes=processes)
+    try:
+        pending = collections.deque()
+        files = iter(files)
+        while True:
+            for f in itertools.islice(files, 2 * processes - len(pending)):
+                pending.append(pool.apply_async(_read_segd, (f,)))
+            if not pending:
+                break
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def write_segd(segd):
+    '''   Write the traces of a SegD_File to PH5.
+          Returns 1 if the DAS can't be processed.
+    '''
+    global SD, EXREC, MINIPH5, Das, SIZE, RH, LAT, LON, F, TRACE_JSON
+
+    F = segd.filename
+    SIZE = segd.size
+    TRACE_JSON = []
+    LAT = None
+    LON = None
+    RH = False
+
+    Das = segd.das
+    if not Das.isalnum():
+        LOGGER.error(
+            "DAS %s is not alphanumeric. Can't process." % Das)
+        return 1
+    EXREC = get_current_data_only(SIZE, Das)
+    if JOURNAL is not None:
+        JOURNAL.begin(F, [EX.ph5_g_receivers.ph5_t_index,
+                          EX.ph5_g_maps.ph5_t_index])
+    LOGGER.info(":<Processing>: {0}\n".format(segd.name))
+    LOGGER.info(
+        "Processing: {0}... Size: {1}\n".format(segd.name, SIZE))
+    if EXREC.filename != MINIPH5:
+        LOGGER.info("Opened: {0}...\n".format(EXREC.filename))
+        if segd.node_id is None:
+            node_id_str = ''
+        else:
+            node_id_str = ', Node ID: %s' % segd.node_id
+        LOGGER.info(
+            "DAS: {0}{1}, PN: {2}, Channels: {3}".format(
+                Das, node_id_str, segd.part_number,
+                segd.number_of_channels))
+        MINIPH5 = EXREC.filename
+
+    for T in segd.traces:
+        SD = T.sd
+        Das = T.das
+        LAT = T.lat
+        LON = T.lon
+        process_traces(SD.reel_headers, T.headers, T.trace)
+        if DAS_INFO:
+            writeINDEX()
+
+    update_external_references()
+    if TRACE_JSON:
+        log_array, name = getLOG()
+        for line in TRACE_JSON:
+            log_array.append(line)
+
+    if JOURNAL is not None:
+        JOURNAL.done()
+    LOGGER.info(":<Finished>: {0}\n".format(F))
+
+    return 0
+
+
 def main():
     import time
     then = time.time()
-    from numpy import append as npappend
 
     def prof():
-        global RESP, INDEX_T_DAS, INDEX_T_MAP, SD, EXREC, MINIPH5, Das, SIZE,\
-            ARRAY_T, RH, LAT, LON, F, TRACE_JSON, APPEND
+        global RESP, INDEX_T_DAS, INDEX_T_MAP, MINIPH5, ARRAY_T, FILES, \
+            MINIS
 
         MINIPH5 = None
         ARRAY_T = {}
 
-        def get_das(sd, warn=False):
-            if sd.manufacturer == 'FairfieldNodal':
-                #   Return line_station or das#[-9:]
-                try:
-                    das = "{0}X{1}".format(
-                        sd.reel_headers.extended_headers[2].line_number,
-                        sd.reel_headers.extended_headers[2].receiver_point)
-                except Exception:
-                    try:
-                        das = "{0}X{1}".format(
-                            sd.reel_headers.external_header.receiver_line,
-                            sd.reel_headers.external_header.receiver_point)
-                    except Exception:
-                        das = "sn" + \
-                              str(sd.reel_headers.general_header_blocks[0].
-                                  manufactures_sn)
-                        if das == 0:
-                            das = "id" + \
-                                  str(sd.reel_headers
-                                      .extended_headers[0].id_number)[-9:]
-            elif sd.manufacturer == 'SmartSolo':
-                line_number = sd.trace_headers.line_number
-                receiver_point = sd.trace_headers.receiver_point
-                if line_number == -1:
-                    if warn:
-                        LOGGER.warning(
-                            "Line number is using invalid default value -1. "
-                            "Using 1 instead.")
-                    line_number = 1
-                if receiver_point == -1:
-                    if warn:
-                        LOGGER.warning(
-                            "Receiver point (stationID) is using invalid "
-                            "default value -1. Using 1 instead.")
-                    receiver_point = 1
-                das = "{0}X{1}".format(line_number, receiver_point)
-                # das = sd.id_number
-
-            return das
-
-        def get_node(sd):
-            #   Return node part number, node id, and number of channels
-            pn = None  # Part Number
-            id = None  # Node ID
-            nc = None  # Number of channel sets
-            try:
-                nc = sd.reel_headers.general_header_blocks[0][
-                    'chan_sets_per_scan']
-                id = sd.id_number
-                if sd.manufacturer == 'FairfieldNodal':
-                    pn = sd.reel_headers.extended_headers[0]['part_number']
-            except Exception:
-                pass
-            return pn, id, nc
-
         try:
             get_args()
         except Exception as err_msg:
             LOGGER.error(err_msg)
             return 1
 
+        if JOURNAL is not None:
+            JOURNAL.rollback()
+            FILES = JOURNAL.not_ingested(FILES)
+
         initializeExperiment()
         LOGGER.info("segd2ph5 {0}".format(PROG_VERSION))
         LOGGER.info("{0}".format(sys.argv))
@@ -1202,157 +1479,24 @@ def main():
             RESP = Resp(EX.ph5_g_responses)
             rows, keys = EX.ph5_g_receivers.read_index()
             INDEX_T_DAS = Rows_Keys(rows, keys)
+            MINIS = miniallocator.MiniAllocator(
+                '.', FIRST_MINI, NUM_MINI, MAX_PH5_BYTES)
+            MINIS.index(rows)
+            DASES.clear()
             rows, keys = EX.ph5_g_maps.read_index()
             INDEX_T_MAP = Rows_Keys(rows, keys)
 
-        for f in FILES:
-            F = f
-            traces = []
-            TRACE_JSON = []
-            try:
-                SIZE = os.path.getsize(f)
-            except Exception as e:
-                LOGGER.error("Failed to read {0}, {1}.\
-                 Skipping...\n".format(f, str(e.message)))
-                continue
-            try:
-                segd_reader = get_segdreader(f, MANUFACTURERS_CODE)
-            except Exception:
-                continue
-            SD = segd_reader.Reader(infile=f)
-            LAT = None
-            LON = None
-            RH = False
-
-            try:
-                SD.process_general_headers()
-                SD.process_channel_set_descriptors()
-                SD.process_extended_headers()
-                SD.process_external_headers()
-                if SD.manufacturer == 'SmartSolo':
-                    SD.process_trace_headers()
-            except segdreader.InputsError as e:
-                LOGGER.error(
-                    "Possible bad SEG-D file -- {0}".format(
-                        "".join(e.message)))
+        if PROCESSES > 1:
+            #   Files are read by workers, PH5 is only written here
+            segds = read_pool(FILES, PROCESSES)
+        else:
+            segds = itertools.imap(read_segd, FILES)
+        for segd in segds:
+            if segd is None:
                 continue
-
-            nleft = APPEND
-            Das = get_das(SD, warn=True)
-            if not Das.isalnum():
-                LOGGER.error(
-                    "DAS %s is not alphanumeric. Can't process." % Das)
+            if write_segd(segd):
                 return 1
-            part_number, node_id, number_of_channels = get_node(SD)
-            EXREC = get_current_data_only(SIZE, Das)
-            LOGGER.info(":<Processing>: {0}\n".format(SD.name()))
-            LOGGER.info(
-                "Processing: {0}... Size: {1}\n".format(SD.name(), SIZE))
-            if EXREC.filename != MINIPH5:
-                LOGGER.info("Opened: {0}...\n".format(EXREC.filename))
-                if node_id is None:
-                    node_id_str = ''
-                else:
-                    node_id_str = ', Node ID: %s' % node_id
-                LOGGER.info(
-                    "DAS: {0}{1}, PN: {2}, Channels: {3}".format(
-                        Das, node_id_str, part_number, number_of_channels))
-                MINIPH5 = EXREC.filename
-
-            n = 0
-            trace_index = 0
-            trace_headers_list = []
-            while True:
-                if SD.isEOF():
-                    if n != 0:
-                        thl = []
-                        chan_set = None
-                        t = None
-                        new_traces = []
-                        for T in traces:
-                            thl.append(T.headers)
-                            if chan_set is None:
-                                chan_set = T.headers.trace_header.channel_set
-                            if chan_set == T.headers.trace_header.channel_set:
-                                if isinstance(t, type(None)):
-                                    t = T.trace
-                                else:
-                                    t = npappend(t, T.trace)
-                            else:
-                                new_traces.append(T)
-
-                        traces = new_traces
-                        process_traces(SD.reel_headers, thl[0], t)
-                        if DAS_INFO:
-                            writeINDEX()
-                    break
 
-                try:
-                    trace, cs = SD.process_trace(trace_index)
-                    trace_index += 1
-                except segdreader.InputsError as e:
-                    LOGGER.error("{0}\n".format(F))
-                    LOGGER.error(
-                        "Possible bad SEG-D file -- {0}".format(
-                            "".join(e.message)))
-                    break
-
-                if not LAT and not LON:
-                    LAT, LON = get_latlon(SD.manufacturer, SD.trace_headers)
-
-                trace_headers_list.append(SD.trace_headers)
-                if n == 0:
-                    traces.append(Trace(trace, SD.trace_headers))
-                    n = 1
-                    Das = get_das(SD)
-                else:
-                    traces.append(Trace(trace, SD.trace_headers))
-
-                if n >= nleft or EVERY is True:
-                    thl = []
-                    chan_set = None
-                    chan_set_next = None
-                    t = None
-                    new_traces = []
-                    # Need to check for gaps here!
-                    for T in traces:
-                        thl.append(T.headers)
-                        if chan_set is None:
-                            chan_set = T.headers.trace_header.channel_set
-                        if chan_set == T.headers.trace_header.channel_set:
-                            if isinstance(t, type(None)):
-                                t = T.trace
-                            else:
-                                t = npappend(t, T.trace)
-                        else:
-                            new_traces.append(T)
-                            if chan_set_next is None:
-                                chan_set_next =\
-                                    T.headers.trace_header.channel_set
-
-                    traces = new_traces
-                    process_traces(SD.reel_headers, thl[0], t)
-                    if new_traces:
-                        nleft = APPEND - len(new_traces)
-                    else:
-                        nleft = APPEND
-                    chan_set = chan_set_next
-                    chan_set_next = None
-                    if DAS_INFO:
-                        writeINDEX()
-                    n = 0
-                    trace_headers_list = []
-                    continue
-
-                n += 1
-
-            update_external_references()
-            if TRACE_JSON:
-                log_array, name = getLOG()
-                for line in TRACE_JSON:
-                    log_array.append(line)
-
-            LOGGER.info(":<Finished>: {0}\n".format(F))
         write_arrays(ARRAY_T)
         seconds = time.time() - then
 
@@ -1361,6 +1505,10 @@ def main():
             EXREC.ph5close()
         except Exception as e:
             LOGGER.warning("{0}\n".format("".join(e.message)))
+        if DASES:
+            availability.refresh(EX.filename, DASES)
+        if JOURNAL is not None:
+            JOURNAL.close()
 
         LOGGER.info("Done...{0:b}".format(int(seconds / 6.)))
         logging.shutdown()
@@ -0,0 +1,80 @@
+'''
+Tests for 1302ph5
+'''
+import os
+import sys
+import shutil
+import unittest
+import importlib
+
+from mock import patch
+
+from ph5.core.tests.test_base import LogTestCase, TempDirTestCase,\
+    initialize_ex
+
+rt130toph5 = importlib.import_module('ph5.utilities.1302ph5')
+
+
+class TestRT130toPH5_main(TempDirTestCase, LogTestCase):
+    def tearDown(self):
+        self.EX.ph5close()
+        super(TestRT130toPH5_main, self).tearDown()
+
+    def test_main_processes(self):
+        # files decoded by worker processes give the same PH5 as decoded
+        # in order
+        rt130 = os.path.join(self.home,
+                             'ph5/test_data/rt130/2016139.9EEF.ZIP')
+        tables = {}
+        for d, processes in (('serial', '1'), ('pool', '2')):
+            os.mkdir(d)
+            os.chdir(d)
+            self.EX = initialize_ex('master.ph5', '.', True)
+            self.EX.ph5close()
+            # each file name is a different DAS, the data is of 9EEF
+            names = ['2016139.{0}.ZIP'.format(das)
+                     for das in ('9EEF', '9EE1', '9EE2')]
+            for name in names:
+                shutil.copy(rt130, name)
+            with open('rt130_list', 'w') as list_file:
+                list_file.write("".join(n + "\n" for n in names))
+            testargs = ['1302ph5', '-n', 'master', '-f', 'rt130_list',
+                        '-M', '2', '--processes', processes]
+            with patch.object(sys, 'argv', testargs):
+                rt130toph5.main()
+            rt130toph5.closePH5()
+
+            self.EX = initialize_ex('master.ph5', '.', False)
+            receivers = self.EX.ph5_g_receivers
+            das_t = {}
+            for das in sorted(receivers.alldas_g()):
+                receivers.setcurrent(receivers.getdas_g(das[6:]))
+                rows, keys = receivers.read_das()
+                das_t[das] = rows
+                das_t[das + 'data'] = [
+                    receivers.read_trace(
+                        receivers.find_trace_ref(
+                            r['array_name_data_a'])).tolist()
+                    for r in rows]
+                das_t[das + 'log'] = [
+                    receivers.current_g_das._f_get_child(n).read().tolist()
+                    for n in sorted(receivers.current_g_das._v_children)
+                    if n.startswith('SOH_a_') or n.startswith('Log_a_')]
+            rows, keys = receivers.read_index()
+            tables[d] = (das_t, [(r['serial_number_s'],
+                                  r['external_file_name_s'],
+                                  r['start_time/epoch_l'])
+                                 for r in rows])
+            self.EX.ph5close()
+            os.chdir('..')
+
+        self.assertEqual(['Das_g_9EEF', 'Das_g_9EEFdata', 'Das_g_9EEFlog'],
+                         sorted(tables['pool'][0].keys()))
+        # two of the files are in miniPH5_00001.ph5 with -M 2
+        self.assertEqual(6, len(tables['pool'][0]['Das_g_9EEF']))
+        self.assertTrue(tables['pool'][0]['Das_g_9EEFlog'])
+        self.assertEqual(tables['serial'], tables['pool'])
+
+
+if __name__ == "__main__":
+    unittest.main()
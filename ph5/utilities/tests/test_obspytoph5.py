@@ -3,6 +3,7 @@ Tests for obspytoph5
 '''
 import os
 import sys
+import shutil
 import unittest
 import numpy
 
@@ -111,6 +112,73 @@ class TestObspytoPH5_main(TempDirTestCase, LogTestCase):
         self.assertEqual('../miniseed/0407HHN.ms',
                          ret[0]['raw_file_name_s'])
 
+    def test_main_processes(self):
+        # files read by worker processes give the same PH5 as read in
+        # order
+        self.ph5_object = initialize_ex('master.ph5', '.', False)
+        self.ph5_object.ph5close()
+        os.mkdir('serial')
+        os.rename('master.ph5', 'serial/master.ph5')
+        os.mkdir('pool')
+        shutil.copy('serial/master.ph5', 'pool/master.ph5')
+        tables = {}
+        for d, processes in (('serial', '1'), ('pool', '2')):
+            os.chdir(d)
+            # need to use relative path '../../miniseed/' because das_t's
+            # 'raw_file_name_s will be chopped off if the path's length is
+            # greater than 32
+            testargs = ['obspytoph5', '-n', 'master.ph5', '-d',
+                        '../../miniseed/', '--processes', processes]
+            with patch.object(sys, 'argv', testargs):
+                obspytoph5.main()
+
+            self.ph5_object = initialize_ex('master.ph5', '.', False)
+            receivers = self.ph5_object.ph5_g_receivers
+            receivers.setcurrent(receivers.getdas_g('5553'))
+            rows, keys = receivers.read_das()
+            data = [receivers.read_trace(
+                        receivers.find_trace_ref(
+                            r['array_name_data_a'])).tolist()
+                    for r in rows]
+            index_t, keys = receivers.read_index()
+            tables[d] = (rows, data,
+                         [(r['external_file_name_s'],
+                           r['start_time/epoch_l'],
+                           r['end_time/epoch_l']) for r in index_t])
+            self.ph5_object.ph5close()
+            os.chdir('..')
+
+        self.assertEqual(3, len(tables['pool'][0]))
+        self.assertEqual(tables['serial'], tables['pool'])
+
+        with OutputCapture():
+            with self.assertRaises(SystemExit):
+                obspytoph5.get_args(['-n', 'master.ph5', '--processes',
+                                     'two'])
+
+    def test_main_journal(self):
+        # files in the ingestion journal are not loaded again
+        testargs = ['obspytoph5', '-n', 'master.ph5', '-d',
+                    '../miniseed/', '--journal']
+        tables = []
+        for i in range(2):
+            with patch.object(sys, 'argv', testargs):
+                obspytoph5.main()
+
+            self.ph5_object = initialize_ex('master.ph5', '.', False)
+            receivers = self.ph5_object.ph5_g_receivers
+            receivers.setcurrent(receivers.getdas_g('5553'))
+            rows, keys = receivers.read_das()
+            index_t, keys = receivers.read_index()
+            time_t, keys = receivers.read_time()
+            tables.append((rows, index_t, time_t))
+            self.ph5_object.ph5close()
+
+        self.assertEqual(3, len(tables[0][0]))
+        self.assertEqual(3, len(tables[0][1]))
+        self.assertEqual(tables[0], tables[1])
+        self.assertTrue(os.path.isfile('ph5_journal.json'))
+
 
 class TestObspytoPH5(TempDirTestCase, LogTestCase):
     def setUp(self):
@@ -138,6 +206,8 @@ class TestObspytoPH5(TempDirTestCase, LogTestCase):
         self.assertEqual(ret.rawfile, 'test.ms')
         self.assertEqual(ret.ph5path, '.')
         self.assertTrue(ret.verbose)
+        self.assertEqual(1, ret.processes)
+        self.assertFalse(ret.journal)
 
     def test_to_ph5(self):
         index_t_full = list()
@@ -181,6 +251,10 @@ class TestObspytoPH5(TempDirTestCase, LogTestCase):
         self.obs.update_external_references(index_t_full)
         self.assertTrue(os.path.isfile("master.ph5"))
         self.assertTrue(os.path.isfile("miniPH5_00001.ph5"))
+        self.assertEqual({'5553': 1}, self.obs.minis.das_minis)
+        # a new loader keeps the DAS in its mini
+        obs = obspytoph5.ObspytoPH5(self.ph5_object, self.tmpdir, 2, 1)
+        self.assertEqual('miniPH5_00001', obs.minis.allocate('5553'))
 
         node = self.obs.ph5.ph5_g_receivers.getdas_g('5553')
         self.obs.ph5.ph5_g_receivers.setcurrent(node)
@@ -5,6 +5,7 @@ import os
 import sys
 import unittest
 import logging
+import numpy
 
 from mock import patch
 from testfixtures import LogCapture
@@ -60,6 +61,41 @@ class TestSegDtoPH5_main(TempDirTestCase, LogTestCase):
         self.assertDictEqual(time_count,
                              {1561831393: 3, 1563634018: 3, 1567269236: 3})
 
+    def test_main_processes(self):
+        # files read by worker processes give the same PH5 as read in order
+        segd_dir = os.path.join(self.home, "ph5/test_data/segd/fairfield/")
+        fileList = sorted(f for f in os.listdir(segd_dir)
+                          if f.endswith(".fcnt"))
+        tables = {}
+        for d, processes in (('serial', '1'), ('pool', '2')):
+            os.mkdir(d)
+            os.chdir(d)
+            with open('fcnt_list', "w") as list_file:
+                list_file.write("".join(segd_dir + f + "\n"
+                                        for f in fileList))
+            testargs = ['segdtoph5', '-n', 'master', '-f', 'fcnt_list',
+                        '--processes', processes]
+            with patch.object(sys, 'argv', testargs):
+                segd2ph5.main()
+            self.EX = initialize_ex('master.ph5', '.', False)
+            das_t = {}
+            for das in sorted(self.EX.ph5_g_receivers.alldas_g()):
+                self.EX.ph5_g_receivers.setcurrent(
+                    self.EX.ph5_g_receivers.getdas_g(das[6:]))
+                rows, keys = self.EX.ph5_g_receivers.read_das()
+                das_t[das] = rows
+                data = [self.EX.ph5_g_receivers.read_trace(
+                    self.EX.ph5_g_receivers.find_trace_ref(
+                        r['array_name_data_a'])).tolist() for r in rows]
+                das_t[das + 'data'] = data
+            rows, keys = self.EX.ph5_g_sorts.read_arrays('Array_t_001')
+            tables[d] = (das_t, rows)
+            self.EX.ph5close()
+            os.chdir('..')
+
+        self.assertEqual(4, len(tables['pool'][0]))
+        self.assertEqual(tables['serial'], tables['pool'])
+
 
 class TestSegDtoPH5(TempDirTestCase, LogTestCase):
     def setUp(self):
@@ -91,6 +127,80 @@ class TestSegDtoPH5(TempDirTestCase, LogTestCase):
         self.assertAlmostEqual(LSB24, segd2ph5.LSB_MAP[24], places=6)
         self.assertAlmostEqual(LSB36, segd2ph5.LSB_MAP[36], places=6)
 
+    def test_trace_header_batch(self):
+        # trace headers decoded in batches are the same as parsed one
+        # trace at a time
+        def read_traces(path, batch):
+            SD = segd2ph5.get_segdreader(path, None).Reader(infile=path)
+            SD.process_general_headers()
+            SD.process_channel_set_descriptors()
+            SD.process_extended_headers()
+            SD.process_external_headers()
+            SD.trace_header_batch = batch
+            if SD.manufacturer == 'SmartSolo':
+                SD.process_trace_headers()
+            ret = []
+            i = 0
+            while not SD.isEOF():
+                trace, cs = SD.process_trace(i)
+                i += 1
+                th = SD.trace_headers
+                ret.append(([th.trace_header] + th.trace_header_N,
+                            [getattr(th, k) for k in th.__slots__],
+                            trace.tolist(), cs, SD.samples, SD.bytes_read,
+                            SD.pickup_epoch, SD.id_number))
+            SD.FH.close()
+            return ret
+
+        for f in ('fairfield/3ch.fcnt',
+                  'smartsolo/453005483.1.2021.03.15.16.00.00.000.E.segd'):
+            path = os.path.join(self.home, 'ph5/test_data/segd', f)
+            one = read_traces(path, 1)
+            self.assertTrue(len(one) > 1)
+            self.assertEqual(one, read_traces(path, 1024))
+            self.assertEqual(one, read_traces(path, 2))
+
+    def test_join_traces(self):
+        # traces read through a memory map are views in file byte order,
+        # each channel set is joined to the same array as read from file
+        def read_traces(path, use_mmap):
+            SD = segd2ph5.get_segdreader(path, None).Reader(
+                infile=path, use_mmap=use_mmap)
+            SD.process_general_headers()
+            SD.process_channel_set_descriptors()
+            SD.process_extended_headers()
+            SD.process_external_headers()
+            if SD.manufacturer == 'SmartSolo':
+                SD.process_trace_headers()
+            ret = {}
+            i = 0
+            while not SD.isEOF():
+                trace, cs = SD.process_trace(i)
+                i += 1
+                ret.setdefault(cs, []).append(trace)
+            return ret
+
+        for f in ('fairfield/3ch.fcnt',
+                  'smartsolo/453005483.1.2021.03.15.16.00.00.000.E.segd'):
+            path = os.path.join(self.home, 'ph5/test_data/segd', f)
+            traces = read_traces(path, False)
+            views = read_traces(path, True)
+            self.assertEqual(sorted(traces.keys()), sorted(views.keys()))
+            for cs in traces:
+                self.assertEqual(views[cs][0].dtype.byteorder, '>')
+                self.assertFalse(views[cs][0].flags.owndata)
+                expected = numpy.concatenate(traces[cs])
+                # strided, single and mixed traces
+                for t in (traces[cs], views[cs], views[cs][:1],
+                          views[cs][::2] + traces[cs][1:2]):
+                    joined = segdreader.join_traces(t)
+                    self.assertEqual(joined.dtype, numpy.float32)
+                    self.assertTrue(joined.dtype.isnative)
+                    self.assertTrue(numpy.array_equal(
+                        joined, numpy.concatenate(t).astype(numpy.float32)))
+                self.assertTrue(numpy.array_equal(
+                    segdreader.join_traces(views[cs]), expected))
+
     def test_write_arrays(self):
         # same das, different deploy times
         arrays = \
@@ -0,0 +1,109 @@
+'''
+Tests for texan2ph5
+'''
+import os
+import sys
+import unittest
+
+from mock import patch
+
+from ph5.core import pn125
+from ph5.utilities import texan2ph5
+from ph5.core.tests.test_base import LogTestCase, TempDirTestCase,\
+    initialize_ex
+
+
+class TestTexantoPH5(TempDirTestCase, LogTestCase):
+    def setUp(self):
+        super(TestTexantoPH5, self).setUp()
+        self.trd = os.path.join(self.home,
+                                'ph5/test_data/rt125a/I2183RAW.TRD')
+
+    def tearDown(self):
+        try:
+            self.EX.ph5close()
+        except AttributeError:
+            pass
+        super(TestTexantoPH5, self).tearDown()
+
+    def read_events(self):
+        # events as getEvent reads them a page at a time
+        pn = pn125.pn125(self.trd)
+        events = []
+        while pn.getEvent():
+            events.append((pn.trace.event, pn.trace.year, pn.trace.doy,
+                           pn.trace.sampleRate, pn.trace.gain, pn.trace.fsd,
+                           pn.page.unitID, list(pn.trace.trace)))
+        return events, pn
+
+    def test_getEvents(self):
+        # all pages decoded at once give the same events, SOH and event
+        # table as reading them a page at a time
+        events, pn = self.read_events()
+        new = pn125.pn125(self.trd)
+        self.assertEqual(events,
+                         [(t.event, t.year, t.doy, t.sampleRate, t.gain,
+                           t.fsd, p.unitID, t.trace.tolist())
+                          for t, p in new.getEvents()])
+        self.assertEqual(9, len(events))
+        self.assertEqual([e.message for e in pn.sohbuf],
+                         [e.message for e in new.sohbuf])
+        self.assertEqual([(e.action, e.parameter) for e in pn.eventTable],
+                         [(e.action, e.parameter) for e in new.eventTable])
+
+    def test_main(self):
+        self.EX = initialize_ex('master.ph5', '.', True)
+        self.EX.ph5close()
+        testargs = ['texan2ph5', '-n', 'master', '-r', self.trd]
+        with patch.object(sys, 'argv', testargs):
+            texan2ph5.main()
+
+        events, pn = self.read_events()
+        self.EX = initialize_ex('master.ph5', '.', False)
+        receivers = self.EX.ph5_g_receivers
+        receivers.setcurrent(receivers.getdas_g('12183'))
+        rows, keys = receivers.read_das()
+        self.assertEqual(len(events), len(rows))
+        for i, (r, e) in enumerate(zip(rows, events)):
+            self.assertEqual('Data_a_{0:04d}'.format(i + 1),
+                             r['array_name_data_a'])
+            self.assertEqual('SOH_a_{0:04d}'.format(i + 1),
+                             r['array_name_SOH_a'])
+            self.assertEqual(e[0], r['event_number_i'])
+            self.assertEqual(len(e[-1]), r['sample_count_i'])
+            self.assertEqual(500, r['sample_rate_i'])
+            self.assertEqual(
+                e[-1],
+                receivers.read_trace(
+                    receivers.find_trace_ref(
+                        r['array_name_data_a'])).tolist())
+        self.assertEqual(1550849943, rows[0]['time/epoch_l'])
+        rows, keys = receivers.read_index()
+        self.assertEqual(['12183'], [r['serial_number_s'] for r in rows])
+
+    def test_main_storage(self):
+        # Data_a arrays are chunked and compressed as the options ask
+        self.EX = initialize_ex('master.ph5', '.', True)
+        self.EX.ph5close()
+        testargs = ['texan2ph5', '-n', 'master', '-r', self.trd,
+                    '--chunk', '2s', '--complib', 'blosc:zstd',
+                    '--complevel', '3']
+        with patch.object(sys, 'argv', testargs):
+            texan2ph5.main()
+
+        events, pn = self.read_events()
+        self.EX = initialize_ex('master.ph5', '.', False)
+        receivers = self.EX.ph5_g_receivers
+        receivers.setcurrent(receivers.getdas_g('12183'))
+        rows, keys = receivers.read_das()
+        self.assertEqual(len(events), len(rows))
+        for r, e in zip(rows, events):
+            a = receivers.find_trace_ref(r['array_name_data_a'])
+            self.assertEqual((1000,), a.chunkshape)
+            self.assertEqual('blosc:zstd', a.filters.complib)
+            self.assertEqual(3, a.filters.complevel)
+            self.assertEqual(e[-1], receivers.read_trace(a).tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()
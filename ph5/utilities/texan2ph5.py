@@ -7,6 +7,7 @@
 #
 
 import argparse
+import itertools
 import logging
 import math
 import os
@@ -16,20 +17,28 @@ import string
 import sys
 import time
 from ph5 import LOGGING_FORMAT
-from ph5.core import columns, experiment, kef, pn125, timedoy
+from ph5.core import availability, columns, experiment, journal, kef, \
+    miniallocator, pn125, timedoy
 
 PROG_VERSION = '2019.14'
 LOGGER = logging.getLogger(__name__)
 
 MAX_PH5_BYTES = 1073741824 * 2  # GB (1024 X 1024 X 1024 X 2)
 INDEX_T = None
+# Mini file of each DAS, miniallocator.MiniAllocator
+MINIS = None
+# DASes written to, their Availability_t rows are refreshed
+DASES = set()
 
 TRDfileRE = re.compile(r".*[Ii](\d\d\d\d)[Rr][Aa][Ww].*")
 TRDfileREpunt = re.compile(r".*(\d\d\d\d).*[Tt][Rr][Dd]$")
-miniPH5RE = re.compile(r".*miniPH5_(\d\d\d\d\d)\.ph5")
 
 CURRENT_DAS = None
 DAS_INFO = {}
+# Ingestion journal, set with --journal
+JOURNAL = None
+# Chunks and compression of Data_a arrays, experiment.DataStorage
+DATA_STORAGE = None
 # Current raw file processing
 F = None
 
@@ -163,8 +172,10 @@ def get_args():
            -p   print out table list
            -M   create a specific number of miniPH5 files
            -S   First index of miniPH5_xxxxx.ph5
+           --journal   keep an ingestion journal
     '''
-    global FILES, PH5, SR, WINDOWS, OVERIDE, NUM_MINI, FIRST_MINI
+    global FILES, PH5, SR, WINDOWS, OVERIDE, NUM_MINI, FIRST_MINI, JOURNAL, \
+        DATA_STORAGE
 
     parser = argparse.ArgumentParser(
                                 formatter_class=argparse.RawTextHelpFormatter)
@@ -214,8 +225,40 @@ def get_args():
                         dest="doprint",
                         action="store_true",
                         default=False)
+    parser.add_argument("--journal",
+                        help=("Keep an ingestion journal, skip files "
+                              "already in PH5 and roll back files left "
+                              "partly written."),
+                        action="store_true", default=False)
+    parser.add_argument("--chunk",
+                        help=("Samples in a chunk of the Data_a arrays, or "
+                              "seconds with an s suffix. "
+                              "Ex: --chunk 4096 or --chunk 10s"),
+                        metavar="chunk", default=None)
+    parser.add_argument("--complib",
+                        help=("Compression library of the Data_a arrays, "
+                              "zlib, lzo, bzip2, blosc or blosc:[blosclz, "
+                              "lz4, lz4hc, snappy, zlib, zstd]. "
+                              "Default: zlib"),
+                        metavar="complib", default='zlib')
+    parser.add_argument("--complevel",
+                        help=("Compression level of the Data_a arrays, "
+                              "0 to 9. Default: 6"),
+                        metavar="complevel", type=int,
+                        default=experiment.ZLIBCOMP)
+    parser.add_argument("--no_shuffle",
+                        help="Don't shuffle the bytes of the Data_a arrays.",
+                        action="store_true", default=False)
     args = parser.parse_args()
 
+    try:
+        DATA_STORAGE = experiment.DataStorage.from_chunk(
+            args.chunk, complib=args.complib, complevel=args.complevel,
+            shuffle=not args.no_shuffle)
+    except ValueError as e:
+        LOGGER.error(e)
+        sys.exit()
+
     FILES = []
     PH5 = None
     OVERIDE = args.overide
@@ -262,6 +305,9 @@ def get_args():
         ch.setFormatter(formatter)
         LOGGER.addHandler(ch)
 
+    if args.journal:
+        JOURNAL = journal.Journal('.')
+
 
 def print_it(a):
     for k in a:
@@ -424,35 +470,10 @@ def update_index_t_info(starttime, samples, sps):
                         time.ctime(stoptime)))
 
 
-def writeEvent(trace, page):
-    global EX, EXREC, RESP, SR
+def das_t_row(trace, n_i):
+    '''   Das_t row of an event without the array names   '''
     p_das_t = {}
-    p_response_t = {}
-
-    if SR is not None:
-        if trace.sampleRate != int(SR):
-            return
-
-    das_number = str(page.unitID)
-
-    # The gain and bit weight
-    p_response_t['gain/value_i'] = trace.gain
-    p_response_t['bit_weight/units_s'] = 'volts/count'
-    p_response_t['bit_weight/value_d'] = 10.0 / trace.gain / trace.fsd
-
-    n_i = RESP.match(
-        p_response_t['bit_weight/value_d'], p_response_t['gain/value_i'])
-    if n_i < 0:
-        n_i = RESP.next_i()
-        p_response_t['n_i'] = n_i
-        EX.ph5_g_responses.populateResponse_t(p_response_t)
-        RESP.update()
-
-    # Check to see if group exists for this das, if not build it
-    das_g, das_t, receiver_t, time_t = EXREC.ph5_g_receivers.newdas(das_number)
-    # Fill in das_t
     p_das_t['raw_file_name_s'] = os.path.basename(F)
-    p_das_t['array_name_SOH_a'] = EXREC.ph5_g_receivers.nextarray('SOH_a_')
     p_das_t['response_table_n_i'] = n_i
     p_das_t['channel_number_i'] = trace.channel_number
     p_das_t['event_number_i'] = trace.event
@@ -477,20 +498,78 @@ def writeEvent(trace, page):
     p_das_t['time/type_s'] = 'BOTH'
     # XXX   Should this get set????   XXX
     p_das_t['time/micro_seconds_i'] = 0
-    # XXX   Need to check if array name exists and generate unique name.   XXX
-    p_das_t['array_name_data_a'] = EXREC.ph5_g_receivers.nextarray('Data_a_')
-    des = "Epoch: " + str(p_das_t['time/epoch_l']) + \
-        " Channel: " + str(trace.channel_number)
-    # XXX   This should be changed to handle exceptions   XXX
-    EXREC.ph5_g_receivers.populateDas_t(p_das_t)
-    # Write out array data (it would be nice if we had int24) we use int32!
-    EXREC.ph5_g_receivers.newarray(
-        p_das_t['array_name_data_a'],
-        trace.trace, dtype='int32', description=des)
-    update_index_t_info(p_das_t['time/epoch_l'] +
-                        (float(p_das_t['time/micro_seconds_i']) / 1000000.),
-                        p_das_t['sample_count_i'], p_das_t['sample_rate_i'] /
-                        p_das_t['sample_rate_multiplier_i'])
+
+    return p_das_t
+
+
+def response_n_i(trace):
+    '''   Return n_i of the response of the trace, add it to Response_t
+          if it is new
+    '''
+    p_response_t = {}
+    # The gain and bit weight
+    p_response_t['gain/value_i'] = trace.gain
+    p_response_t['bit_weight/units_s'] = 'volts/count'
+    p_response_t['bit_weight/value_d'] = 10.0 / trace.gain / trace.fsd
+
+    n_i = RESP.match(
+        p_response_t['bit_weight/value_d'], p_response_t['gain/value_i'])
+    if n_i < 0:
+        n_i = RESP.next_i()
+        p_response_t['n_i'] = n_i
+        EX.ph5_g_responses.populateResponse_t(p_response_t)
+        RESP.update()
+
+    return n_i
+
+
+def writeEvents(events):
+    '''   Write a list of (trace, page) events. The events of each das
+          are written as one batch of arrays and one Das_t append.
+    '''
+    global EX, EXREC, RESP, SR
+
+    if SR is not None:
+        events = [(trace, page) for trace, page in events
+                  if trace.sampleRate == int(SR)]
+
+    for das_number, das_events in itertools.groupby(
+            events, lambda e: str(e[1].unitID)):
+        das_events = [(trace, response_n_i(trace))
+                      for trace, page in das_events]
+        # Check to see if group exists for this das, if not build it
+        das_g, das_t, receiver_t, time_t = \
+            EXREC.ph5_g_receivers.newdas(das_number)
+        DASES.add(str(das_number))
+        if JOURNAL is not None:
+            JOURNAL.das(EXREC.ph5_g_receivers)
+        rows = []
+        arrays = []
+        for trace, n_i in das_events:
+            p_das_t = das_t_row(trace, n_i)
+            p_das_t['array_name_SOH_a'] = \
+                EXREC.ph5_g_receivers.nextarray('SOH_a_')
+            # XXX   Need to check if array name exists and generate unique
+            # name.   XXX
+            p_das_t['array_name_data_a'] = \
+                EXREC.ph5_g_receivers.nextarray('Data_a_')
+            des = "Epoch: " + str(p_das_t['time/epoch_l']) + \
+                " Channel: " + str(trace.channel_number)
+            rows.append(p_das_t)
+            # Write out array data (it would be nice if we had int24) we
+            # use int32!
+            arrays.append((p_das_t['array_name_data_a'], trace.trace, des,
+                           trace.sampleRate))
+
+        EXREC.ph5_g_receivers.newarrays(arrays, dtype='int32')
+        # XXX   This should be changed to handle exceptions   XXX
+        EXREC.ph5_g_receivers.populateDas_t(rows)
+        for p_das_t in rows:
+            update_index_t_info(
+                p_das_t['time/epoch_l'] +
+                (float(p_das_t['time/micro_seconds_i']) / 1000000.),
+                p_das_t['sample_count_i'], p_das_t['sample_rate_i'] /
+                p_das_t['sample_rate_multiplier_i'])
 
 
 def writeSOH(soh):
@@ -535,6 +614,7 @@ def writeET(et):
 def openPH5(filename):
     LOGGER.info("Opening: {0}".format(filename))
     exrec = experiment.ExperimentGroup(nickname=filename)
+    exrec.data_storage = DATA_STORAGE
     exrec.ph5open(True)
     exrec.initgroup()
     return exrec
@@ -544,55 +624,7 @@ def get_current_data_only(size_of_data, das=None):
     '''   Return opened file handle for data only PH5 file that will be
           less than MAX_PH5_BYTES after raw data is added to it.
     '''
-    def sstripp(s):
-        s = s.replace('.ph5', '')
-        s = s.replace('./', '')
-        return s
-
-    def smallest():
-        '''   Return the name of the smallest miniPH5_xxxxx.ph5   '''
-        minifiles = filter(miniPH5RE.match, os.listdir('.'))
-
-        tiny = minifiles[0]
-        for f in minifiles:
-            if os.path.getsize(f) < os.path.getsize(tiny):
-                tiny = f
-
-        return tiny
-
-    das = str(CURRENT_DAS)
-    newestfile = ''
-    # Get the most recent data only PH5 file or match DAS serialnumber
-    n = 0
-    for index_t in INDEX_T.rows:
-        # This DAS already exists in a ph5 file
-        if index_t['serial_number_s'] == das:
-            newestfile = sstripp(index_t['external_file_name_s'])
-            return openPH5(newestfile)
-        # miniPH5_xxxxx.ph5 with largest xxxxx
-        mh = miniPH5RE.match(index_t['external_file_name_s'])
-        if n < int(mh.groups()[0]):
-            newestfile = sstripp(index_t['external_file_name_s'])
-            n = int(mh.groups()[0])
-
-    if not newestfile:
-        # This is the first file added
-        return openPH5('miniPH5_{0:05d}'.format(FIRST_MINI))
-
-    size_of_exrec = os.path.getsize(newestfile + '.ph5')
-    if NUM_MINI is not None:
-        fm = FIRST_MINI - 1
-        if (int(newestfile[8:13]) - fm) < NUM_MINI:
-            newestfile = "miniPH5_{0:05d}"\
-                .format(int(newestfile[8:13]) + 1)
-        else:
-            small = sstripp(smallest())
-            return openPH5(small)
-
-    elif (size_of_data + size_of_exrec) > MAX_PH5_BYTES:
-        newestfile = "miniPH5_{0:05d}".format(int(newestfile[8:13]) + 1)
-
-    return openPH5(newestfile)
+    return openPH5(MINIS.allocate(CURRENT_DAS, size_of_data))
 
 
 def writeINDEX():
@@ -651,19 +683,17 @@ def updatePH5(f):
 
     EXREC = get_current_data_only(size_of_data)
     pn = pn125.pn125(f)
-    while True:
-        try:
-            points = pn.getEvent()
-        except pn125.TRDError as e:
-            LOGGER.error("\nTRD read error. {0}\n"
-                         ":<Error>: {1}".format(e, f))
-            break
-
-        if points == 0:
-            break
+    # All pages of the file are decoded at once
+    events = []
+    try:
+        for trace, page in pn.getEvents():
+            if window_contained(trace):
+                events.append((trace, page))
+    except pn125.TRDError as e:
+        LOGGER.error("\nTRD read error. {0}\n"
+                     ":<Error>: {1}".format(e, f))
 
-        if window_contained(pn.trace):
-            writeEvent(pn.trace, pn.page)
+    writeEvents(events)
 
     if DAS_INFO:
         writeINDEX()
@@ -713,10 +743,15 @@ def update_external_references():
 
 def main():
     def prof():
-        global PH5, KEFFILE, FILES, DEPFILE, RESP, INDEX_T, CURRENT_DAS, F
+        global PH5, KEFFILE, FILES, DEPFILE, RESP, INDEX_T, CURRENT_DAS, F, \
+            MINIS
 
         get_args()
 
+        if JOURNAL is not None:
+            JOURNAL.rollback()
+            FILES = JOURNAL.not_ingested(FILES)
+
         initializeExperiment()
         LOGGER.info("125a2ph5 {0}".format(PROG_VERSION))
         LOGGER.info("{0}".format(sys.argv))
@@ -724,6 +759,10 @@ def main():
             RESP = Resp(EX.ph5_g_responses)
             rows, keys = EX.ph5_g_receivers.read_index()
             INDEX_T = Rows_Keys(rows, keys)
+            MINIS = miniallocator.MiniAllocator(
+                '.', FIRST_MINI, NUM_MINI, MAX_PH5_BYTES)
+            MINIS.index(rows)
+            DASES.clear()
 
         for f in FILES:
             F = f
@@ -741,15 +780,24 @@ def main():
                 except BaseException:
                     CURRENT_DAS = None
 
+                if JOURNAL is not None:
+                    JOURNAL.begin(f, [EX.ph5_g_receivers.ph5_t_index])
                 updatePH5(f)
+                if JOURNAL is not None:
+                    JOURNAL.done()
             else:
                 LOGGER.error(f)
                 LOGGER.warning(
                     "Warning: Unrecognized raw file name {0}. Skipping!"
                     .format(f))
 
-        update_external_references()
+        if len(FILES) > 0:
+            update_external_references()
         closePH5()
+        if DASES:
+            availability.refresh(EX.filename, DASES)
+        if JOURNAL is not None:
+            JOURNAL.close()
         logging.shutdown()
     prof()
 